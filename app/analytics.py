@@ -0,0 +1,210 @@
+"""
+Membership analytics reports.
+
+Grouped member counts (by state, city, member type and paid-through year,
+split by expiration status) and year-over-year retention computed from the
+renewals ledger. Every report is a single GROUP BY query answered from an
+index (see database/add_analytics_indexes.sql), so none of them fetches
+member rows.
+
+Results are cached per tenant and per process. At most once every
+ANALYTICS_REFRESH_INTERVAL seconds the cache runs one version query (row
+count and latest change of members and renewals); cached results are
+reused until that version moves. Sessions that just wrote always re-check,
+like the roster snapshot.
+
+Status columns come from members.expiration_status, which the expiration
+checker maintains, so they reflect its last run.
+"""
+
+import csv
+import io
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime
+
+from db import get_db_connection, dict_cursor, session_is_sticky
+from tenants import PerTenant
+
+ANALYTICS_REFRESH_INTERVAL = float(os.getenv('ANALYTICS_REFRESH_INTERVAL', 30))
+
+STATUS_COLUMNS = (('active', 'Active'), ('expiring', 'Expiring'), ('expired', 'Expired'), ('unknown', 'Unknown'))
+
+Report = namedtuple('Report', 'name title columns rows generated_at')
+Report.__doc__ = """A computed report.
+
+columns      -- ((key, label), ...) in display order
+rows         -- list of dicts keyed by column key
+generated_at -- when the query ran (cached reports keep their original time)
+"""
+
+# name -> (title, grouping columns with labels, ORDER BY)
+BREAKDOWNS = {
+    'state': ('Members by state', (('state', 'State'),), 'members DESC, state'),
+    'city': ('Members by city', (('state', 'State'), ('city', 'City')), 'members DESC, state, city'),
+    'member_type': ('Members by type', (('member_type', 'Type'),), 'members DESC, member_type'),
+    'paid_thru': ('Members by paid-through year', (('paid_thru', 'Paid Thru'),), 'paid_thru DESC'),
+}
+
+RETENTION_COLUMNS = (
+    ('period_year', 'Year'),
+    ('members', 'Members'),
+    ('renewed', 'Renewed'),
+    ('lost', 'Lost'),
+    ('gained', 'New/Returning'),
+    ('retention', 'Retention'),
+    ('churn', 'Churn'),
+)
+
+# name -> title, in the order the admin page lists them
+REPORT_TITLES = {name: title for name, (title, _, _) in BREAKDOWNS.items()}
+REPORT_TITLES['retention'] = 'Retention and churn'
+
+# Leading characters spreadsheets would treat as a formula
+_FORMULA_PREFIXES = ('=', '+', '-', '@')
+
+
+def breakdown(cursor, name):
+    """Member counts per group, with a count per expiration status"""
+    title, groups, order = BREAKDOWNS[name]
+    group_by = ', '.join(column for column, _ in groups)
+    statuses = ', '.join(f"SUM(expiration_status = '{status}') AS {status}" for status, _ in STATUS_COLUMNS)
+    cursor.execute(f"""
+        SELECT {group_by}, COUNT(*) AS members, {statuses}
+        FROM members
+        GROUP BY {group_by}
+        ORDER BY {order}
+    """)
+    rows = cursor.fetchall()
+    counts = ('members',) + tuple(status for status, _ in STATUS_COLUMNS)
+    for row in rows:
+        for column in counts:
+            row[column] = int(row[column] or 0)
+    return Report(name, title, groups + (('members', 'Members'),) + STATUS_COLUMNS, rows, datetime.now())
+
+
+def retention(cursor, start_year, end_year):
+    """Year-over-year retention and churn from the renewals ledger.
+
+    For each membership year: members who paid for it, how many of them
+    also paid for the following year (renewed) or did not (lost), and how
+    many had not paid for the previous year (gained: new or returning
+    members). The latest year's renewals may still be coming in.
+    """
+    cursor.execute("""
+        SELECT r.period_year,
+               COUNT(*) AS members,
+               SUM(n.member_id IS NOT NULL) AS renewed,
+               SUM(p.member_id IS NULL) AS gained
+        FROM renewals r
+        LEFT JOIN renewals n ON n.member_id = r.member_id AND n.period_year = r.period_year + 1
+        LEFT JOIN renewals p ON p.member_id = r.member_id AND p.period_year = r.period_year - 1
+        WHERE r.period_year BETWEEN %s AND %s
+        GROUP BY r.period_year
+        ORDER BY r.period_year
+    """, (start_year, end_year))
+    rows = []
+    for row in cursor.fetchall():
+        members, renewed = int(row['members']), int(row['renewed'] or 0)
+        rows.append({
+            'period_year': row['period_year'],
+            'members': members,
+            'renewed': renewed,
+            'lost': members - renewed,
+            'gained': int(row['gained'] or 0),
+            'retention': renewed / members if members else None,
+            'churn': (members - renewed) / members if members else None,
+        })
+    title = f"Retention {start_year}–{end_year}"
+    return Report('retention', title, RETENTION_COLUMNS, rows, datetime.now())
+
+
+def build_report(cursor, name, years=10):
+    """Run report `name`; retention covers the last `years` membership years"""
+    if name in BREAKDOWNS:
+        return breakdown(cursor, name)
+    if name == 'retention':
+        end_year = date.today().year
+        return retention(cursor, end_year - years + 1, end_year)
+    raise KeyError(name)
+
+
+def data_version(cursor):
+    """Row counts and latest changes of members and renewals"""
+    cursor.execute("""
+        SELECT (SELECT COUNT(*) FROM members) AS members,
+               (SELECT MAX(updated_at) FROM members) AS members_updated,
+               (SELECT COUNT(*) FROM renewals) AS renewals,
+               (SELECT MAX(recorded_at) FROM renewals) AS renewals_recorded
+    """)
+    row = cursor.fetchone()
+    return (row['members'], row['members_updated'], row['renewals'], row['renewals_recorded'])
+
+
+class ReportCache:
+    """Per-process report results, dropped when the underlying tables change"""
+
+    def __init__(self, refresh_interval=ANALYTICS_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._reports = {}
+
+    def invalidate(self):
+        """Force a version check on the next report"""
+        self._checked_at = 0.0
+
+    def _due(self):
+        return time.monotonic() - self._checked_at >= self.refresh_interval or session_is_sticky()
+
+    def report(self, name, years=10):
+        """Report `name`, from the cache when the data has not changed"""
+        key = (name, years, date.today().year) if name == 'retention' else name
+        report = self._reports.get(key)
+        if report is not None and not self._due():
+            return report
+
+        # One query at a time per process; concurrent requests wait and reuse the result
+        with self._lock:
+            conn = get_db_connection(read_only=True)
+            cursor = dict_cursor(conn)
+            try:
+                if self._due():
+                    version = data_version(cursor)
+                    if version != self._version:
+                        self._reports = {}
+                        self._version = version
+                    self._checked_at = time.monotonic()
+                report = self._reports.get(key)
+                if report is None:
+                    report = self._reports[key] = build_report(cursor, name, years)
+            finally:
+                cursor.close()
+                conn.close()
+        return report
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return f"{value:.4f}"
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def report_csv(report):
+    """The report as CSV text, with a header row of column labels"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow([label for _, label in report.columns])
+    for row in report.rows:
+        writer.writerow([_csv_value(row[key]) for key, _ in report.columns])
+    return output.getvalue()
+
+
+reports = PerTenant(ReportCache)
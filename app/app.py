@@ -1,48 +1,92 @@
 import os
 import secrets
+import time
 from datetime import datetime, timedelta
 from functools import wraps
+from xml.sax.saxutils import escape
 import bcrypt
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app, send_file
+from werkzeug.http import is_resource_modified
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-import MySQLdb
 from flask_mail import Mail, Message
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
-
-# Database configuration
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'db'),
-    'user': os.getenv('DB_USER', 'membership_user'),
-    'passwd': os.getenv('DB_PASSWORD', ''),
-    'db': os.getenv('DB_NAME', 'membership_db'),
-    'charset': 'utf8mb4'
-}
-
-# Mail configuration
-app.config['MAIL_SERVER'] = os.getenv('SMTP_HOST', 'mail.smtp2go.com')
-app.config['MAIL_PORT'] = int(os.getenv('SMTP_PORT', 587))
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = os.getenv('SMTP_USER', '')
-app.config['MAIL_PASSWORD'] = os.getenv('SMTP_PASSWORD', '')
-app.config['MAIL_DEFAULT_SENDER'] = os.getenv('SMTP_FROM_EMAIL', 'noreply@example.com')
-
-mail = Mail(app)
+import bulk
+from analytics import REPORT_TITLES, report_csv, reports
+from bounces import (BOUNCE_ADDRESS, clear_bounces, get_bounce, is_undeliverable, undeliverable_addresses,
+                     undeliverable_version)
+from cards import CARD_FORMATS, CARD_MAX_AGE, CARD_RENDER_WAIT, CardBusy, card_etag, card_member, cards
+from changes import authenticate, poll_changes, record_changes
+from conditional import add_validators, not_modified, page_etag, page_last_modified
+from db import get_db_connection, dict_cursor
+from duplicates import scanner as duplicate_scanner
+from expiration_policy import evaluate_member
+from health import HEALTH_PATHS, liveness, readiness
+from repositories import DuplicateMember, member_repository, token_repository
+from renewals import (RENEWAL_METHODS, delete_renewal, member_renewals, parse_amount, parse_method,
+                      parse_period, record_renewals)
+from logs import RequestLoggingMiddleware, configure_logging, log_mail
+from roster import roster
+from scheduler import job_summaries, recent_runs
+from sessions import (ServerSideSessionInterface, make_session_store, rotate_session,
+                      revoke_member_sessions, SESSION_BACKEND)
+from tenants import PerTenant, TenantMiddleware, current_tenant, tenants
+from warmup import parse_hook_names, run_warmup
+
+bp = Blueprint('portal', __name__)
+
+mail = Mail()
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'portal.login'
+
+
+def create_app(config=None):
+    """Application factory.
+
+    Builds the Flask app, binds the extensions and runs the warm-up hooks
+    named in WARMUP_HOOKS so that no user request pays a cold-import or
+    first-connection penalty. `config` overrides any of the settings below.
+    """
+    # Before Flask creates app.logger, so it logs through the queue too
+    configure_logging()
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
+
+    # Mail configuration
+    app.config['MAIL_SERVER'] = os.getenv('SMTP_HOST', 'mail.smtp2go.com')
+    app.config['MAIL_PORT'] = int(os.getenv('SMTP_PORT', 587))
+    app.config['MAIL_USE_TLS'] = True
+    app.config['MAIL_USERNAME'] = os.getenv('SMTP_USER', '')
+    app.config['MAIL_PASSWORD'] = os.getenv('SMTP_PASSWORD', '')
+    app.config['MAIL_DEFAULT_SENDER'] = os.getenv('SMTP_FROM_EMAIL', 'noreply@example.com')
 
-# Database helper functions
-def get_db_connection():
-    """Create database connection"""
-    return MySQLdb.connect(**DB_CONFIG)
+    # Server-side sessions
+    app.config['SESSION_BACKEND'] = SESSION_BACKEND
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
-def dict_cursor(conn):
-    """Create a cursor that returns results as dictionaries"""
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    return cursor
+    # Warm-up configuration
+    app.config['WARMUP_HOOKS'] = parse_hook_names(os.getenv('WARMUP_HOOKS'))
+    app.config['DB_POOL_WARM'] = int(os.getenv('DB_POOL_WARM', 2))
+
+    if config:
+        app.config.update(config)
+
+    mail.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    # Each tenant gets its own session store
+    backend = app.config['SESSION_BACKEND']
+    app.session_interface = ServerSideSessionInterface(PerTenant(lambda: make_session_store(backend)))
+    app.jinja_env.filters['membership_status'] = evaluate_member
+    app.context_processor(lambda: {'tenant': current_tenant()})
+    app.after_request(add_validators)
+    # Select the tenant (and its database) from the Host header before Flask sees the request
+    app.wsgi_app = TenantMiddleware(app.wsgi_app, open_paths=HEALTH_PATHS)
+    # Outermost, so the request id and timing cover tenant selection and the session
+    app.wsgi_app = RequestLoggingMiddleware(app.wsgi_app)
+
+    app.extensions['warmup'] = run_warmup(app, app.config['WARMUP_HOOKS'])
+    return app
 
 # User class for Flask-Login
 class User(UserMixin):
@@ -52,12 +96,25 @@ class User(UserMixin):
         self.email = email
         self.is_admin = is_admin
 
+def set_session_principal(user):
+    """Store the authenticated principal in the server-side session"""
+    session['principal'] = {
+        'id': user.id,
+        'call_sign': user.username,
+        'email': user.email,
+        'is_admin': bool(user.is_admin)
+    }
+
 @login_manager.user_loader
 def load_user(user_id):
-    conn = get_db_connection()
+    # The server-side session carries the principal; only look it up without one
+    principal = session.get('principal')
+    if principal and str(principal['id']) == str(user_id):
+        return User(principal['id'], principal['call_sign'], principal['email'], principal['is_admin'])
+    
+    conn = get_db_connection(read_only=True)
     cursor = dict_cursor(conn)
-    cursor.execute("SELECT id, call_sign, email, is_admin FROM members WHERE id = %s", (user_id,))
-    user_data = cursor.fetchone()
+    user_data = member_repository(cursor).principal(user_id)
     cursor.close()
     conn.close()
     
@@ -71,7 +128,7 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         if not current_user.is_authenticated or not current_user.is_admin:
             flash('You need admin privileges to access this page.', 'danger')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('portal.dashboard'))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -87,47 +144,98 @@ def generate_reset_token():
     """Generate a secure random token"""
     return secrets.token_urlsafe(32)
 
-def send_password_reset_email(user_email, call_sign, token):
-    """Send password reset email"""
-    reset_url = f"{os.getenv('APP_URL', 'http://localhost:5000')}/reset-password/{token}"
-    
-    msg = Message(
-        subject="Password Reset Request",
-        recipients=[user_email],
-        body=f"""Hello {call_sign},
-
-You have requested to reset your password for the Ham Radio Club Membership Portal.
+def email_message(email, recipients):
+    """Wrap a RenderedEmail as a multipart (plain text + HTML) Flask-Mail message"""
+    return Message(subject=email.subject, recipients=recipients, body=email.text, html=email.html,
+                   sender=current_tenant().from_email)
 
-Please click the link below to reset your password:
-{reset_url}
-
-This link will expire in 24 hours.
+def send_mail(msg):
+    """Send a message, using BOUNCE_ADDRESS as the envelope sender when configured"""
+    start = time.perf_counter()
+    try:
+        with mail.connect() as connection:
+            connection.send(msg, envelope_from=BOUNCE_ADDRESS)
+    except Exception as e:
+        log_mail(msg.recipients, msg.subject, time.perf_counter() - start, error=e)
+        raise
+    log_mail(msg.recipients, msg.subject, time.perf_counter() - start)
 
-If you did not request this password reset, please ignore this email.
+def build_password_reset_email(user_email, call_sign, token):
+    """Build password reset email"""
+    tenant = current_tenant()
+    reset_url = f"{tenant.app_url}/reset-password/{token}"
+    email = tenant.email_renderer.render('password_reset', call_sign=call_sign, reset_url=reset_url)
+    return email_message(email, [user_email])
 
-73,
-Membership Portal Team
-"""
-    )
+def send_password_reset_email(user_email, call_sign, token):
+    """Send password reset email"""
+    msg = build_password_reset_email(user_email, call_sign, token)
     
     try:
-        mail.send(msg)
+        send_mail(msg)
         return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
+    except Exception:
+        # Already logged by send_mail
         return False
 
+def build_update_notice(user):
+    """Build update notice email for a member"""
+    email = current_tenant().email_renderer.render('update_notice', call_sign=user['call_sign'])
+    return email_message(email, [user['email']])
+
+def build_update_notices(users):
+    """Build update notice emails for many members in one batch"""
+    emails = current_tenant().email_renderer.render_batch('update_notice', [{'call_sign': user['call_sign']} for user in users])
+    return [email_message(email, [user['email']]) for user, email in zip(users, emails)]
+
+def json_response(body, status):
+    response = jsonify(body)
+    response.status_code = status
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def member_version(member_id):
+    """Row version of a member plus their bounce state, or None if there is no such member"""
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    row = member_repository(cursor).version(member_id)
+    cursor.close()
+    conn.close()
+    return row
+
 # Routes
-@app.route('/')
+@bp.route('/healthz')
+def healthz():
+    """Liveness: the worker is serving requests (checks no dependencies)"""
+    return json_response(*liveness())
+
+@bp.route('/readyz')
+def readyz():
+    """Readiness: databases reachable; dependency latencies from cached checks"""
+    return json_response(*readiness(current_app, tenants))
+
+@bp.route('/api/changes')
+def change_feed():
+    """Member changes after ?cursor= for downstream sync (bearer token; long-polls with ?wait=)"""
+    auth = request.headers.get('Authorization', '')
+    if authenticate(auth[7:].strip() if auth.startswith('Bearer ') else None) is None:
+        response = json_response({'error': 'Invalid or missing API token'}, 401)
+        response.headers['WWW-Authenticate'] = 'Bearer'
+        return response
+    return json_response(*poll_changes(request.args.get('cursor', 0, type=int),
+                                       request.args.get('limit', 100, type=int),
+                                       request.args.get('wait', 0, type=float)))
+
+@bp.route('/')
 def index():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
+        return redirect(url_for('portal.dashboard'))
+    return redirect(url_for('portal.login'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('portal.dashboard'))
     
     if request.method == 'POST':
         call_sign = request.form.get('call_sign').upper()
@@ -135,44 +243,43 @@ def login():
         
         conn = get_db_connection()
         cursor = dict_cursor(conn)
-        cursor.execute("SELECT id, call_sign, email, password_hash, is_admin FROM members WHERE call_sign = %s", (call_sign,))
-        user_data = cursor.fetchone()
+        user_data = member_repository(cursor).for_login(call_sign)
         cursor.close()
         conn.close()
         
         if user_data and check_password(password, user_data['password_hash']):
             user = User(user_data['id'], user_data['call_sign'], user_data['email'], user_data['is_admin'])
-            login_user(user, remember=True)
+            # New session id on login; lifetime is enforced server-side, so no remember cookie
+            rotate_session()
+            session.permanent = True
+            login_user(user)
+            set_session_principal(user)
             flash('Login successful!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('portal.dashboard'))
         else:
             flash('Invalid call sign or password', 'danger')
     
     return render_template('login.html')
 
-@app.route('/request-access', methods=['POST'])
+@bp.route('/request-access', methods=['POST'])
 def request_access():
     """Handle password recovery/access request"""
     email = request.form.get('email', '').strip().lower()
     
     if not email:
         flash('Please enter an email address.', 'warning')
-        return redirect(url_for('login'))
+        return redirect(url_for('portal.login'))
     
     conn = get_db_connection()
     cursor = dict_cursor(conn)
-    cursor.execute("SELECT id, call_sign, email FROM members WHERE email = %s", (email,))
-    user = cursor.fetchone()
+    user = member_repository(cursor).by_email(email)
     
     if user:
         # Generate reset token
         token = generate_reset_token()
         expires_at = datetime.now() + timedelta(hours=24)
         
-        cursor.execute("""
-            INSERT INTO password_reset_tokens (user_id, token, expires_at) 
-            VALUES (%s, %s, %s)
-        """, (user['id'], token, expires_at))
+        token_repository(cursor).create(user['id'], token, expires_at)
         conn.commit()
         
         # Send email with login instructions
@@ -184,35 +291,48 @@ def request_access():
     
     cursor.close()
     conn.close()
-    return redirect(url_for('login'))
+    return redirect(url_for('portal.login'))
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out.', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('portal.login'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def dashboard():
-    conn = get_db_connection()
-    cursor = dict_cursor(conn)
-    
+    # Answer repeat visits with 304 after a version lookup, before any rendering
+    bounces = undeliverable_version()
     if current_user.is_admin:
-        cursor.execute("SELECT * FROM members ORDER BY name")
-        members = cursor.fetchall()
+        version = roster.version
+        last_modified = page_last_modified(version[1], bounces[1])
     else:
-        cursor.execute("SELECT * FROM members WHERE id = %s", (current_user.id,))
-        members = cursor.fetchall()
+        version = member_version(current_user.id)
+        last_modified = page_last_modified(version and version['updated_at'], bounces[1])
+    response = not_modified(page_etag('dashboard', version, bounces), last_modified)
+    if response:
+        return response
     
-    cursor.close()
-    conn.close()
+    if current_user.is_admin:
+        # Admins see the whole roster, served from the shared snapshot
+        members = roster.members_by_name()
+        status_counts = roster.status_counts()
+    else:
+        conn = get_db_connection(read_only=True)
+        cursor = dict_cursor(conn)
+        member = member_repository(cursor).get(current_user.id)
+        members = [member] if member else []
+        cursor.close()
+        conn.close()
+        status_counts = None
     
-    return render_template('dashboard.html', members=members, now=datetime.now())
+    return render_template('dashboard.html', members=members, status_counts=status_counts,
+                           undeliverable=undeliverable_addresses(), now=datetime.now())
 
 
-@app.route('/admin/export-pdf')
+@bp.route('/admin/export-pdf')
 @login_required
 @admin_required
 def export_pdf():
@@ -255,36 +375,20 @@ def export_pdf():
     )
     
     # Title
-    title = Paragraph("Indiana Repeater Council<br/>Membership Database", title_style)
+    tenant = current_tenant()
+    title = Paragraph(f"{escape(tenant.name)}<br/>Membership Database", title_style)
     elements.append(title)
     
-    # Subtitle with date and count
-    conn = get_db_connection()
-    cursor = dict_cursor(conn)
-    cursor.execute("SELECT COUNT(*) as count FROM members")
-    member_count = cursor.fetchone()['count']
+    # Member data comes from the shared roster snapshot, sorted by last name
+    members = roster.members_by_last_name()
+    member_count = len(members)
     
+    # Subtitle with date and count
     subtitle = Paragraph(f"Generated: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}<br/>"
                         f"Total Members: {member_count}", subtitle_style)
     elements.append(subtitle)
     elements.append(Spacer(1, 0.2*inch))
     
-    # Get member data
-    cursor.execute("""
-        SELECT call_sign, name, email, city, state, member_type, paid_thru,
-               CASE WHEN is_admin = 1 THEN 'Yes' ELSE 'No' END as admin
-        FROM members 
-        ORDER BY 
-            CASE 
-                WHEN name LIKE '% %' THEN SUBSTRING_INDEX(name, ' ', -1)
-                ELSE name
-            END,
-            name
-    """)
-    members = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
     # Create paragraph style for table cells
     from reportlab.platypus import Paragraph
     from reportlab.lib.styles import ParagraphStyle
@@ -311,8 +415,8 @@ def export_pdf():
             Paragraph(member['city'] or '', cell_style),
             Paragraph(member['state'] or '', cell_style),
             Paragraph(member['member_type'] or '', cell_style),
-            Paragraph(member['paid_thru'] or '', cell_style),
-            Paragraph(member['admin'] or '', cell_style)
+            Paragraph(str(member['paid_thru'] or ''), cell_style),
+            Paragraph('Yes' if member['is_admin'] else 'No', cell_style)
         ])
     
     # Create table with adjusted column widths for landscape letter (10.5" available width)
@@ -369,7 +473,7 @@ def export_pdf():
         textColor=colors.grey,
         alignment=TA_CENTER
     )
-    footer = Paragraph("Indiana Repeater Council Membership Portal<br/>"
+    footer = Paragraph(f"{escape(tenant.name)} Membership Portal<br/>"
                       "This document contains confidential member information.", 
                       footer_style)
     elements.append(footer)
@@ -379,9 +483,8 @@ def export_pdf():
     
     # Prepare response
     buffer.seek(0)
-    filename = f"IRC_Membership_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
+    filename = f"{tenant.short_name}_Membership_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
     
-    from flask import send_file
     return send_file(
         buffer,
         mimetype='application/pdf',
@@ -389,25 +492,78 @@ def export_pdf():
         download_name=filename
     )
 
-@app.route('/profile/<int:user_id>', methods=['GET', 'POST'])
+@bp.route('/admin/reports')
+@login_required
+@admin_required
+def analytics_report():
+    """Grouped membership counts and retention, from the analytics cache"""
+    name = request.args.get('report', 'state')
+    if name not in REPORT_TITLES:
+        flash('Unknown report.', 'danger')
+        return redirect(url_for('portal.analytics_report'))
+    years = min(max(request.args.get('years', 10, type=int), 2), 50)
+    report = reports.report(name, years)
+    return render_template('reports.html', report=report, report_titles=REPORT_TITLES, years=years)
+
+@bp.route('/admin/reports/<name>.csv')
+@login_required
+@admin_required
+def analytics_report_csv(name):
+    """Download a report as CSV"""
+    if name not in REPORT_TITLES:
+        flash('Unknown report.', 'danger')
+        return redirect(url_for('portal.analytics_report'))
+    years = min(max(request.args.get('years', 10, type=int), 2), 50)
+    report = reports.report(name, years)
+    filename = f"{current_tenant().short_name}_{name}_{report.generated_at.strftime('%Y%m%d_%H%M')}.csv"
+    return current_app.response_class(
+        report_csv(report),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@bp.route('/admin/duplicates')
+@login_required
+@admin_required
+def duplicate_candidates():
+    """Probable duplicate members and inconsistent city/state spellings"""
+    result = duplicate_scanner.result()
+    return render_template('duplicates.html', result=result, candidates=result.candidates[:200])
+
+@bp.route('/admin/scheduler')
+@login_required
+@admin_required
+def scheduler_status():
+    """Scheduled jobs with their recent runs, durations and failures"""
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    try:
+        jobs = job_summaries(cursor)
+        runs = recent_runs(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+    return render_template('scheduler.html', jobs=jobs, runs=runs)
+
+@bp.route('/profile/<int:user_id>', methods=['GET', 'POST'])
 @login_required
 def profile(user_id):
     # Check permissions
     if not current_user.is_admin and current_user.id != user_id:
         flash('You do not have permission to edit this profile.', 'danger')
-        return redirect(url_for('dashboard'))
-    
-    conn = get_db_connection()
-    cursor = dict_cursor(conn)
+        return redirect(url_for('portal.dashboard'))
     
     if request.method == 'POST':
+        conn = get_db_connection()
+        cursor = dict_cursor(conn)
+        members = member_repository(cursor)
+        
         # Get call sign - only admins can change it
         if current_user.is_admin:
             new_call_sign = request.form.get('call_sign').upper()
         else:
             # Non-admin: preserve existing call sign
-            cursor.execute("SELECT call_sign FROM members WHERE id = %s", (user_id,))
-            new_call_sign = cursor.fetchone()['call_sign']
+            new_call_sign = members.get(user_id, 'call_sign')['call_sign']
         
         # Get other form data
         email = request.form.get('email')
@@ -429,90 +585,201 @@ def profile(user_id):
                 admin_comments = admin_comments[:500]
         
         # Check if call sign changed (only possible if admin)
-        cursor.execute("SELECT call_sign FROM members WHERE id = %s", (user_id,))
-        old_member = cursor.fetchone()
+        old_member = members.get(user_id, 'call_sign, is_admin')
         old_call_sign = old_member['call_sign']
         call_sign_changed = (new_call_sign != old_call_sign)
         
         # If call sign changed, check for duplicates
         if call_sign_changed:
-            cursor.execute("SELECT id FROM members WHERE call_sign = %s AND id != %s", 
-                         (new_call_sign, user_id))
-            if cursor.fetchone():
+            if members.call_sign_taken(new_call_sign, user_id):
                 flash(f'Call sign {new_call_sign} is already in use.', 'danger')
                 cursor.close()
                 conn.close()
-                return redirect(url_for('profile', user_id=user_id))
+                return redirect(url_for('portal.profile', user_id=user_id))
         
-        # Build update query - paid_thru, member_type, and call_sign only editable by admin
+        # Build the update - member_type and call_sign only editable by admin
+        # (paid_thru is maintained from the renewals ledger, see record_renewal)
+        fields = {'email': email, 'name': name, 'primary_rep': primary_rep, 'rep_call': rep_call,
+                  'address': address, 'city': city, 'state': state, 'zip': zip_code, 'telephone': telephone}
+        role_changed = False
         if current_user.is_admin:
-            paid_thru = request.form.get('paid_thru')
-            member_type = request.form.get('member_type')
+            fields.update(call_sign=new_call_sign, member_type=request.form.get('member_type'),
+                          admin_comments=admin_comments)
             
             # Only update is_admin if editing someone else
             # If editing yourself, preserve current admin status
-            if user_id == current_user.id:
-                # Editing own profile - don't change admin status
-                cursor.execute("""
-                    UPDATE members 
-                    SET call_sign = %s, email = %s, name = %s, primary_rep = %s, rep_call = %s,
-                        address = %s, city = %s, state = %s, zip = %s, telephone = %s,
-                        paid_thru = %s, member_type = %s, admin_comments = %s
-                    WHERE id = %s
-                """, (new_call_sign, email, name, primary_rep, rep_call, address, city, state, zip_code, 
-                      telephone, paid_thru, member_type, admin_comments, user_id))
-            else:
-                # Editing someone else - allow changing admin status
+            if user_id != current_user.id:
                 is_admin = 1 if request.form.get('is_admin') == 'on' else 0
-                cursor.execute("""
-                    UPDATE members 
-                    SET call_sign = %s, email = %s, name = %s, primary_rep = %s, rep_call = %s,
-                        address = %s, city = %s, state = %s, zip = %s, telephone = %s,
-                        paid_thru = %s, member_type = %s, is_admin = %s, admin_comments = %s
-                    WHERE id = %s
-                """, (new_call_sign, email, name, primary_rep, rep_call, address, city, state, zip_code, 
-                      telephone, paid_thru, member_type, is_admin, admin_comments, user_id))
-        else:
-            # Non-admin update (call_sign already fetched from DB above)
-            cursor.execute("""
-                UPDATE members 
-                SET email = %s, name = %s, primary_rep = %s, rep_call = %s,
-                    address = %s, city = %s, state = %s, zip = %s, telephone = %s
-                WHERE id = %s
-            """, (email, name, primary_rep, rep_call, address, city, state, zip_code, 
-                  telephone, user_id))
+                role_changed = (is_admin != int(old_member['is_admin'] or 0))
+                fields['is_admin'] = is_admin
+        members.update([user_id], fields)
         
+        record_changes(cursor, [user_id], 'update')
         conn.commit()
         cursor.close()
         conn.close()
+        roster.invalidate()
+        
+        # Admin confirmed the address works again
+        if current_user.is_admin and request.form.get('clear_bounce') == 'on':
+            clear_bounces(email)
+        
+        if user_id != current_user.id:
+            # Sessions carry the member's call sign and role; log them out if either changed
+            if call_sign_changed or role_changed:
+                revoke_member_sessions(user_id)
+        elif not call_sign_changed:
+            set_session_principal(User(current_user.id, current_user.username, email, current_user.is_admin))
         
         # If admin changed someone else's call sign, notify them
         if call_sign_changed and user_id != current_user.id:
             flash(f'Call sign updated to {new_call_sign}. Member will need to login with new call sign.', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('portal.dashboard'))
         
         # If admin changed their own call sign, log them out
         if call_sign_changed and user_id == current_user.id:
+            revoke_member_sessions(user_id, keep_current=True)
             logout_user()
             flash(f'Call sign updated to {new_call_sign}. Please login with your new call sign.', 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('portal.login'))
         
         flash('Profile updated successfully!', 'success')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('portal.dashboard'))
+    
+    # GET request - display profile, or 304 if the member row and bounce state are unchanged
+    version = member_version(user_id)
+    if version:
+        response = not_modified(page_etag('profile', user_id, version),
+                                page_last_modified(version['updated_at'], version['last_bounced_at']))
+        if response:
+            return response
+    
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    member = member_repository(cursor).get(user_id)
+    cursor.close()
+    conn.close()
     
-    # GET request - display profile
-    cursor.execute("SELECT * FROM members WHERE id = %s", (user_id,))
-    member = cursor.fetchone()
+    if not member:
+        flash('Member not found.', 'danger')
+        return redirect(url_for('portal.dashboard'))
+    
+    renewals = member_renewals(user_id) if current_user.is_admin else []
+    return render_template('profile.html', member=member, bounce=get_bounce(member['email']),
+                           renewals=renewals, renewal_methods=RENEWAL_METHODS,
+                           card_version=card_etag(member), today=datetime.now().date())
+
+@bp.route('/profile/<int:user_id>/card.<any(pdf, png):fmt>')
+@login_required
+def membership_card(user_id, fmt):
+    """Membership card as PDF or PNG, rendered once per member row version"""
+    if not current_user.is_admin and current_user.id != user_id:
+        flash('You do not have permission to view this card.', 'danger')
+        return redirect(url_for('portal.dashboard'))
+    
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    member = card_member(cursor, user_id)
     cursor.close()
     conn.close()
     
     if not member:
         flash('Member not found.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('portal.dashboard'))
     
-    return render_template('profile.html', member=member)
+    # The browser's copy is current: answer before touching the card cache
+    etag = card_etag(member)
+    # Only a URL naming the current version may be reused without asking; the
+    # profile page links to ?v=<etag>, so a changed card gets a new URL
+    max_age = CARD_MAX_AGE if request.args.get('v') == etag else 0
+    if not is_resource_modified(request.environ, etag=etag, last_modified=member['updated_at']):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+    else:
+        try:
+            path = cards.card(member, fmt)
+        except CardBusy:
+            response = current_app.response_class('Cards are being generated. Please try again in a moment.',
+                                                  status=503, mimetype='text/plain')
+            response.headers['Retry-After'] = str(round(CARD_RENDER_WAIT))
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        call_sign = (member['call_sign'] or str(user_id)).replace('/', '-')
+        response = send_file(path, mimetype=CARD_FORMATS[fmt], conditional=True, etag=etag,
+                             last_modified=member['updated_at'], max_age=max_age,
+                             as_attachment=request.args.get('download') == '1',
+                             download_name=f"{call_sign}_membership_card.{fmt}")
+    # Cards are personal: browsers may keep them, shared caches may not
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    response.cache_control.no_cache = not max_age
+    return response
 
-@app.route('/change-password', methods=['GET', 'POST'])
+@bp.route('/admin/member/<int:user_id>/renewals', methods=['POST'])
+@login_required
+@admin_required
+def record_renewal(user_id):
+    """Add a payment to a member's renewals ledger; paid_thru follows from it"""
+    period_year = parse_period(request.form.get('period_year'))
+    method = parse_method(request.form.get('method'))
+    try:
+        amount = parse_amount(request.form.get('amount'))
+        paid_on = datetime.strptime(request.form.get('paid_on') or datetime.now().strftime('%Y-%m-%d'), '%Y-%m-%d').date()
+    except ValueError:
+        flash('Enter the amount as a number and the payment date as YYYY-MM-DD.', 'danger')
+        return redirect(url_for('portal.profile', user_id=user_id))
+    if period_year is None or method is None:
+        flash('Enter the membership year (YYYY) and a payment method.', 'danger')
+        return redirect(url_for('portal.profile', user_id=user_id))
+    
+    conn = get_db_connection()
+    cursor = dict_cursor(conn)
+    member = member_repository(cursor).get(user_id, 'call_sign')
+    if member:
+        record_renewals(cursor, [{
+            'member_id': user_id,
+            'period_year': period_year,
+            'amount': amount,
+            'method': method,
+            'reference': (request.form.get('reference') or '').strip()[:64],
+            'recorded_by': current_user.id,
+            'paid_on': paid_on,
+        }])
+        record_changes(cursor, [user_id], 'update')
+        conn.commit()
+    cursor.close()
+    conn.close()
+    
+    if not member:
+        flash('Member not found.', 'danger')
+        return redirect(url_for('portal.dashboard'))
+    roster.invalidate()
+    flash(f"Renewal for {period_year} recorded for {member['call_sign']}.", 'success')
+    return redirect(url_for('portal.profile', user_id=user_id))
+
+@bp.route('/admin/renewals/<int:renewal_id>/delete', methods=['POST'])
+@login_required
+@admin_required
+def remove_renewal(renewal_id):
+    """Remove a ledger entry recorded in error; paid_thru is recomputed"""
+    conn = get_db_connection()
+    cursor = dict_cursor(conn)
+    member_id = delete_renewal(cursor, renewal_id)
+    if member_id is not None:
+        record_changes(cursor, [member_id], 'update')
+    conn.commit()
+    cursor.close()
+    conn.close()
+    
+    if member_id is None:
+        flash('Renewal not found.', 'danger')
+        return redirect(url_for('portal.dashboard'))
+    roster.invalidate()
+    flash('Renewal removed.', 'success')
+    return redirect(url_for('portal.profile', user_id=member_id))
+
+@bp.route('/change-password', methods=['GET', 'POST'])
 @login_required
 def change_password():
     if request.method == 'POST':
@@ -526,8 +793,8 @@ def change_password():
         
         conn = get_db_connection()
         cursor = dict_cursor(conn)
-        cursor.execute("SELECT password_hash FROM members WHERE id = %s", (current_user.id,))
-        user_data = cursor.fetchone()
+        members = member_repository(cursor)
+        user_data = members.get(current_user.id, 'password_hash')
         
         if not check_password(current_password, user_data['password_hash']):
             flash('Current password is incorrect.', 'danger')
@@ -536,39 +803,43 @@ def change_password():
             return render_template('change_password.html')
         
         new_hash = hash_password(new_password)
-        cursor.execute("UPDATE members SET password_hash = %s WHERE id = %s", (new_hash, current_user.id))
+        members.set_password(current_user.id, new_hash)
         conn.commit()
         cursor.close()
         conn.close()
         
+        # Log out other sessions that were opened with the old password
+        revoke_member_sessions(current_user.id, keep_current=True)
+        
         flash('Password changed successfully!', 'success')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('portal.dashboard'))
     
     return render_template('change_password.html')
 
-@app.route('/admin/initiate-reset/<int:user_id>', methods=['POST'])
+@bp.route('/admin/initiate-reset/<int:user_id>', methods=['POST'])
 @login_required
 @admin_required
 def initiate_password_reset(user_id):
     conn = get_db_connection()
     cursor = dict_cursor(conn)
     
-    cursor.execute("SELECT call_sign, email FROM members WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
+    user = member_repository(cursor).get(user_id, 'call_sign, email')
     
     if not user:
         cursor.close()
         conn.close()
         return jsonify({'success': False, 'message': 'User not found'}), 404
     
+    if is_undeliverable(user['email']):
+        cursor.close()
+        conn.close()
+        return jsonify({'success': False, 'message': f'{user["email"]} is marked undeliverable (bounced). Clear the flag on the profile to retry.'}), 400
+    
     # Generate reset token
     token = generate_reset_token()
     expires_at = datetime.now() + timedelta(hours=24)
     
-    cursor.execute("""
-        INSERT INTO password_reset_tokens (user_id, token, expires_at) 
-        VALUES (%s, %s, %s)
-    """, (user_id, token, expires_at))
+    token_repository(cursor).create(user_id, token, expires_at)
     conn.commit()
     
     # Send email
@@ -581,7 +852,7 @@ def initiate_password_reset(user_id):
         conn.close()
         return jsonify({'success': False, 'message': 'Failed to send email. Check SMTP configuration.'}), 500
 
-@app.route('/admin/send-update-notice/<int:user_id>', methods=['POST'])
+@bp.route('/admin/send-update-notice/<int:user_id>', methods=['POST'])
 @login_required
 @admin_required
 def send_update_notice(user_id):
@@ -591,11 +862,10 @@ def send_update_notice(user_id):
     if user_id == current_user.id:
         return jsonify({'success': False, 'message': 'Cannot send update notice to yourself'}), 400
     
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     cursor = dict_cursor(conn)
     
-    cursor.execute("SELECT call_sign, name, email FROM members WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
+    user = member_repository(cursor).get(user_id, 'call_sign, name, email')
     cursor.close()
     conn.close()
     
@@ -605,50 +875,150 @@ def send_update_notice(user_id):
     if not user['email']:
         return jsonify({'success': False, 'message': f'No email address on file for {user["call_sign"]}'}), 400
     
+    if is_undeliverable(user['email']):
+        return jsonify({'success': False, 'message': f'{user["email"]} is marked undeliverable (bounced). Clear the flag on the profile to retry.'}), 400
+    
     # Send update notice email
-    msg = Message(
-        subject="Your Indiana Repeater Council membership record has been updated",
-        recipients=[user['email']],
-        body=f"""Hello {user['call_sign']},
-
-This is a notification that your membership record with the Indiana Repeater Council has been reviewed and updated by an administrator.
-
-Please login to the membership portal to review your current information:
-{os.getenv('APP_URL', 'http://localhost:5000')}
-
-If you have any questions about these changes, please contact us at service-desk.ircinc.org
-
-73,
-Indiana Repeater Council
-Membership Portal Team
-"""
-    )
+    msg = build_update_notice(user)
     
     try:
-        mail.send(msg)
+        send_mail(msg)
         return jsonify({'success': True, 'message': f'Update notice sent to {user["email"]} ({user["call_sign"]})'})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Failed to send email: {str(e)}'}), 500
 
-@app.route('/forgot-password', methods=['GET', 'POST'])
+@bp.route('/admin/bulk/<action>', methods=['POST'])
+@login_required
+@admin_required
+def bulk_action(action):
+    """Apply an action to a set of selected members.
+
+    Expects JSON {"ids": [...]} plus, for "update", "paid_thru" and/or
+    "member_type". Database changes run in a single transaction; emails are
+    queued as a background job whose progress is at bulk_job_status().
+    """
+    data = request.get_json(silent=True) or {}
+    ids = bulk.parse_ids(data.get('ids'))
+    if ids is None:
+        return jsonify({'success': False, 'message': f'Select between 1 and {bulk.BULK_MAX_IDS} members'}), 400
+    
+    # Never act on your own account in bulk
+    ids = [id for id in ids if id != current_user.id]
+    if not ids:
+        return jsonify({'success': False, 'message': 'Cannot apply bulk actions to yourself'}), 400
+    
+    if action == 'update':
+        period_year = None
+        if data.get('paid_thru'):
+            period_year = parse_period(data['paid_thru'])
+            if period_year is None:
+                return jsonify({'success': False, 'message': 'Paid Thru must be a year (YYYY)'}), 400
+        member_type = str(data.get('member_type') or '').strip()
+        if period_year is None and not member_type:
+            return jsonify({'success': False, 'message': 'Nothing to update'}), 400
+        
+        conn = get_db_connection()
+        cursor = dict_cursor(conn)
+        members = member_repository(cursor)
+        found = members.existing_ids(ids)
+        count = len(found)
+        if member_type and found:
+            members.update(found, {'member_type': member_type})
+        if period_year is not None:
+            # Paid Thru is derived from the ledger: record a renewal for each member
+            record_renewals(cursor, [
+                {'member_id': id, 'period_year': period_year, 'reference': 'Bulk update',
+                 'recorded_by': current_user.id}
+                for id in found
+            ])
+        record_changes(cursor, found, 'update')
+        conn.commit()
+        cursor.close()
+        conn.close()
+        roster.invalidate()
+        return jsonify({'success': True, 'message': f'Updated {count} members'})
+    
+    if action == 'delete':
+        conn = get_db_connection()
+        cursor = dict_cursor(conn)
+        record_changes(cursor, ids, 'delete')
+        count = member_repository(cursor).delete(ids)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        roster.invalidate()
+        for id in ids:
+            revoke_member_sessions(id)
+            cards.discard(id)
+        return jsonify({'success': True, 'message': f'Deleted {count} members'})
+    
+    if action not in ('send-notice', 'reset-password'):
+        return jsonify({'success': False, 'message': f'Unknown action: {action}'}), 404
+    
+    conn = get_db_connection()
+    cursor = dict_cursor(conn)
+    # Skip members without an email address or whose address has bounced
+    users = member_repository(cursor).with_deliverable_email(ids)
+    skipped = len(ids) - len(users)
+    
+    if action == 'reset-password':
+        # Create every token in one transaction before any email goes out
+        expires_at = datetime.now() + timedelta(hours=24)
+        tokens = [(user['id'], generate_reset_token(), expires_at) for user in users]
+        token_repository(cursor).create_many(tokens)
+        conn.commit()
+        messages = [build_password_reset_email(user['email'], user['call_sign'], token)
+                    for user, (_, token, _) in zip(users, tokens)]
+    else:
+        messages = build_update_notices(users)
+    cursor.close()
+    conn.close()
+    
+    if not messages:
+        return jsonify({'success': False, 'message': 'None of the selected members have a deliverable email address'}), 400
+    
+    job_id = bulk.start_email_job(current_app._get_current_object(), mail, action,
+                                  current_user.id, messages)
+    message = f'Sending {len(messages)} emails'
+    if skipped:
+        message += f' ({skipped} members without a deliverable email skipped)'
+    return jsonify({'success': True, 'message': message, 'job_id': job_id,
+                    'status_url': url_for('portal.bulk_job_status', job_id=job_id)}), 202
+
+@bp.route('/admin/bulk/jobs/<int:job_id>')
+@login_required
+@admin_required
+def bulk_job_status(job_id):
+    """Progress of a bulk email job"""
+    job = bulk.get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({
+        'success': True,
+        'job_id': job['id'],
+        'action': job['action'],
+        'status': job['status'],
+        'total': job['total'],
+        'processed': job['processed'],
+        'failed': job['failed'],
+        'errors': job['errors'].splitlines() if job['errors'] else []
+    })
+
+@bp.route('/forgot-password', methods=['GET', 'POST'])
 def forgot_password():
     if request.method == 'POST':
         email = request.form.get('email')
         
         conn = get_db_connection()
         cursor = dict_cursor(conn)
-        cursor.execute("SELECT id, call_sign, email FROM members WHERE email = %s", (email,))
-        user = cursor.fetchone()
+        user = member_repository(cursor).by_email(email)
         
         if user:
             # Generate reset token
             token = generate_reset_token()
             expires_at = datetime.now() + timedelta(hours=24)
             
-            cursor.execute("""
-                INSERT INTO password_reset_tokens (user_id, token, expires_at) 
-                VALUES (%s, %s, %s)
-            """, (user['id'], token, expires_at))
+            token_repository(cursor).create(user['id'], token, expires_at)
             conn.commit()
             
             send_password_reset_email(user['email'], user['call_sign'], token)
@@ -657,27 +1027,24 @@ def forgot_password():
         flash('If that email exists in our system, a password reset link has been sent.', 'info')
         cursor.close()
         conn.close()
-        return redirect(url_for('login'))
+        return redirect(url_for('portal.login'))
     
     return render_template('forgot_password.html')
 
-@app.route('/reset-password/<token>', methods=['GET', 'POST'])
+@bp.route('/reset-password/<token>', methods=['GET', 'POST'])
 def reset_password(token):
     conn = get_db_connection()
     cursor = dict_cursor(conn)
+    tokens = token_repository(cursor)
     
     # Verify token
-    cursor.execute("""
-        SELECT user_id FROM password_reset_tokens 
-        WHERE token = %s AND expires_at > NOW() AND used = FALSE
-    """, (token,))
-    token_data = cursor.fetchone()
+    user_id = tokens.user_id(token)
     
-    if not token_data:
+    if user_id is None:
         flash('Invalid or expired password reset link.', 'danger')
         cursor.close()
         conn.close()
-        return redirect(url_for('login'))
+        return redirect(url_for('portal.login'))
     
     if request.method == 'POST':
         new_password = request.form.get('new_password')
@@ -691,24 +1058,26 @@ def reset_password(token):
         
         # Update password
         new_hash = hash_password(new_password)
-        cursor.execute("UPDATE members SET password_hash = %s WHERE id = %s", 
-                      (new_hash, token_data['user_id']))
+        member_repository(cursor).set_password(user_id, new_hash)
         
         # Mark token as used
-        cursor.execute("UPDATE password_reset_tokens SET used = TRUE WHERE token = %s", (token,))
+        tokens.mark_used(token)
         
         conn.commit()
         cursor.close()
         conn.close()
         
+        # Anyone holding a session under the old password is logged out
+        revoke_member_sessions(user_id)
+        
         flash('Password reset successfully! You can now log in with your new password.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('portal.login'))
     
     cursor.close()
     conn.close()
     return render_template('reset_password.html', token=token)
 
-@app.route('/admin/add-member', methods=['GET', 'POST'])
+@bp.route('/admin/add-member', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def add_member():
@@ -725,64 +1094,92 @@ def add_member():
         state = request.form.get('state')
         zip_code = request.form.get('zip')
         telephone = request.form.get('telephone')
-        paid_thru = request.form.get('paid_thru')
         member_type = request.form.get('member_type')
         is_admin = 1 if request.form.get('is_admin') == 'on' else 0
         admin_comments = request.form.get('admin_comments', '')
         if admin_comments and len(admin_comments) > 500:
             admin_comments = admin_comments[:500]
         
+        # First payment goes in the renewals ledger, which sets paid_thru
+        renewal = None
+        if request.form.get('paid_thru'):
+            try:
+                renewal = {
+                    'period_year': parse_period(request.form.get('paid_thru')),
+                    'amount': parse_amount(request.form.get('amount')),
+                    'method': parse_method(request.form.get('method')),
+                    'recorded_by': current_user.id,
+                }
+            except ValueError:
+                renewal = {'period_year': None}
+            if renewal['period_year'] is None or renewal['method'] is None:
+                flash('Enter Paid Through as a year (YYYY) and the amount as a number.', 'danger')
+                return render_template('add_member.html', renewal_methods=RENEWAL_METHODS)
+        
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = dict_cursor(conn)
         
         try:
             password_hash = hash_password(password)
-            cursor.execute("""
-                INSERT INTO members (call_sign, password_hash, email, name, primary_rep, 
-                                   rep_call, address, city, state, zip, telephone, 
-                                   paid_thru, member_type, is_admin, admin_comments)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (call_sign, password_hash, email, name, primary_rep, rep_call, address, 
-                  city, state, zip_code, telephone, paid_thru, member_type, is_admin, admin_comments))
+            member_id = member_repository(cursor).create({
+                'call_sign': call_sign, 'password_hash': password_hash, 'email': email, 'name': name,
+                'primary_rep': primary_rep, 'rep_call': rep_call, 'address': address, 'city': city,
+                'state': state, 'zip': zip_code, 'telephone': telephone, 'member_type': member_type,
+                'is_admin': is_admin, 'admin_comments': admin_comments,
+            })
+            if renewal:
+                record_renewals(cursor, [{**renewal, 'member_id': member_id}])
+            record_changes(cursor, [member_id], 'insert')
+            # The welcome email's link sets the first password
+            token = None
+            if email:
+                token = generate_reset_token()
+                token_repository(cursor).create(member_id, token, datetime.now() + timedelta(hours=24))
             conn.commit()
+            roster.invalidate()
             
             # Send welcome email with password reset link if email provided
             if email:
-                try:
-                    send_password_reset_email(email, call_sign)
+                if send_password_reset_email(email, call_sign, token):
                     flash(f'Member {call_sign} added successfully! Password reset email sent to {email}.', 'success')
-                except Exception as e:
-                    flash(f'Member {call_sign} added, but failed to send password reset email: {str(e)}', 'warning')
+                else:
+                    flash(f'Member {call_sign} added, but failed to send password reset email. Send a new reset from the dashboard.', 'warning')
             else:
                 flash(f'Member {call_sign} added successfully! Note: No email provided - member will need admin assistance to set password.', 'warning')
             
             cursor.close()
             conn.close()
-            return redirect(url_for('dashboard'))
-        except MySQLdb.IntegrityError as e:
+            return redirect(url_for('portal.dashboard'))
+        except DuplicateMember:
             flash('Call sign or email already exists.', 'danger')
             cursor.close()
             conn.close()
     
-    return render_template('add_member.html')
+    return render_template('add_member.html', renewal_methods=RENEWAL_METHODS)
 
-@app.route('/admin/delete-member/<int:user_id>', methods=['POST'])
+@bp.route('/admin/delete-member/<int:user_id>', methods=['POST'])
 @login_required
 @admin_required
 def delete_member(user_id):
     if user_id == current_user.id:
         flash('You cannot delete your own account.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('portal.dashboard'))
     
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM members WHERE id = %s", (user_id,))
+    cursor = dict_cursor(conn)
+    record_changes(cursor, [user_id], 'delete')
+    member_repository(cursor).delete([user_id])
     conn.commit()
     cursor.close()
     conn.close()
+    roster.invalidate()
+    revoke_member_sessions(user_id)
+    cards.discard(user_id)
     
     flash('Member deleted successfully.', 'success')
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('portal.dashboard'))
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False)
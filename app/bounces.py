@@ -0,0 +1,209 @@
+"""
+Bounce and delivery status notification (DSN) handling.
+
+Bounces are read one message at a time from an mbox, a Maildir or a
+directory of .eml files (scripts/process_bounces.py). Only the first
+BOUNCE_MAX_BYTES of each message are parsed: the delivery-status part of a
+DSN comes before the returned copy of the original message, so large
+bounces never have to be read in full.
+
+Failed recipients are counted per address in the email_bounces table.
+An address is marked undeliverable after BOUNCE_HARD_LIMIT permanent
+failures (5.x.x) or BOUNCE_SOFT_LIMIT transient failures the remote server
+gave up on (4.x.x). The web app and the expiration checker skip
+undeliverable addresses and flag them to administrators. The flag is
+cleared by an administrator, or goes away when the member's email changes.
+
+Outgoing mail uses BOUNCE_ADDRESS (when set) as the envelope sender so
+bounces are delivered to the mailbox this pipeline reads.
+"""
+
+import os
+import re
+from collections import namedtuple
+from email import policy
+from email.parser import BytesParser
+from email.utils import parseaddr
+
+from db import get_db_connection, dict_cursor
+
+BOUNCE_ADDRESS = os.getenv('BOUNCE_ADDRESS') or None
+BOUNCE_HARD_LIMIT = int(os.getenv('BOUNCE_HARD_LIMIT', 1))
+BOUNCE_SOFT_LIMIT = int(os.getenv('BOUNCE_SOFT_LIMIT', 3))
+BOUNCE_MAX_BYTES = int(os.getenv('BOUNCE_MAX_BYTES', 65536))
+
+Bounce = namedtuple('Bounce', 'email status diagnostic')
+Bounce.__doc__ = """One failed recipient reported by a bounce message.
+
+email      -- lower-case recipient address
+status     -- enhanced status code, e.g. '5.1.1'
+diagnostic -- remote server's explanation, if given
+"""
+
+_STATUS_CODE = re.compile(r'\b([245]\.\d{1,3}\.\d{1,3})\b')
+
+_parser = BytesParser(policy=policy.compat32)
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def is_hard(status):
+    return status.startswith('5')
+
+
+def _recipient(value):
+    """Address from a Final-Recipient / Original-Recipient field ('rfc822; a@b')"""
+    if not value:
+        return ''
+    _, _, address = str(value).rpartition(';')
+    return normalize_email(parseaddr(address)[1] or address)
+
+
+def _dsn_bounces(msg):
+    """Failed recipients from a multipart/report delivery-status message"""
+    bounces = []
+    for part in msg.walk():
+        if part.get_content_type() != 'message/delivery-status':
+            continue
+        payload = part.get_payload()
+        if not isinstance(payload, list):
+            continue
+        # First block holds per-message fields; the rest are one per recipient
+        for fields in payload[1:]:
+            action = (fields.get('Action') or '').strip().lower()
+            if action != 'failed':
+                # delayed / delivered / relayed / expanded are not bounces
+                continue
+            email = _recipient(fields.get('Final-Recipient') or fields.get('Original-Recipient'))
+            if not email:
+                continue
+            match = _STATUS_CODE.search(fields.get('Status') or '')
+            status = match.group(1) if match else '5.0.0'
+            diagnostic = ' '.join((fields.get('Diagnostic-Code') or '').split())
+            bounces.append(Bounce(email, status, diagnostic[:255]))
+    return bounces
+
+
+def _legacy_bounces(msg):
+    """Failed recipients from non-DSN bounces that name them in X-Failed-Recipients"""
+    header = msg.get('X-Failed-Recipients')
+    if not header:
+        return []
+    body = msg.get_payload(0) if msg.is_multipart() else msg
+    text = body.get_payload(decode=True) or b''
+    match = _STATUS_CODE.search(text.decode('utf-8', 'replace'))
+    status = match.group(1) if match else '5.0.0'
+    return [Bounce(normalize_email(address), status, '')
+            for address in header.split(',') if normalize_email(address)]
+
+
+def parse_bounce(data):
+    """Parse the leading bytes of a message; return its failed recipients (may be empty)"""
+    msg = _parser.parsebytes(data)
+    if msg.get_content_type() == 'multipart/report':
+        bounces = _dsn_bounces(msg)
+        if bounces:
+            return bounces
+    return _legacy_bounces(msg)
+
+
+def read_bounce(fp):
+    """Parse a message from a binary file object, reading at most BOUNCE_MAX_BYTES"""
+    return parse_bounce(fp.read(BOUNCE_MAX_BYTES))
+
+
+def record_bounces(cursor, bounces):
+    """Add a batch of bounces to email_bounces; returns the number of addresses touched"""
+    totals = {}
+    for bounce in bounces:
+        hard, soft, _, _ = totals.get(bounce.email, (0, 0, None, None))
+        if is_hard(bounce.status):
+            hard += 1
+        else:
+            soft += 1
+        totals[bounce.email] = (hard, soft, bounce.status, bounce.diagnostic)
+    if not totals:
+        return 0
+
+    rows = [
+        (email, hard, soft, status, diagnostic,
+         int(hard >= BOUNCE_HARD_LIMIT or soft >= BOUNCE_SOFT_LIMIT))
+        for email, (hard, soft, status, diagnostic) in totals.items()
+    ]
+    # undeliverable is assigned first, from the stored counts plus this batch's:
+    # MariaDB applies assignments left to right, SQLite (db.py) from the old
+    # row, and both then agree
+    cursor.executemany(f"""
+        INSERT INTO email_bounces
+            (email, hard_bounces, soft_bounces, last_status, last_diagnostic, undeliverable)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            undeliverable = undeliverable OR hard_bounces + VALUES(hard_bounces) >= {BOUNCE_HARD_LIMIT}
+                                          OR soft_bounces + VALUES(soft_bounces) >= {BOUNCE_SOFT_LIMIT},
+            hard_bounces = hard_bounces + VALUES(hard_bounces),
+            soft_bounces = soft_bounces + VALUES(soft_bounces),
+            last_status = VALUES(last_status),
+            last_diagnostic = VALUES(last_diagnostic),
+            last_bounced_at = CURRENT_TIMESTAMP
+    """, rows)
+    return len(rows)
+
+
+def undeliverable_addresses():
+    """Set of lower-case addresses currently marked undeliverable"""
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    cursor.execute("SELECT email FROM email_bounces WHERE undeliverable = 1")
+    addresses = {normalize_email(row['email']) for row in cursor.fetchall()}
+    cursor.close()
+    conn.close()
+    return addresses
+
+
+def undeliverable_version():
+    """(count, latest bounce) of undeliverable addresses; changes whenever the set does"""
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    cursor.execute("""
+        SELECT COUNT(*) AS count, MAX(last_bounced_at) AS last_bounced_at
+        FROM email_bounces WHERE undeliverable = 1
+    """)
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return row['count'], row['last_bounced_at']
+
+
+def get_bounce(email):
+    """The email_bounces row for an address, or None"""
+    email = normalize_email(email)
+    if not email:
+        return None
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    cursor.execute("""
+        SELECT email, hard_bounces, soft_bounces, last_status, last_diagnostic,
+               first_bounced_at, last_bounced_at, undeliverable
+        FROM email_bounces WHERE email = %s
+    """, (email,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return row
+
+
+def is_undeliverable(email):
+    bounce = get_bounce(email)
+    return bool(bounce and bounce['undeliverable'])
+
+
+def clear_bounces(email):
+    """Forget an address's bounce history so mail is sent to it again"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM email_bounces WHERE email = %s", (normalize_email(email),))
+    conn.commit()
+    cursor.close()
+    conn.close()
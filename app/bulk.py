@@ -0,0 +1,164 @@
+"""
+Bulk admin actions.
+
+Bulk email sends (update notices, password resets) run on a background
+thread that reuses one SMTP connection for the whole batch instead of
+opening a session per member. Progress is written to the bulk_jobs table
+every BULK_PROGRESS_EVERY messages, and at least every
+BULK_HEARTBEAT_SECONDS, so any web worker can answer the dashboard's
+progress polls.
+
+A job whose worker died stops writing progress. When it is read after
+BULK_JOB_STALE_SECONDS without a write it is marked 'abandoned', so the
+progress bar stops polling instead of waiting forever.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bounces import BOUNCE_ADDRESS
+from db import get_db_connection, dict_cursor
+from logs import current_context, log_context, log_mail
+from tenants import activate, current_tenant
+
+BULK_PROGRESS_EVERY = int(os.getenv('BULK_PROGRESS_EVERY', 10))
+BULK_MAX_IDS = int(os.getenv('BULK_MAX_IDS', 5000))
+BULK_HEARTBEAT_SECONDS = float(os.getenv('BULK_HEARTBEAT_SECONDS', 30))
+BULK_JOB_STALE_SECONDS = int(os.getenv('BULK_JOB_STALE_SECONDS', 600))
+
+# Keep the stored error list within the TEXT column
+MAX_ERRORS_STORED = 50
+
+logger = logging.getLogger('portal.bulk')
+
+
+def parse_ids(values):
+    """Return a sorted list of unique positive integer ids, or None if invalid"""
+    if not isinstance(values, list) or not values or len(values) > BULK_MAX_IDS:
+        return None
+    try:
+        ids = {int(value) for value in values}
+    except (TypeError, ValueError):
+        return None
+    if any(id <= 0 for id in ids):
+        return None
+    return sorted(ids)
+
+
+def create_job(action, requested_by, total):
+    conn = get_db_connection(track_writes=False)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO bulk_jobs (action, requested_by, total, status)
+        VALUES (%s, %s, %s, 'running')
+    """, (action, requested_by, total))
+    job_id = cursor.lastrowid
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return job_id
+
+
+def update_job(job_id, processed, failed, errors, status='running'):
+    conn = get_db_connection(track_writes=False)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE bulk_jobs
+        SET processed = %s, failed = %s, errors = %s, status = %s, updated_at = NOW(),
+            finished_at = CASE WHEN %s = 'running' THEN NULL ELSE NOW() END
+        WHERE id = %s
+    """, (processed, failed, '\n'.join(errors[:MAX_ERRORS_STORED]), status, status, job_id))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def get_job(job_id):
+    conn = get_db_connection(track_writes=False)
+    cursor = dict_cursor(conn)
+    # A running job with no progress for this long lost its worker
+    cursor.execute("""
+        UPDATE bulk_jobs SET status = 'abandoned', finished_at = NOW()
+        WHERE id = %s AND status = 'running' AND updated_at < %s
+    """, (job_id, datetime.now() - timedelta(seconds=BULK_JOB_STALE_SECONDS)))
+    if cursor.rowcount:
+        logger.warning("Bulk job abandoned", extra={'event': 'bulk_job', 'job_id': job_id})
+    conn.commit()
+    cursor.execute("""
+        SELECT id, action, requested_by, total, processed, failed, status, errors,
+               created_at, finished_at
+        FROM bulk_jobs WHERE id = %s
+    """, (job_id,))
+    job = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return job
+
+
+def _close_smtp(smtp):
+    try:
+        smtp.__exit__(None, None, None)
+    except Exception:
+        pass
+
+
+def send_messages(app, mail, job_id, messages, tenant, request_id=None, sampled=None):
+    """Send messages over a shared SMTP connection, recording progress on the job"""
+    with app.app_context(), activate(tenant), log_context(request_id, sampled):
+        processed = failed = 0
+        errors = []
+        smtp = None
+        job_start = last_update = time.perf_counter()
+        try:
+            for msg in messages:
+                start = time.perf_counter()
+                try:
+                    if smtp is None:
+                        smtp = mail.connect().__enter__()
+                    smtp.send(msg, envelope_from=BOUNCE_ADDRESS)
+                    log_mail(msg.recipients, msg.subject, time.perf_counter() - start,
+                             sample=True, job_id=job_id)
+                except Exception as e:
+                    log_mail(msg.recipients, msg.subject, time.perf_counter() - start,
+                             error=e, job_id=job_id)
+                    failed += 1
+                    errors.append(f"{', '.join(msg.recipients)}: {e}")
+                    # The connection may be unusable after an error; reopen for the next message
+                    if smtp is not None:
+                        _close_smtp(smtp)
+                        smtp = None
+                processed += 1
+                if (processed % BULK_PROGRESS_EVERY == 0
+                        or time.perf_counter() - last_update >= BULK_HEARTBEAT_SECONDS):
+                    update_job(job_id, processed, failed, errors)
+                    last_update = time.perf_counter()
+        except Exception as e:
+            logger.exception("Bulk job aborted", extra={'event': 'bulk_job', 'job_id': job_id,
+                                                         'processed': processed, 'failed': failed})
+            errors.append(f"Job aborted: {e}")
+            update_job(job_id, processed, failed, errors, status='failed')
+            raise
+        finally:
+            if smtp is not None:
+                _close_smtp(smtp)
+        update_job(job_id, processed, failed, errors, status='done')
+        logger.info("Bulk job finished", extra={
+            'event': 'bulk_job', 'job_id': job_id, 'processed': processed, 'failed': failed,
+            'duration_ms': round((time.perf_counter() - job_start) * 1000, 2),
+        })
+
+
+def start_email_job(app, mail, action, requested_by, messages):
+    """Record a job and send its messages on a background thread; returns the job id"""
+    job_id = create_job(action, requested_by, len(messages))
+    # Threads don't inherit the request's context; pass the tenant and request id explicitly
+    context = current_context()
+    thread = threading.Thread(target=send_messages,
+                              args=(app, mail, job_id, messages, current_tenant(),
+                                    context and context.request_id, context and context.sampled),
+                              name=f"bulk-job-{job_id}", daemon=True)
+    thread.start()
+    return job_id
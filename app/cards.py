@@ -0,0 +1,262 @@
+"""
+Membership cards.
+
+Members download a wallet-size card (PDF, or PNG for phones) as proof of
+membership from their profile page. A card shows the tenant, call sign,
+name, member type, join year and the date the paid term ends, all taken
+from the members row, so a card only changes when the row does.
+
+Cards are rendered once per members row_version and kept on disk
+(CARD_CACHE_DIR, one directory per tenant, shared by all workers when the
+directory is a shared volume). Writes are atomic, and older versions of a
+member's card are removed when a new one is written. A "download your
+card" announcement to the whole club therefore costs one render per
+member; the rest is served from disk:
+
+- The profile page links to a card with its version (?v=<ETag>), so an
+  edit or renewal changes the URL. Browsers keep a versioned card for
+  CARD_MAX_AGE seconds; any other card URL is sent no-cache and
+  revalidated with its ETag, which is answered 304 after a single
+  primary-key lookup.
+- Concurrent requests for the same card wait for one render.
+- Each worker renders at most CARD_RENDER_CONCURRENCY cards at once. A
+  request that cannot start its render within CARD_RENDER_WAIT seconds
+  gets 503 with Retry-After instead of tying up a worker thread.
+- scripts/render_cards.py renders every member's card ahead of such an
+  announcement.
+
+The PDF is drawn with reportlab in its built-in Helvetica, so no font is
+embedded and a card is a few kilobytes. The PNG is drawn with Pillow
+(installed with reportlab) from the same layout, using reportlab's bundled
+Vera fonts, so no rendering backend beyond the PDF export's is needed.
+
+Configuration (environment):
+- CARD_CACHE_DIR: where rendered cards are kept (default: a directory in
+  the system temp directory)
+- CARD_MAX_AGE: seconds browsers may reuse a versioned card without asking (default 86400)
+- CARD_RENDER_CONCURRENCY: renders at once per worker (default 2)
+- CARD_RENDER_WAIT: seconds a request waits to start a render (default 5)
+- CARD_PNG_DPI: PNG resolution (default 300)
+"""
+
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from io import BytesIO
+
+from expiration_policy import EXPIRATION_TERM_ANCHOR, EXPIRATION_TERM_END, evaluate_member
+from tenants import PerTenant, current_tenant
+
+CARD_CACHE_DIR = os.getenv('CARD_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'irc_membership_cards')
+CARD_MAX_AGE = int(os.getenv('CARD_MAX_AGE', 86400))
+CARD_RENDER_CONCURRENCY = int(os.getenv('CARD_RENDER_CONCURRENCY', 2))
+CARD_RENDER_WAIT = float(os.getenv('CARD_RENDER_WAIT', 5))
+CARD_PNG_DPI = int(os.getenv('CARD_PNG_DPI', 300))
+
+# Bump when the layout changes, so cached cards are re-rendered
+CARD_LAYOUT_VERSION = 1
+
+CARD_FORMATS = {'pdf': 'application/pdf', 'png': 'image/png'}
+
+# Columns a card is drawn from; row_version changes whenever any of them does
+CARD_COLUMNS = 'id, call_sign, name, member_type, paid_thru, created_at, row_version, updated_at'
+
+# ID-1 (credit card) size in points
+CARD_WIDTH = 243
+CARD_HEIGHT = 153
+
+_BLUE = (0x00, 0x66, 0xcc)
+_DARK = (0x21, 0x25, 0x29)
+_GREY = (0x6c, 0x75, 0x7d)
+_WHITE = (0xff, 0xff, 0xff)
+
+# Layout items, in points from the top left; a Text's y is its baseline and
+# text wider than max_width is cut short with an ellipsis
+Rect = namedtuple('Rect', 'x y width height colour')
+Text = namedtuple('Text', 'x y text bold size colour max_width')
+
+
+class CardBusy(Exception):
+    """No render slot came free within CARD_RENDER_WAIT"""
+
+
+def card_member(cursor, member_id):
+    """The members row a card is drawn from, or None"""
+    cursor.execute(f"SELECT {CARD_COLUMNS} FROM members WHERE id = %s", (member_id,))
+    return cursor.fetchone()
+
+
+def _tenant_fingerprint(tenant):
+    """Changes when tenant settings printed on the card, or the term policy, change"""
+    key = repr((CARD_LAYOUT_VERSION, tenant.name, tenant.short_name, tenant.app_url,
+                EXPIRATION_TERM_ANCHOR, EXPIRATION_TERM_END, CARD_PNG_DPI))
+    return hashlib.sha1(key.encode()).hexdigest()[:8]
+
+
+def card_etag(member, tenant=None):
+    """Strong ETag for a member's card (either format; the URL tells them apart)"""
+    tenant = tenant or current_tenant()
+    return f"{member['id']}-{member['row_version']}-{_tenant_fingerprint(tenant)}"
+
+
+def card_layout(member, tenant):
+    """Everything drawn on `member`'s card"""
+    term_end = evaluate_member(member).term_end
+    created_at = member['created_at']
+    since = f"Member since {created_at.year}" if hasattr(created_at, 'year') else ''
+    return [
+        Rect(0, 0, CARD_WIDTH, 40, _BLUE),
+        Text(12, 18, tenant.name, True, 10, _WHITE, CARD_WIDTH - 24),
+        Text(12, 32, 'MEMBERSHIP CARD', False, 7, _WHITE, CARD_WIDTH - 24),
+        Text(12, 68, member['call_sign'] or '', True, 22, _DARK, CARD_WIDTH - 24),
+        Text(12, 86, member['name'] or '', False, 11, _DARK, CARD_WIDTH - 24),
+        Text(12, 102, ' · '.join(filter(None, [member['member_type'], since])), False, 8, _GREY,
+             CARD_WIDTH - 24),
+        Text(12, 122, f"Valid through {term_end:%B %d, %Y}" if term_end else 'Dues not on record',
+             True, 9, _BLUE if term_end else _GREY, CARD_WIDTH - 24),
+        Rect(0, CARD_HEIGHT - 18, CARD_WIDTH, 18, (0xf0, 0xf0, 0xf0)),
+        Text(12, CARD_HEIGHT - 6, f"Member #{member['id']}", False, 7, _GREY, 80),
+        Text(96, CARD_HEIGHT - 6, tenant.app_url.split('://')[-1], False, 7, _GREY, CARD_WIDTH - 108),
+    ]
+
+
+def _font_file(bold):
+    import reportlab
+    return os.path.join(os.path.dirname(reportlab.__file__), 'fonts', 'VeraBd.ttf' if bold else 'Vera.ttf')
+
+
+def _fit(text, width_of, max_width):
+    """`text`, shortened with an ellipsis until width_of(text) fits"""
+    if width_of(text) <= max_width:
+        return text
+    while text and width_of(text + '…') > max_width:
+        text = text[:-1]
+    return text + '…'
+
+
+def render_pdf(layout):
+    from reportlab.lib.colors import Color
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=(CARD_WIDTH, CARD_HEIGHT), pageCompression=1)
+    pdf.setTitle('Membership Card')
+    for item in layout:
+        colour = Color(*(c / 255 for c in item.colour))
+        if isinstance(item, Rect):
+            pdf.setFillColor(colour)
+            pdf.rect(item.x, CARD_HEIGHT - item.y - item.height, item.width, item.height, stroke=0, fill=1)
+        else:
+            font = 'Helvetica-Bold' if item.bold else 'Helvetica'
+            text = _fit(item.text, lambda s: pdfmetrics.stringWidth(s, font, item.size), item.max_width)
+            pdf.setFillColor(colour)
+            pdf.setFont(font, item.size)
+            pdf.drawString(item.x, CARD_HEIGHT - item.y, text)
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def render_png(layout, dpi=CARD_PNG_DPI):
+    from PIL import Image, ImageDraw, ImageFont
+
+    scale = dpi / 72
+    image = Image.new('RGB', (round(CARD_WIDTH * scale), round(CARD_HEIGHT * scale)), _WHITE)
+    draw = ImageDraw.Draw(image)
+    for item in layout:
+        if isinstance(item, Rect):
+            draw.rectangle([item.x * scale, item.y * scale,
+                            (item.x + item.width) * scale - 1, (item.y + item.height) * scale - 1],
+                           fill=item.colour)
+        else:
+            font = ImageFont.truetype(_font_file(item.bold), round(item.size * scale))
+            text = _fit(item.text, lambda s: draw.textlength(s, font=font), item.max_width * scale)
+            draw.text((item.x * scale, item.y * scale), text, font=font, fill=item.colour, anchor='ls')
+    buffer = BytesIO()
+    image.save(buffer, 'PNG', optimize=True, dpi=(dpi, dpi))
+    return buffer.getvalue()
+
+
+RENDERERS = {'pdf': render_pdf, 'png': render_png}
+
+
+class CardCache:
+    """Rendered cards for one tenant, on disk"""
+
+    def __init__(self, directory=None, concurrency=CARD_RENDER_CONCURRENCY):
+        self.tenant = current_tenant()
+        self.directory = directory or os.path.join(CARD_CACHE_DIR, self.tenant.key)
+        self._renders = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def path(self, member, fmt):
+        return os.path.join(self.directory, f"{card_etag(member, self.tenant)}.{fmt}")
+
+    def card(self, member, fmt, wait=CARD_RENDER_WAIT):
+        """Path of `member`'s card in format `fmt`, rendering it if needed.
+
+        Raises CardBusy if no render slot frees up within `wait` seconds
+        (None waits as long as it takes).
+        """
+        path = self.path(member, fmt)
+        if os.path.exists(path):
+            return path
+        wait = -1 if wait is None else wait
+        # One render per card: later requests wait for the first
+        with self._lock:
+            key_lock = self._pending.setdefault(path, threading.Lock())
+        try:
+            if not key_lock.acquire(timeout=wait):
+                raise CardBusy()
+            try:
+                if not os.path.exists(path):
+                    if not self._renders.acquire(timeout=None if wait < 0 else wait):
+                        raise CardBusy()
+                    try:
+                        self._write(member, fmt, path)
+                    finally:
+                        self._renders.release()
+            finally:
+                key_lock.release()
+        finally:
+            with self._lock:
+                if not key_lock.locked():
+                    self._pending.pop(path, None)
+        return path
+
+    def _write(self, member, fmt, path):
+        data = RENDERERS[fmt](card_layout(member, self.tenant))
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._remove_old(member, fmt, path)
+
+    def _remove_old(self, member, fmt, keep):
+        for old in glob.glob(os.path.join(self.directory, f"{member['id']}-*.{fmt}")):
+            if old != keep:
+                try:
+                    os.remove(old)
+                except FileNotFoundError:
+                    pass  # another worker got there first
+
+    def discard(self, member_id):
+        """Remove every cached card of a member (e.g. when the member is deleted)"""
+        for old in glob.glob(os.path.join(self.directory, f"{member_id}-*.*")):
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+
+cards = PerTenant(CardCache)
@@ -0,0 +1,366 @@
+"""
+Roster change feed.
+
+Other club systems (repeater coordination, mailing lists) mirror the
+roster from an ordered feed of member changes instead of polling full
+exports. Every write to a member (profile edit, new member, deletion,
+renewal, bulk action, expiration status change) appends an event with the
+member's new state to member_changes, in the same transaction as the write.
+
+Cursor: each event's id. Ids are handed out from the single row in
+change_feed_state, which each writer locks (by updating it) until it
+commits, so events become visible in id order and a consumer that has
+read up to id N never later sees an event below N. Ids increase but are
+not contiguous (a rolled-back write leaves a gap).
+
+Consumers are rows in feed_consumers, added with scripts/change_feed.py:
+- Pull: GET /api/changes?cursor=N with "Authorization: Bearer <token>"
+  returns up to `limit` events after N and the cursor to send next. With
+  wait=S (up to CHANGE_FEED_MAX_WAIT) the request is held until an event
+  arrives or S seconds pass (long-poll). Waiting requests check for new
+  events through one shared, throttled MAX(id) lookup per worker and hold
+  no database connection, but each holds one of the worker's WEB_THREADS
+  request threads. At most CHANGE_FEED_MAX_WAITERS wait at once per worker
+  (never all of its threads; by default half of them, so none on a
+  single-threaded worker, where wait= is a plain poll). Later ones are
+  answered immediately.
+- Push: consumers with a webhook URL are sent batches of up to
+  WEBHOOK_BATCH_SIZE events by deliver_webhooks(), which the scheduler
+  worker runs every minute. Each POST is signed (X-Portal-Signature:
+  t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<body>" with the consumer's
+  secret>). A consumer's position only advances on a 2xx, so delivery is
+  at least once and in order; failures back off exponentially from
+  WEBHOOK_RETRY_BASE to WEBHOOK_RETRY_MAX seconds.
+
+Events are full snapshots (never diffs), so applying one twice is
+harmless. They are kept CHANGE_FEED_RETENTION_DAYS, but never deleted
+before every active webhook consumer has them; a pull cursor older than
+the retained events gets 410 and must resync from an export.
+
+Requires database/add_change_feed.sql.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import date, datetime
+
+from db import get_db_connection, dict_cursor
+from tenants import PerTenant, current_tenant
+
+CHANGE_FEED_RETENTION_DAYS = int(os.getenv('CHANGE_FEED_RETENTION_DAYS', 90))
+CHANGE_FEED_PAGE_SIZE = int(os.getenv('CHANGE_FEED_PAGE_SIZE', 500))
+CHANGE_FEED_MAX_WAIT = float(os.getenv('CHANGE_FEED_MAX_WAIT', 25))
+CHANGE_FEED_POLL_INTERVAL = float(os.getenv('CHANGE_FEED_POLL_INTERVAL', 1))
+# Request threads per web worker, as the server is started with (e.g. gunicorn --threads)
+WEB_THREADS = int(os.getenv('WEB_THREADS') or 1)
+# A waiting long-poll holds a request thread, so leave some for page traffic
+CHANGE_FEED_MAX_WAITERS = min(int(os.getenv('CHANGE_FEED_MAX_WAITERS') or WEB_THREADS // 2), WEB_THREADS - 1)
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', 100))
+WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', 10))
+WEBHOOK_RETRY_BASE = int(os.getenv('WEBHOOK_RETRY_BASE', 60))
+WEBHOOK_RETRY_MAX = int(os.getenv('WEBHOOK_RETRY_MAX', 3600))
+WEBHOOK_MAX_SECONDS = float(os.getenv('WEBHOOK_MAX_SECONDS', 45))
+
+OPS = ('insert', 'update', 'delete')
+
+# Member fields published in events; passwords and admin comments never leave the portal
+FEED_COLUMNS = ('id', 'call_sign', 'name', 'email', 'primary_rep', 'rep_call', 'address', 'city',
+                'state', 'zip', 'telephone', 'member_type', 'paid_thru', 'expiration_status',
+                'row_version', 'created_at', 'updated_at')
+
+logger = logging.getLogger('portal.changes')
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _row_dict(columns, row):
+    return row if isinstance(row, dict) else dict(zip(columns, row))
+
+
+def record_changes(cursor, member_ids, op):
+    """Append `op` events for `member_ids` in the caller's transaction.
+
+    Call after the members rows are inserted or updated, but before they
+    are deleted (a delete event carries the id and call sign). The feed
+    counter stays locked until the caller commits or rolls back, so call
+    it as the last statement before commit. Works with plain and dict
+    cursors. Returns the number of events recorded.
+    """
+    if op not in OPS:
+        raise ValueError(f"Unknown change op: {op}")
+    member_ids = sorted(set(member_ids))
+    if not member_ids:
+        return 0
+
+    placeholders = ', '.join(['%s'] * len(member_ids))
+    columns = ('id', 'call_sign') if op == 'delete' else FEED_COLUMNS
+    cursor.execute(f"SELECT {', '.join(columns)} FROM members WHERE id IN ({placeholders}) ORDER BY id",
+                   member_ids)
+    members = [_row_dict(columns, row) for row in cursor.fetchall()]
+    if not members:
+        return 0
+
+    # Reserve ids; the UPDATE's row lock is held until the caller's commit
+    cursor.execute("UPDATE change_feed_state SET last_id = last_id + %s WHERE id = 1", (len(members),))
+    cursor.execute("SELECT last_id FROM change_feed_state WHERE id = 1")
+    row = cursor.fetchone()
+    if row is None:
+        raise RuntimeError("change_feed_state is empty; apply database/add_change_feed.sql")
+    first_id = _row_dict(('last_id',), row)['last_id'] - len(members) + 1
+    cursor.executemany("""
+        INSERT INTO member_changes (id, member_id, op, payload)
+        VALUES (%s, %s, %s, %s)
+    """, [(first_id + i, member['id'], op, json.dumps(member, default=_json_value))
+          for i, member in enumerate(members)])
+    return len(members)
+
+
+def read_changes(cursor, after, limit):
+    """Events after cursor `after`, oldest first (dict cursor)"""
+    cursor.execute("""
+        SELECT id, member_id, op, payload, created_at
+        FROM member_changes
+        WHERE id > %s
+        ORDER BY id
+        LIMIT %s
+    """, (after, limit))
+    return [{
+        'cursor': row['id'],
+        'op': row['op'],
+        'member_id': row['member_id'],
+        'changed_at': _json_value(row['created_at']),
+        'member': json.loads(row['payload']),
+    } for row in cursor.fetchall()]
+
+
+def pruned_through(cursor):
+    """Highest event id deleted by retention (dict cursor)"""
+    cursor.execute("SELECT pruned_through FROM change_feed_state WHERE id = 1")
+    row = cursor.fetchone()
+    return row['pruned_through'] if row else 0
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def authenticate(token):
+    """The active consumer holding API `token`, or None"""
+    if not token:
+        return None
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    try:
+        cursor.execute("SELECT id, name FROM feed_consumers WHERE token_hash = %s AND active = 1",
+                       (hash_token(token),))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+class FeedWatcher:
+    """Latest event id for long-polling requests, looked up at most once per poll interval"""
+
+    def __init__(self, poll_interval=CHANGE_FEED_POLL_INTERVAL, max_waiters=CHANGE_FEED_MAX_WAITERS):
+        self.poll_interval = poll_interval
+        self.max_waiters = max_waiters
+        self._lock = threading.Lock()
+        self._latest = 0
+        self._checked_at = 0.0
+        self._waiters = 0
+
+    def latest(self):
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.poll_interval:
+                conn = get_db_connection(read_only=True)
+                cursor = dict_cursor(conn)
+                try:
+                    cursor.execute("SELECT COALESCE(MAX(id), 0) AS latest FROM member_changes")
+                    self._latest = int(cursor.fetchone()['latest'])
+                finally:
+                    cursor.close()
+                    conn.close()
+                self._checked_at = time.monotonic()
+            return self._latest
+
+    def wait(self, after, timeout):
+        """Wait up to `timeout` seconds for an event after `after`; True if one arrived"""
+        with self._lock:
+            if self._waiters >= self.max_waiters:
+                return False
+            self._waiters += 1
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                if self.latest() > after:
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(self.poll_interval, remaining))
+        finally:
+            with self._lock:
+                self._waiters -= 1
+
+
+watcher = PerTenant(FeedWatcher)
+
+
+def poll_changes(after, limit=100, wait=0):
+    """(body, status) for GET /api/changes"""
+    limit = max(1, min(limit, CHANGE_FEED_PAGE_SIZE))
+    wait = max(0.0, min(wait, CHANGE_FEED_MAX_WAIT))
+    for attempt in range(2):
+        # No pooled connection is held while waiting
+        conn = get_db_connection(read_only=True)
+        cursor = dict_cursor(conn)
+        try:
+            oldest = pruned_through(cursor)
+            if after < oldest:
+                return {'error': 'Cursor is older than the retained changes; resync from an export',
+                        'resync': True, 'oldest_cursor': oldest}, 410
+            changes = read_changes(cursor, after, limit)
+        finally:
+            cursor.close()
+            conn.close()
+        if changes or attempt or not wait or not watcher.wait(after, wait):
+            break
+    return {'changes': changes,
+            'cursor': changes[-1]['cursor'] if changes else after,
+            'more': len(changes) == limit}, 200
+
+
+# Webhooks
+
+def sign(secret, body, timestamp):
+    """X-Portal-Signature header value for `body` (bytes)"""
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def post_batch(consumer, changes):
+    """POST one batch to a consumer's webhook; returns None on a 2xx, else the error"""
+    body = json.dumps({'tenant': current_tenant().key, 'changes': changes,
+                       'cursor': changes[-1]['cursor']}, separators=(',', ':')).encode()
+    request = urllib.request.Request(consumer['webhook_url'], data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'User-Agent': 'irc-membership-portal/webhook',
+        'X-Portal-Delivery': f"{consumer['name']}:{changes[0]['cursor']}-{changes[-1]['cursor']}",
+        'X-Portal-Signature': sign(consumer['webhook_secret'] or '', body, int(time.time())),
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=WEBHOOK_TIMEOUT) as response:
+            response.read(1024)
+            return None if 200 <= response.status < 300 else f"HTTP {response.status}"
+    except urllib.error.HTTPError as e:
+        return f"HTTP {e.code}"
+    except (urllib.error.URLError, OSError) as e:
+        return str(getattr(e, 'reason', e))[:500]
+
+
+def retry_delay(failures):
+    """Seconds to wait after the `failures`-th consecutive failure"""
+    return min(WEBHOOK_RETRY_BASE * 2 ** max(failures - 1, 0), WEBHOOK_RETRY_MAX)
+
+
+def _deliver_to(cursor, conn, consumer, deadline):
+    """Send a consumer its pending events, batch by batch; returns (batches, events, error)"""
+    through = consumer['delivered_through']
+    batches = events = 0
+    while time.monotonic() < deadline:
+        changes = read_changes(cursor, through, WEBHOOK_BATCH_SIZE)
+        conn.commit()  # end the read snapshot so the next batch sees new events
+        if not changes:
+            break
+        error = post_batch(consumer, changes)
+        if error:
+            failures = consumer['failures'] + 1
+            cursor.execute("""
+                UPDATE feed_consumers
+                SET failures = %s, last_error = %s, next_attempt_at = NOW() + INTERVAL %s SECOND
+                WHERE id = %s
+            """, (failures, error, retry_delay(failures), consumer['id']))
+            conn.commit()
+            return batches, events, error
+        through = changes[-1]['cursor']
+        batches += 1
+        events += len(changes)
+        cursor.execute("""
+            UPDATE feed_consumers
+            SET delivered_through = %s, failures = 0, last_error = NULL, next_attempt_at = NULL,
+                last_delivery_at = NOW()
+            WHERE id = %s
+        """, (through, consumer['id']))
+        conn.commit()
+        consumer['failures'] = 0
+        if len(changes) < WEBHOOK_BATCH_SIZE:
+            break
+    return batches, events, None
+
+
+def prune_changes(cursor):
+    """Delete events past retention that every active webhook consumer has; returns how many"""
+    cursor.execute("""
+        SELECT MAX(id) AS through FROM member_changes
+        WHERE created_at < NOW() - INTERVAL %s DAY
+    """, (CHANGE_FEED_RETENTION_DAYS,))
+    through = cursor.fetchone()['through']
+    cursor.execute("""
+        SELECT MIN(delivered_through) AS through FROM feed_consumers
+        WHERE active = 1 AND webhook_url IS NOT NULL
+    """)
+    needed = cursor.fetchone()['through']
+    if through is None:
+        return 0
+    if needed is not None:
+        through = min(through, needed)
+    cursor.execute("DELETE FROM member_changes WHERE id <= %s", (through,))
+    removed = cursor.rowcount
+    cursor.execute("UPDATE change_feed_state SET pruned_through = GREATEST(pruned_through, %s) WHERE id = 1",
+                   (through,))
+    return removed
+
+
+def deliver_webhooks(max_seconds=WEBHOOK_MAX_SECONDS):
+    """Deliver pending events to the current tenant's webhook consumers, then prune the feed"""
+    deadline = time.monotonic() + max_seconds
+    conn = get_db_connection(track_writes=False)
+    cursor = dict_cursor(conn)
+    try:
+        cursor.execute("""
+            SELECT id, name, webhook_url, webhook_secret, delivered_through, failures
+            FROM feed_consumers
+            WHERE active = 1 AND webhook_url IS NOT NULL
+            AND (next_attempt_at IS NULL OR next_attempt_at <= NOW())
+            ORDER BY id
+        """)
+        consumers = cursor.fetchall()
+        conn.commit()
+        for consumer in consumers:
+            start = time.perf_counter()
+            batches, events, error = _deliver_to(cursor, conn, consumer, deadline)
+            if batches or error:
+                log = logger.warning if error else logger.info
+                log("Webhook delivery to %s", consumer['name'], extra={
+                    'event': 'webhook_delivery', 'consumer': consumer['name'], 'batches': batches,
+                    'events': events, 'error': error,
+                    'duration_ms': round((time.perf_counter() - start) * 1000, 2)})
+        removed = prune_changes(cursor)
+        conn.commit()
+        if removed:
+            logger.info("Pruned %d change events", removed, extra={'event': 'change_feed_prune', 'removed': removed})
+    finally:
+        cursor.close()
+        conn.close()
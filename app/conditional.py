@@ -0,0 +1,85 @@
+"""
+Conditional GET for rendered pages.
+
+Pages get an ETag built from the versions of the rows they show (members
+row_version, the roster snapshot version, email_bounces state), the viewer
+and the day, plus a Last-Modified from the rows' timestamps. When the
+browser's If-None-Match / If-Modified-Since still match, the route answers
+304 right after its version lookup, skipping its queries and the render.
+
+Responses are marked "private, no-cache": browsers keep the page but
+revalidate on every navigation, and shared caches never store it.
+
+Pages with pending flash messages are always rendered in full, since the
+messages are not part of the version.
+"""
+
+import hashlib
+import os
+from datetime import date, datetime, time
+
+from flask import current_app, g, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+from tenants import current_tenant
+
+# Per app: changes whenever a deployment changes the templates
+_template_fingerprints = {}
+
+
+def template_fingerprint(app):
+    """Hash of the template files' names, sizes and modification times"""
+    fingerprint = _template_fingerprints.get(app.name)
+    if fingerprint is None:
+        digest = hashlib.sha1()
+        folder = os.path.join(app.root_path, app.template_folder)
+        for root, _, files in sorted(os.walk(folder)):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        fingerprint = _template_fingerprints[app.name] = digest.hexdigest()[:12]
+    return fingerprint
+
+
+def page_etag(*parts):
+    """ETag value for a page rendered from `parts` for this viewer and tenant, today"""
+    viewer = (current_user.get_id(), getattr(current_user, 'username', None), getattr(current_user, 'is_admin', None))
+    key = repr((parts, viewer, current_tenant().key, date.today(), template_fingerprint(current_app)))
+    return hashlib.sha1(key.encode()).hexdigest()[:24]
+
+
+def page_last_modified(*timestamps):
+    """Latest of the rows' timestamps, and never before midnight (statuses change by date)"""
+    return max([datetime.combine(date.today(), time.min)] + [t for t in timestamps if t is not None])
+
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the browser's copy of this page is current, else None.
+
+    Either way the validators are remembered and added to the full response
+    by add_validators().
+    """
+    if session.get('_flashes'):
+        g.page_validators = None
+        return None
+    g.page_validators = (etag, last_modified)
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return current_app.response_class(status=304)
+
+
+def add_validators(response):
+    """after_request hook: ETag, Last-Modified and Cache-Control for conditional pages"""
+    validators = g.get('page_validators', False)
+    if validators is False or response.status_code not in (200, 304):
+        return response
+    if validators is None:
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+    etag, last_modified = validators
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
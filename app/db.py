@@ -0,0 +1,617 @@
+"""
+Database connection helpers for the membership portal.
+
+Connections are handed out from a small per-process pool so that routes
+which open and close a connection per request do not pay a fresh MySQL
+handshake every time. Routes keep the existing pattern of calling
+conn.close() when done; for pooled connections that returns the
+connection to the pool instead of closing the socket.
+
+Read-only queries can be routed to replicas with
+get_db_connection(read_only=True). Replicas are listed in
+DB_REPLICA_HOSTS (comma separated host[:port]); a replica is only used
+while its replication lag is within DB_REPLICA_MAX_LAG seconds, otherwise
+the query falls back to the primary. After a browser session commits a
+write it reads from the primary for DB_STICKY_SECONDS so members always
+see their own changes.
+
+Each tenant (see tenants.py) has its own router and pools; the router for
+the current request or script run is selected with use_router(), and
+get_db_connection() always connects through it.
+
+Cursors from pooled connections time each statement and tag it with the
+current request id (see logs.py).
+
+DB_BACKEND=sqlite runs the portal on SQLite instead, for local development
+and tests without a database server: each database name becomes a file in
+SQLITE_DIR (or, with SQLITE_DIR=:memory:, an in-memory database shared by
+the process's connections), created from SQLITE_SCHEMA on first use.
+Cursors take the same %s placeholders and return the same Python types as
+MySQLdb's. The MariaDB SQL the portal uses is translated or provided:
+- ON DUPLICATE KEY UPDATE ... VALUES(col) runs as SQLite's
+  ON CONFLICT DO UPDATE ... excluded.col (assignments see the old row, as
+  in standard SQL, so do not rely on MariaDB's left-to-right order)
+- NOW() +/- INTERVAL n DAY/HOUR/MINUTE/SECOND, CURRENT_TIMESTAMP and
+  START TRANSACTION [READ ONLY]
+- NOW([precision]), CURDATE(), GREATEST(), YEAR(), and GET_LOCK() /
+  RELEASE_LOCK(), which lock within this process only (run one scheduler
+  worker per SQLite database)
+Members and password reset tokens are reached through repositories.py,
+which has SQL for both. mysqlclient is only imported for MariaDB, so
+SQLite mode runs without it.
+"""
+
+import itertools
+from contextvars import ContextVar
+from datetime import date, datetime
+from decimal import Decimal
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from flask import has_request_context, session
+
+from logs import record_sql, sql_comment
+
+# Database configuration
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'db'),
+    'user': os.getenv('DB_USER', 'membership_user'),
+    'passwd': os.getenv('DB_PASSWORD', ''),
+    'db': os.getenv('DB_NAME', 'membership_db'),
+    'charset': 'utf8mb4'
+}
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+
+# Read replica configuration
+DB_REPLICA_HOSTS = [h.strip() for h in os.getenv('DB_REPLICA_HOSTS', '').split(',') if h.strip()]
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 5))
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_LAG_CHECK_INTERVAL', 10))
+# Treat a server that is not replicating as current (local stand-in for a replica)
+DB_REPLICA_ALLOW_STANDALONE = os.getenv('DB_REPLICA_ALLOW_STANDALONE', '0') == '1'
+DB_STICKY_SECONDS = float(os.getenv('DB_STICKY_SECONDS', 30))
+
+# "mariadb", or "sqlite" for local development and tests
+DB_BACKEND = os.getenv('DB_BACKEND', 'mariadb')
+_CHECKOUT_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+SQLITE_DIR = os.getenv('SQLITE_DIR') or os.path.join(_CHECKOUT_DIR, 'instance')
+SQLITE_SCHEMA = os.getenv('SQLITE_SCHEMA') or os.path.join(_CHECKOUT_DIR, 'database', 'sqlite_schema.sql')
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 5))
+
+
+def _mysqldb():
+    """MySQLdb, imported on first use so that DB_BACKEND=sqlite does not need mysqlclient"""
+    import MySQLdb
+    import MySQLdb.cursors
+    return MySQLdb
+
+
+class TracedCursor:
+    """Cursor wrapper that times statements and prefixes them with the request id
+
+    executemany() statements are timed but not prefixed (see executemany).
+    """
+
+    __slots__ = ('_cursor',)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @property
+    def dialect(self):
+        """SQL dialect of the database: "mariadb" or "sqlite" (see repositories.py)"""
+        return getattr(self._cursor, 'dialect', 'mariadb')
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(sql_comment() + query, args)
+        finally:
+            record_sql(query, time.perf_counter() - start)
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        try:
+            # Unprefixed: MySQLdb only batches rows into one multi-row INSERT
+            # when the statement starts with INSERT or REPLACE
+            return self._cursor.executemany(query, args)
+        finally:
+            record_sql(query, time.perf_counter() - start)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class PooledConnection:
+    """Thin wrapper that returns the underlying connection to its pool on close()"""
+
+    def __init__(self, pool, conn, track_writes=True):
+        self._pool = pool
+        self._conn = conn
+        self._track_writes = track_writes
+
+    def cursor(self, *args, **kwargs):
+        if self._conn is None:
+            raise self._pool.InterfaceError(0, 'Connection already returned to pool')
+        return TracedCursor(self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        self._conn.commit()
+        if self._track_writes and self._pool.on_commit is not None:
+            self._pool.on_commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise self._pool.InterfaceError(0, 'Connection already returned to pool')
+        return getattr(self._conn, name)
+
+
+class ConnectionPool:
+    """Fixed-size LIFO pool of MySQLdb connections.
+
+    The pool never blocks: when no idle connection is available a new one is
+    opened, and when the pool is full a released connection is closed. The
+    pool is reset after fork so worker processes never share sockets with
+    the master that preloaded the application.
+    """
+
+    @property
+    def Error(self):
+        return _mysqldb().Error
+
+    @property
+    def InterfaceError(self):
+        return _mysqldb().InterfaceError
+
+    def __init__(self, config, size=DB_POOL_SIZE, on_commit=None):
+        self.config = config
+        self.size = size
+        self.on_commit = on_commit
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=self.size)
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def _open(self):
+        return _mysqldb().connect(**self.config)
+
+    def connect(self, track_writes=True):
+        """Return a PooledConnection, reusing an idle connection if one is alive"""
+        self._check_pid()
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return PooledConnection(self, self._open(), track_writes)
+            try:
+                conn.ping()
+                return PooledConnection(self, conn, track_writes)
+            except self.Error:
+                self._discard(conn)
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding it if it is unusable or the pool is full"""
+        if self._pid != os.getpid():
+            return
+        try:
+            # Never hand out a connection with an open transaction
+            conn.rollback()
+        except self.Error:
+            self._discard(conn)
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self._discard(conn)
+
+    def warm(self, count=None):
+        """Open idle connections up front so the first requests skip the handshake"""
+        self._check_pid()
+        count = self.size if count is None else min(count, self.size)
+        opened = 0
+        while self._idle.qsize() < count:
+            try:
+                self._idle.put_nowait(self._open())
+            except queue.Full:
+                break
+            opened += 1
+        return opened
+
+    def clear(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except self.Error:
+            pass
+
+
+# SQLite stores dates as ISO text; these give MySQLdb's types back
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('DECIMAL', lambda value: Decimal(value.decode()))
+
+_SQLITE_PARAM = re.compile(r'%([s%])')
+_SQLITE_START_TRANSACTION = re.compile(r'^\s*START\s+TRANSACTION\b.*$', re.IGNORECASE | re.DOTALL)
+_SQLITE_UPSERT = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.IGNORECASE)
+_SQLITE_UPSERT_VALUE = re.compile(r'\bVALUES\((\w+)\)', re.IGNORECASE)
+_SQLITE_INTERVAL = re.compile(r'\b(NOW\(\d?\))\s*([+-])\s*INTERVAL\s+(%s|\d+)\s+(DAY|HOUR|MINUTE|SECOND)\b',
+                              re.IGNORECASE)
+_SQLITE_CURRENT_TIMESTAMP = re.compile(r'\bCURRENT_TIMESTAMP\b(?!\()', re.IGNORECASE)
+
+# GET_LOCK() names held in this process: (database, name) -> owning connection's locks
+_sqlite_locks = {}
+_sqlite_locks_guard = threading.Lock()
+
+
+def _year(value):
+    return None if value is None else int(str(value)[:4])
+
+
+def _now(precision=0):
+    timespec = 'seconds' if not precision else 'milliseconds' if precision <= 3 else 'microseconds'
+    return datetime.now().isoformat(' ', timespec)
+
+
+class _SQLiteLocks:
+    """GET_LOCK() and RELEASE_LOCK() for one SQLite connection, within this process"""
+
+    def __init__(self, database):
+        self.database = database
+
+    def get_lock(self, name, timeout):
+        key = (self.database, name)
+        deadline = time.monotonic() + max(timeout or 0, 0)
+        while True:
+            with _sqlite_locks_guard:
+                if _sqlite_locks.setdefault(key, self) is self:
+                    return 1
+            if time.monotonic() >= deadline:
+                return 0
+            time.sleep(0.05)
+
+    def release_lock(self, name):
+        key = (self.database, name)
+        with _sqlite_locks_guard:
+            owner = _sqlite_locks.get(key)
+            if owner is None:
+                return None
+            if owner is not self:
+                return 0
+            del _sqlite_locks[key]
+            return 1
+
+    def release_all(self):
+        """Locks die with their connection, as on MariaDB"""
+        with _sqlite_locks_guard:
+            for key in [key for key, owner in _sqlite_locks.items() if owner is self]:
+                del _sqlite_locks[key]
+
+
+# Expressions such as MAX(updated_at) have no declared type, so SQLite
+# returns them as text; MySQLdb would return a date or datetime
+_SQLITE_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_SQLITE_DATETIME = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d{1,6})?$')
+
+
+def _sqlite_value(value):
+    if isinstance(value, str):
+        if _SQLITE_DATETIME.match(value):
+            return datetime.fromisoformat(value)
+        if _SQLITE_DATE.match(value):
+            return date.fromisoformat(value)
+    return value
+
+
+def _tuple_row(cursor, row):
+    return tuple(_sqlite_value(value) for value in row)
+
+
+def _dict_row(cursor, row):
+    return {column[0]: _sqlite_value(value) for column, value in zip(cursor.description, row)}
+
+
+class SQLiteCursor:
+    """sqlite3 cursor that takes MySQLdb's %s placeholders"""
+
+    dialect = 'sqlite'
+
+    def __init__(self, cursor, dict_rows=False):
+        self._cursor = cursor
+        cursor.row_factory = _dict_row if dict_rows else _tuple_row
+
+    @staticmethod
+    def _translate(query, args):
+        if _SQLITE_START_TRANSACTION.match(query.split('*/')[-1]):
+            return 'BEGIN'
+        upsert = _SQLITE_UPSERT.split(query, maxsplit=1)
+        if len(upsert) == 2:
+            query = upsert[0] + 'ON CONFLICT DO UPDATE SET' + _SQLITE_UPSERT_VALUE.sub(r'excluded.\1', upsert[1])
+        query = _SQLITE_INTERVAL.sub(r"datetime(\1, '\2' || \3 || ' \4')", query)
+        query = _SQLITE_CURRENT_TIMESTAMP.sub('NOW()', query)
+        # Like MySQLdb, only a query with arguments is %-formatted
+        if args is None:
+            return query
+        return _SQLITE_PARAM.sub(lambda m: '?' if m.group(1) == 's' else '%', query)
+
+    def execute(self, query, args=None):
+        return self._cursor.execute(self._translate(query, args), () if args is None else args)
+
+    def executemany(self, query, args):
+        return self._cursor.executemany(self._translate(query, ()), args)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class SQLiteConnection:
+    """sqlite3 connection with the parts of MySQLdb's connection API the portal uses"""
+
+    dialect = 'sqlite'
+
+    def __init__(self, conn, locks):
+        self._conn = conn
+        self._locks = locks
+
+    def cursor(self, dict_rows=False):
+        return SQLiteCursor(self._conn.cursor(), dict_rows=dict_rows)
+
+    def ping(self):
+        self._conn.execute('SELECT 1')
+
+    def close(self):
+        self._locks.release_all()
+        self._conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def sqlite_path(config):
+    """SQLite database for a DB_CONFIG-style config: a file named after the database, or :memory:"""
+    if SQLITE_DIR == ':memory:':
+        return ':memory:'
+    return os.path.join(SQLITE_DIR, f"{config['db']}.sqlite3")
+
+
+class SQLitePool(ConnectionPool):
+    """ConnectionPool of sqlite3 connections to one database (DB_BACKEND=sqlite)"""
+
+    Error = sqlite3.Error
+    InterfaceError = sqlite3.InterfaceError
+
+    def __init__(self, config, size=DB_POOL_SIZE, on_commit=None, schema=SQLITE_SCHEMA):
+        if sqlite3.sqlite_version_info < (3, 35):
+            # ON CONFLICT DO UPDATE without a conflict target
+            raise RuntimeError(f"DB_BACKEND=sqlite needs SQLite 3.35 or later, not {sqlite3.sqlite_version}")
+        self.path = sqlite_path(config)
+        if self.path == ':memory:':
+            # Shared by every connection to the same name; kept alive by _keep
+            self._target = f"file:{config['db']}?mode=memory&cache=shared"
+        else:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._target = f"file:{self.path}"
+        self.schema = schema
+        self._keep = None
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        super().__init__(config, size, on_commit)
+
+    def _open(self):
+        conn = sqlite3.connect(self._target, uri=True, timeout=SQLITE_BUSY_TIMEOUT,
+                               detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        locks = _SQLiteLocks(self._target)
+        conn.create_function('NOW', -1, _now)
+        conn.create_function('CURDATE', 0, lambda: date.today().isoformat())
+        conn.create_function('GREATEST', -1, max)
+        conn.create_function('YEAR', 1, _year)
+        conn.create_function('GET_LOCK', 2, locks.get_lock)
+        conn.create_function('RELEASE_LOCK', 1, locks.release_lock)
+        conn.execute('PRAGMA foreign_keys = ON')
+        if not self._schema_ready:
+            self._create_schema(conn)
+        return SQLiteConnection(conn, locks)
+
+    def _create_schema(self, conn):
+        """Create the tables from the schema file if this database has none yet"""
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            if self.path == ':memory:' and self._keep is None:
+                # An in-memory database lasts as long as one connection to it is open
+                self._keep = sqlite3.connect(self._target, uri=True, check_same_thread=False)
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'members'").fetchone() is None:
+                with open(self.schema) as f:
+                    conn.executescript(f.read())
+            if self.path != ':memory:':
+                # Readers do not block the writer
+                conn.execute('PRAGMA journal_mode = WAL')
+            self._schema_ready = True
+
+
+def replica_config(host, base=None):
+    """Build connection settings for a replica given as host[:port]"""
+    config = dict(DB_CONFIG if base is None else base)
+    if ':' in host:
+        host, port = host.rsplit(':', 1)
+        config['port'] = int(port)
+    config['host'] = host
+    # Guard against a read-only route accidentally issuing a write
+    config['init_command'] = 'SET SESSION TRANSACTION READ ONLY'
+    return config
+
+
+class Replica:
+    """A replica pool plus its most recently measured replication lag"""
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.lag = None
+        self.checked_at = 0.0
+        self._measuring = threading.Lock()
+
+    def is_usable(self, max_lag, interval):
+        """Return True if the replica's lag is known and within max_lag.
+
+        The lag is re-measured at most once per interval; while one thread
+        measures, others use the previous value instead of waiting.
+        """
+        if time.monotonic() - self.checked_at >= interval and self._measuring.acquire(blocking=False):
+            try:
+                self.lag = self.measure_lag()
+                self.checked_at = time.monotonic()
+            finally:
+                self._measuring.release()
+        return self.lag is not None and self.lag <= max_lag
+
+    def measure_lag(self):
+        """Return Seconds_Behind_Master, or None if replication is broken or unreachable"""
+        try:
+            conn = self.pool.connect()
+            try:
+                cursor = dict_cursor(conn)
+                cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+                cursor.close()
+            finally:
+                conn.close()
+        except self.pool.Error:
+            return None
+        if status is None:
+            return 0 if DB_REPLICA_ALLOW_STANDALONE else None
+        return status['Seconds_Behind_Master']
+
+    def mark_down(self):
+        self.lag = None
+        self.checked_at = time.monotonic()
+
+
+def mark_session_sticky():
+    """Pin the current logged-in session to the primary after it writes.
+
+    Anonymous requests (failed logins, password reset requests) are not
+    pinned, so they do not create or rewrite a server-side session.
+    """
+    if has_request_context() and '_user_id' in session:
+        session['db_sticky_until'] = time.time() + DB_STICKY_SECONDS
+
+
+def session_is_sticky():
+    return has_request_context() and session.get('db_sticky_until', 0) > time.time()
+
+
+class ReplicaRouter:
+    """Route read-only connections to healthy replicas, everything else to the primary"""
+
+    def __init__(self, primary, replicas=(), max_lag=DB_REPLICA_MAX_LAG,
+                 check_interval=DB_REPLICA_LAG_CHECK_INTERVAL):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+
+    def connect(self, read_only=False, track_writes=True):
+        if read_only and self.replicas and not session_is_sticky():
+            start = next(self._next)
+            for offset in range(len(self.replicas)):
+                replica = self.replicas[(start + offset) % len(self.replicas)]
+                if not replica.is_usable(self.max_lag, self.check_interval):
+                    continue
+                try:
+                    return replica.pool.connect()
+                except replica.pool.Error:
+                    replica.mark_down()
+        return self.primary.connect(track_writes)
+
+    def warm(self, count=None):
+        opened = self.primary.warm(count)
+        for replica in self.replicas:
+            opened += replica.pool.warm(count)
+        return opened
+
+
+def make_router(config, replica_hosts=(), pool_size=DB_POOL_SIZE, backend=DB_BACKEND):
+    """Build a router with its own primary and replica pools for one database"""
+    if backend == 'sqlite':
+        # No server and no replicas: every connection goes to the local database
+        return ReplicaRouter(SQLitePool(config, pool_size, on_commit=mark_session_sticky))
+    if backend != 'mariadb':
+        raise ValueError(f"Unknown DB_BACKEND: {backend}")
+    primary = ConnectionPool(config, pool_size, on_commit=mark_session_sticky)
+    return ReplicaRouter(primary, [
+        Replica(host, ConnectionPool(replica_config(host, config), pool_size)) for host in replica_hosts
+    ])
+
+
+router = make_router(DB_CONFIG, DB_REPLICA_HOSTS)
+pool = router.primary
+
+# Router for the tenant being served; None means the default router above
+_active_router = ContextVar('db_router', default=None)
+
+
+def current_router():
+    return _active_router.get() or router
+
+
+def use_router(active):
+    """Send get_db_connection() to `active` in this context; returns a token for reset_router()"""
+    return _active_router.set(active)
+
+
+def reset_router(token):
+    _active_router.reset(token)
+
+
+def get_db_connection(read_only=False, track_writes=True):
+    """Get a database connection from the pool.
+
+    Pass read_only=True for queries that can tolerate a few seconds of
+    replication lag; they are served by a replica when one is healthy.
+    Pass track_writes=False for bookkeeping writes (sessions, job progress)
+    that should not pin the browser session to the primary.
+    """
+    return current_router().connect(read_only, track_writes)
+
+
+def dict_cursor(conn):
+    """Create a cursor that returns results as dictionaries"""
+    if getattr(conn, 'dialect', 'mariadb') == 'sqlite':
+        return conn.cursor(dict_rows=True)
+    cursor = conn.cursor(_mysqldb().cursors.DictCursor)
+    return cursor
@@ -0,0 +1,343 @@
+"""
+Duplicate member and data-quality scanner.
+
+add_member() only stops exact call sign and email clashes, so the roster
+collects near-duplicates: the same person under a new call sign, a typoed
+or plus-addressed email, "St. Joseph" next to "Saint Joseph". This module
+finds them without comparing every pair of members.
+
+Blocking: each member gets a few keys (normalised email, email user name,
+phone number, last name with first initial, zip with house number). Only
+members sharing a key are compared, and keys shared by more than
+DUPLICATE_MAX_BLOCK members (a shared office phone, a common name) are
+skipped, so the work grows roughly linearly with the roster.
+
+Scoring: each compared pair gets a score from 0 to 1 from name similarity
+(character-pair overlap, so a typo costs little) plus matching email,
+phone and address. Pairs scoring at least DUPLICATE_MIN_SCORE are
+reported as merge candidates with the reasons.
+
+Spellings: city and state values that normalise to the same place (case,
+punctuation, "St."/"Saint", state names, or a close misspelling of a more
+common city in the same state) are reported with the most common spelling
+as the suggestion.
+
+Results are cached per tenant until the roster version changes.
+"""
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+from difflib import SequenceMatcher
+from itertools import combinations
+
+from db import get_db_connection, dict_cursor
+from roster import roster
+from tenants import PerTenant
+
+DUPLICATE_MIN_SCORE = float(os.getenv('DUPLICATE_MIN_SCORE', 0.6))
+DUPLICATE_MAX_BLOCK = int(os.getenv('DUPLICATE_MAX_BLOCK', 50))
+
+SCAN_COLUMNS = ('id', 'call_sign', 'name', 'email', 'address', 'city', 'state', 'zip', 'telephone')
+
+Candidate = namedtuple('Candidate', 'score member other reasons')
+Candidate.__doc__ = """A probable duplicate pair.
+
+score   -- 0 to 1, higher is more likely the same person
+member  -- the older row (lower id), as a dict of SCAN_COLUMNS
+other   -- the newer row
+reasons -- what matched, e.g. ['same email', 'similar name']
+"""
+
+Spelling = namedtuple('Spelling', 'field state suggested variants')
+Spelling.__doc__ = """Inconsistent spellings of one city or state.
+
+field     -- 'city' or 'state'
+state     -- the state the cities are in (None for states)
+suggested -- the most common spelling
+variants  -- [(spelling, member count), ...], most common first
+"""
+
+ScanResult = namedtuple('ScanResult', 'candidates spellings members comparisons skipped_blocks seconds')
+
+# Words left out of name comparisons
+_NAME_NOISE = frozenset({'jr', 'sr', 'ii', 'iii', 'iv', 'mr', 'mrs', 'ms', 'dr'})
+
+# Abbreviations expanded before comparing city names
+_CITY_WORDS = {'st': 'saint', 'ste': 'sainte', 'ft': 'fort', 'mt': 'mount', 'n': 'north', 's': 'south',
+               'e': 'east', 'w': 'west'}
+
+_STATES = {
+    'alabama': 'AL', 'alaska': 'AK', 'arizona': 'AZ', 'arkansas': 'AR', 'california': 'CA',
+    'colorado': 'CO', 'connecticut': 'CT', 'delaware': 'DE', 'district of columbia': 'DC',
+    'florida': 'FL', 'georgia': 'GA', 'hawaii': 'HI', 'idaho': 'ID', 'illinois': 'IL',
+    'indiana': 'IN', 'iowa': 'IA', 'kansas': 'KS', 'kentucky': 'KY', 'louisiana': 'LA',
+    'maine': 'ME', 'maryland': 'MD', 'massachusetts': 'MA', 'michigan': 'MI', 'minnesota': 'MN',
+    'mississippi': 'MS', 'missouri': 'MO', 'montana': 'MT', 'nebraska': 'NE', 'nevada': 'NV',
+    'new hampshire': 'NH', 'new jersey': 'NJ', 'new mexico': 'NM', 'new york': 'NY',
+    'north carolina': 'NC', 'north dakota': 'ND', 'ohio': 'OH', 'oklahoma': 'OK', 'oregon': 'OR',
+    'pennsylvania': 'PA', 'rhode island': 'RI', 'south carolina': 'SC', 'south dakota': 'SD',
+    'tennessee': 'TN', 'texas': 'TX', 'utah': 'UT', 'vermont': 'VT', 'virginia': 'VA',
+    'washington': 'WA', 'west virginia': 'WV', 'wisconsin': 'WI', 'wyoming': 'WY',
+    'ind': 'IN', 'ill': 'IL', 'mich': 'MI', 'ky': 'KY',
+}
+
+
+_WORD = re.compile(r'[a-z0-9]+')
+_NON_DIGIT = re.compile(r'\D')
+_HOUSE_NUMBER = re.compile(r'\s*(\d+)')
+
+
+def _fold(value):
+    """Lower case, accents removed, punctuation as spaces, single-spaced"""
+    value = value or ''
+    if not value.isascii():
+        value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode()
+    return ' '.join(_WORD.findall(value.lower()))
+
+
+def normalise_email(email):
+    """Lower case, without +tags, and without dots for Gmail; None if not an address"""
+    local, _, domain = (email or '').strip().lower().partition('@')
+    if not local or not domain:
+        return None
+    local = local.split('+', 1)[0]
+    if domain in ('gmail.com', 'googlemail.com'):
+        local, domain = local.replace('.', ''), 'gmail.com'
+    return f"{local}@{domain}"
+
+
+def normalise_phone(telephone):
+    """The last ten digits, or None if there are fewer than seven"""
+    digits = _NON_DIGIT.sub('', telephone or '')[-10:]
+    return digits if len(digits) >= 7 else None
+
+
+def name_tokens(name):
+    return [token for token in _fold(name).split() if token not in _NAME_NOISE]
+
+
+def normalise_state(state):
+    folded = _fold(state)
+    return _STATES.get(folded, folded.upper() or None)
+
+
+def city_key(city):
+    return ' '.join(_CITY_WORDS.get(word, word) for word in _fold(city).split()) or None
+
+
+def _address_key(address, zip_code):
+    """(5-digit zip, house number) or None"""
+    zip5 = _NON_DIGIT.sub('', zip_code or '')[:5]
+    number = _HOUSE_NUMBER.match(address or '')
+    return (zip5, number.group(1)) if len(zip5) == 5 and number else None
+
+
+def _bigrams(text):
+    """Set of character pairs in `text`, padded so first and last letters count"""
+    if not text:
+        return frozenset()
+    padded = f" {text} "
+    return frozenset(padded[i:i + 2] for i in range(len(padded) - 1))
+
+
+def _dice(a, b):
+    """Dice coefficient of two bigram sets: 1 for identical text, about 0.9 for one typo"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class _Prepared:
+    """A member row with its normalised fields, computed once per scan.
+
+    Bigrams are only built for members that share a block with someone.
+    """
+
+    __slots__ = ('row', 'email', 'phone', 'tokens', 'address', '_grams')
+
+    def __init__(self, row):
+        self.row = row
+        self.email = normalise_email(row['email'])
+        self.phone = normalise_phone(row['telephone'])
+        self.tokens = name_tokens(row['name'])
+        self.address = _address_key(row['address'], row['zip'])
+        self._grams = None
+
+    def grams(self):
+        """(name bigrams, email bigrams)"""
+        if self._grams is None:
+            self._grams = (_bigrams(' '.join(sorted(self.tokens))), _bigrams(self.email))
+        return self._grams
+
+    def blocking_keys(self):
+        if self.email:
+            yield ('email', self.email)
+            yield ('user', self.email.split('@', 1)[0])
+        if self.phone:
+            yield ('phone', self.phone)
+        if len(self.tokens) >= 2:
+            yield ('name', self.tokens[-1], self.tokens[0][0])
+        if self.address:
+            yield ('address',) + self.address
+
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    matcher = SequenceMatcher(None, a, b)
+    # quick_ratio() is an upper bound; skip the full comparison when it cannot matter
+    return matcher.ratio() if matcher.quick_ratio() >= 0.6 else 0.0
+
+
+def score_pair(a, b):
+    """(score, reasons) for two prepared members"""
+    reasons = []
+    (a_name, a_email), (b_name, b_email) = a.grams(), b.grams()
+    name = _dice(a_name, b_name)
+    score = 0.4 * name
+    if name == 1.0:
+        reasons.append('same name')
+    elif name >= 0.8:
+        reasons.append('similar name')
+
+    if a.email and a.email == b.email:
+        score += 0.4
+        reasons.append('same email')
+    elif _dice(a_email, b_email) >= 0.85:
+        score += 0.25
+        reasons.append('similar email')
+
+    if a.phone and a.phone == b.phone:
+        score += 0.2
+        reasons.append('same phone')
+
+    if a.address and a.address == b.address:
+        if _similarity(_fold(a.row['address']), _fold(b.row['address'])) >= 0.8:
+            score += 0.2
+            reasons.append('same address')
+        else:
+            score += 0.05
+    return min(score, 1.0), reasons
+
+
+def find_duplicates(rows, min_score=DUPLICATE_MIN_SCORE, max_block=DUPLICATE_MAX_BLOCK):
+    """Merge candidates among `rows` (dicts with SCAN_COLUMNS), best first.
+
+    Returns (candidates, comparisons made, blocks skipped as too large).
+    """
+    prepared = [_Prepared(row) for row in rows]
+    blocks = defaultdict(list)
+    for member in prepared:
+        for key in member.blocking_keys():
+            blocks[key].append(member)
+
+    seen = set()
+    candidates = []
+    skipped = 0
+    for block in blocks.values():
+        if len(block) < 2:
+            continue
+        if len(block) > max_block:
+            skipped += 1
+            continue
+        for a, b in combinations(block, 2):
+            pair = (a.row['id'], b.row['id']) if a.row['id'] < b.row['id'] else (b.row['id'], a.row['id'])
+            if pair in seen:
+                continue
+            seen.add(pair)
+            score, reasons = score_pair(a, b)
+            if score >= min_score:
+                first, second = (a, b) if a.row['id'] < b.row['id'] else (b, a)
+                candidates.append(Candidate(round(score, 2), first.row, second.row, reasons))
+
+    candidates.sort(key=lambda c: (-c.score, c.member['id'], c.other['id']))
+    return candidates, len(seen), skipped
+
+
+def _spelling_groups(field, spellings_by_key, state=None):
+    results = []
+    for key, spellings in spellings_by_key.items():
+        if len(spellings) > 1:
+            variants = spellings.most_common()
+            results.append(Spelling(field, state, variants[0][0], variants))
+    return results
+
+
+def find_spelling_variants(rows, min_similarity=0.88):
+    """Cities and states spelled more than one way, most affected first"""
+    states = defaultdict(Counter)
+    cities = defaultdict(lambda: defaultdict(Counter))
+    for row in rows:
+        state = normalise_state(row['state'])
+        if state:
+            states[state][row['state'].strip()] += 1
+        key = city_key(row['city'])
+        if key:
+            cities[state][key][row['city'].strip()] += 1
+
+    results = _spelling_groups('state', states)
+    for state, by_key in cities.items():
+        # Fold close misspellings into the more common city, comparing only keys with the same first letter
+        keys = sorted(by_key, key=lambda k: -sum(by_key[k].values()))
+        by_letter = defaultdict(list)
+        for key in keys:
+            for common in by_letter[key[0]]:
+                if _similarity(key, common) >= min_similarity:
+                    by_key[common].update(by_key.pop(key))
+                    break
+            else:
+                by_letter[key[0]].append(key)
+        results.extend(_spelling_groups('city', by_key, state))
+
+    results.sort(key=lambda s: -sum(count for _, count in s.variants[1:]))
+    return results
+
+
+def scan(rows):
+    """Full data-quality scan of member rows"""
+    start = time.perf_counter()
+    rows = list(rows)
+    candidates, comparisons, skipped = find_duplicates(rows)
+    spellings = find_spelling_variants(rows)
+    return ScanResult(candidates, spellings, len(rows), comparisons, skipped, time.perf_counter() - start)
+
+
+def fetch_members(cursor):
+    cursor.execute(f"SELECT {', '.join(SCAN_COLUMNS)} FROM members")
+    return cursor.fetchall()
+
+
+class DuplicateScanner:
+    """Per-process scan result, recomputed when the roster version changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._result = None
+
+    def result(self):
+        version = roster.version
+        if self._result is not None and self._version == version:
+            return self._result
+        # One scan at a time; concurrent requests wait and reuse it
+        with self._lock:
+            if self._result is None or self._version != version:
+                conn = get_db_connection(read_only=True)
+                cursor = dict_cursor(conn)
+                try:
+                    rows = fetch_members(cursor)
+                finally:
+                    cursor.close()
+                    conn.close()
+                self._result = scan(rows)
+                self._version = version
+        return self._result
+
+
+scanner = PerTenant(DuplicateScanner)
@@ -0,0 +1,239 @@
+"""
+Email templates shared by the web app and the expiration checker.
+
+Each template is written once as plain text with $placeholders and compiled
+at import into string.Template objects for the subject, the plain-text body
+and an HTML body derived from the text. An EmailRenderer binds the values
+that are the same for every message in a run (portal URL, organisation,
+contact details) once, so rendering a message only substitutes the
+per-recipient fields. render_batch() renders many recipients of the same
+template in one call.
+
+Usage:
+    renderer = EmailRenderer()
+    email = renderer.render('update_notice', call_sign='W9ABC')
+    email.subject, email.text, email.html
+"""
+
+import html
+import os
+import re
+from collections import namedtuple
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from string import Template
+
+RenderedEmail = namedtuple('RenderedEmail', 'subject text html')
+
+HTML_LAYOUT = """<!DOCTYPE html>
+<html>
+<body style="font-family: Arial, Helvetica, sans-serif; font-size: 14px; color: #212529;">
+$body
+</body>
+</html>
+"""
+
+_URL_LINE = re.compile(r'^(?:https?://\S+|\$\{?\w*url\}?)$')
+
+
+def _text_to_html(text):
+    """Derive an HTML body from a plain-text template, keeping its placeholders"""
+    paragraphs = []
+    for paragraph in text.strip().split('\n\n'):
+        lines = []
+        for line in paragraph.split('\n'):
+            escaped = html.escape(line, quote=False)
+            if _URL_LINE.match(line.strip()):
+                url = escaped.strip()
+                escaped = f'<a href="{url}">{url}</a>'
+            lines.append(escaped)
+        paragraphs.append('<p>' + '<br>\n'.join(lines) + '</p>')
+    # Escape $ in the layout so only the body placeholder is substituted
+    return Template(HTML_LAYOUT).substitute(body='\n'.join(paragraphs))
+
+
+def _escape_dollars(value):
+    return str(value).replace('$', '$$')
+
+
+class EmailTemplate:
+    """A compiled subject, text body and HTML body"""
+
+    __slots__ = ('name', 'subject', 'text', 'html')
+
+    def __init__(self, name, subject, text, html_body=None):
+        self.name = name
+        self.subject = subject if isinstance(subject, Template) else Template(subject)
+        self.text = text if isinstance(text, Template) else Template(text)
+        self.html = html_body if isinstance(html_body, Template) else Template(_text_to_html(text))
+
+    def bind(self, static):
+        """Return a copy with the static context already substituted"""
+        text_static = {key: _escape_dollars(value) for key, value in static.items()}
+        html_static = {key: _escape_dollars(html.escape(str(value))) for key, value in static.items()}
+        return EmailTemplate(
+            self.name,
+            Template(self.subject.safe_substitute(text_static)),
+            Template(self.text.safe_substitute(text_static)),
+            Template(self.html.safe_substitute(html_static)),
+        )
+
+    def render(self, context):
+        escaped = {key: html.escape(str(value)) for key, value in context.items()}
+        return RenderedEmail(
+            self.subject.substitute(context),
+            self.text.substitute(context),
+            self.html.substitute(escaped),
+        )
+
+
+TEMPLATES = {}
+
+
+def register_template(name, subject, text):
+    TEMPLATES[name] = EmailTemplate(name, subject, text)
+
+
+register_template('password_reset', "Password Reset Request", """Hello $call_sign,
+
+You have requested to reset your password for the Ham Radio Club Membership Portal.
+
+Please click the link below to reset your password:
+$reset_url
+
+This link will expire in 24 hours.
+
+If you did not request this password reset, please ignore this email.
+
+73,
+Membership Portal Team
+""")
+
+register_template('update_notice', "Your $org_name membership record has been updated", """Hello $call_sign,
+
+This is a notification that your membership record with the $org_name has been reviewed and updated by an administrator.
+
+Please login to the membership portal to review your current information:
+$app_url
+
+If you have any questions about these changes, please contact us at $support_host
+
+73,
+$org_name
+Membership Portal Team
+""")
+
+register_template('membership_expired', "$org_short Membership Expired - $call_sign", """Hello $call_sign,
+
+This is a notification that your $org_name membership has EXPIRED.
+
+Your membership was paid through: $paid_thru
+Current year: $current_year
+
+To renew your membership and maintain your benefits, please contact $org_short regarding renewal and payment options.
+
+You can still access the membership portal to update your contact information at:
+$app_url
+
+If you have already renewed, please disregard this message. It may take a few days for the system to reflect your payment.
+
+For questions about your membership status or to renew:
+Website: $support_url
+Email: $support_email
+
+Thank you for your past support of the $org_name!
+
+73,
+$org_name
+Membership Team
+""")
+
+register_template('membership_expiring', "$org_short Membership Expiring Soon - $call_sign", """Hello $call_sign,
+
+This is a friendly reminder that your $org_name membership expires on $term_end.
+
+Your membership is paid through: $paid_thru
+Days remaining: $days_remaining
+
+To ensure uninterrupted membership, please renew before $term_end.
+
+For renewal information:
+Website: $support_url
+Email: $support_email
+
+You can access the membership portal at any time to update your information:
+$app_url
+
+Thank you for your continued support of the $org_name!
+
+73,
+$org_name
+Membership Team
+""")
+
+register_template('membership_active', "$org_short Membership Active - $call_sign", """Hello $call_sign,
+
+Thank you! Your $org_name membership is now ACTIVE.
+
+Your membership is paid through: $paid_thru
+
+You can access the membership portal at:
+$app_url
+
+If you have any questions, please contact us:
+Website: $support_url
+Email: $support_email
+
+Thank you for supporting the $org_name!
+
+73,
+$org_name
+Membership Team
+""")
+
+
+def default_static_context():
+    """Values shared by every message, from the environment"""
+    support_url = os.getenv('SUPPORT_URL', 'https://service-desk.ircinc.org')
+    return {
+        'app_url': os.getenv('APP_URL', 'http://localhost:5000'),
+        'org_name': os.getenv('ORG_NAME', 'Indiana Repeater Council'),
+        'org_short': os.getenv('ORG_SHORT_NAME', 'IRC'),
+        'support_url': support_url,
+        'support_host': support_url.split('://', 1)[-1],
+        'support_email': os.getenv('SUPPORT_EMAIL', 'chairman@ircinc.org'),
+    }
+
+
+class EmailRenderer:
+    """Renders registered templates with a fixed static context bound once"""
+
+    def __init__(self, static=None, templates=None):
+        self.static = default_static_context() if static is None else dict(static)
+        self.templates = TEMPLATES if templates is None else templates
+        self._bound = {}
+
+    def template(self, name):
+        bound = self._bound.get(name)
+        if bound is None:
+            bound = self._bound[name] = self.templates[name].bind(self.static)
+        return bound
+
+    def render(self, name, **context):
+        return self.template(name).render(context)
+
+    def render_batch(self, name, contexts):
+        """Render one message per context dict for the same template"""
+        render = self.template(name).render
+        return [render(context) for context in contexts]
+
+
+def to_mime(email, from_email, to_email):
+    """Build a multipart/alternative MIME message from a RenderedEmail"""
+    msg = MIMEMultipart('alternative')
+    msg['From'] = from_email
+    msg['To'] = to_email
+    msg['Subject'] = email.subject
+    msg.attach(MIMEText(email.text, 'plain'))
+    msg.attach(MIMEText(email.html, 'html'))
+    return msg
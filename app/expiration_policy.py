@@ -0,0 +1,140 @@
+"""
+Membership expiration policy.
+
+Works out a member's status from the date their term ends rather than from
+the year alone, so members move to "expiring" a configurable number of days
+before the end of their term instead of all at once on January 1.
+
+With the default calendar anchor every term ends on the same day, so each
+member's reminder windows are moved earlier by a fixed number of days
+between 0 and EXPIRATION_NOTICE_SPREAD - 1, taken from their member id.
+Reminders are then sent over that many days per window instead of all on
+one date, while paid_thru keeps its dues-year meaning and everyone still
+expires the day after EXPIRATION_TERM_END. The anniversary anchor spreads
+terms themselves across the year, but changes what paid_thru means: a term
+paid through year Y ends on the join anniversary in Y, up to eleven months
+before the end of the dues year the member paid for.
+
+Configuration (environment):
+- EXPIRATION_WINDOWS: reminder windows in days before the end of term,
+  comma separated (default "60,30,7"). A member enters "expiring" at the
+  largest window and gets a reminder as each smaller window is reached.
+- EXPIRATION_TERM_ANCHOR: "calendar" (default) ends every term on
+  EXPIRATION_TERM_END of the paid_thru year (an integer maintained from the
+  renewals ledger, see renewals.py); "anniversary" ends it on the
+  month and day the member joined (members.created_at), which spreads
+  renewals and notices across the year.
+- EXPIRATION_TERM_END: month-day a calendar term ends (default "12-31").
+- EXPIRATION_NOTICE_SPREAD: number of days each reminder window is spread
+  over (default 21; 1 sends every member's reminder on the same day). The
+  emails give the days actually remaining.
+
+Each evaluation also returns the next date the result will change, which
+the expiration checker stores in members.next_transition_date so a run only
+touches members whose next transition has arrived.
+"""
+
+import os
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+EXPIRATION_WINDOWS = sorted(
+    {int(days) for days in os.getenv('EXPIRATION_WINDOWS', '60,30,7').split(',') if days.strip()},
+    reverse=True
+)
+EXPIRATION_TERM_ANCHOR = os.getenv('EXPIRATION_TERM_ANCHOR', 'calendar')
+EXPIRATION_TERM_END = os.getenv('EXPIRATION_TERM_END', '12-31')
+EXPIRATION_NOTICE_SPREAD = max(1, int(os.getenv('EXPIRATION_NOTICE_SPREAD', 21)))
+
+STATUSES = ('active', 'expiring', 'expired', 'unknown')
+
+Evaluation = namedtuple('Evaluation', 'status window term_end next_transition')
+Evaluation.__doc__ = """Result of evaluating a member on a given day.
+
+status          -- 'active', 'expiring', 'expired' or 'unknown'
+window          -- reminder window (days) the member is in while expiring, else None
+term_end        -- last day of the paid term, or None if nothing has been paid
+next_transition -- first day status or window will differ, or None if it never will
+"""
+
+
+def _month_day(value):
+    month, day = value.split('-')
+    return int(month), int(day)
+
+
+def term_end_date(paid_year, anchor_date=None):
+    """Return the last day of the term paid through year `paid_year`, or None"""
+    if not paid_year:
+        return None
+
+    if EXPIRATION_TERM_ANCHOR == 'anniversary' and anchor_date is not None:
+        month, day = anchor_date.month, anchor_date.day
+    else:
+        month, day = _month_day(EXPIRATION_TERM_END)
+
+    try:
+        return date(paid_year, month, day)
+    except ValueError:
+        # Feb 29 anniversaries end on Feb 28 in non-leap years; reject bogus years
+        if month == 2 and day == 29 and 1 <= paid_year <= 9999:
+            return date(paid_year, 2, 28)
+        return None
+
+
+def notice_offset(member_id):
+    """Days a member's reminder windows open early (0 without a member id)"""
+    return member_id % EXPIRATION_NOTICE_SPREAD if member_id else 0
+
+
+def evaluate(paid_thru, today=None, anchor_date=None, windows=None, offset=0):
+    """Evaluate membership status for paid-through year `paid_thru` as of `today`.
+
+    Each window opens `offset` days earlier than its nominal number of days
+    before term end; the window reported is the nominal one.
+    """
+    today = today or date.today()
+    windows = EXPIRATION_WINDOWS if windows is None else sorted(windows, reverse=True)
+    if isinstance(anchor_date, datetime):
+        anchor_date = anchor_date.date()
+
+    term_end = term_end_date(paid_thru, anchor_date)
+    if term_end is None:
+        return Evaluation('unknown', None, None, None)
+
+    if today > term_end:
+        return Evaluation('expired', None, term_end, None)
+
+    days_left = (term_end - today).days
+    current = None
+    for window in windows:
+        if days_left <= window + offset:
+            current = window
+
+    # The next window boundary still ahead of today, else the day after term end
+    upcoming = [w for w in windows if w + offset < days_left]
+    if upcoming:
+        next_transition = term_end - timedelta(days=upcoming[0] + offset)
+    else:
+        next_transition = term_end + timedelta(days=1) if term_end < date.max else None
+
+    status = 'expiring' if current is not None else 'active'
+    return Evaluation(status, current, term_end, next_transition)
+
+
+def evaluate_member(member, today=None):
+    """Evaluate a members row (dict or roster record)"""
+    try:
+        anchor_date = member['created_at']
+    except (KeyError, AttributeError):
+        anchor_date = None
+    try:
+        offset = notice_offset(member['id'])
+    except (KeyError, AttributeError):
+        offset = 0
+    return evaluate(member['paid_thru'], today, anchor_date, offset=offset)
+
+
+def get_current_status(paid_thru, today=None):
+    """Determine current status based on paid_thru"""
+    return evaluate(paid_thru, today).status
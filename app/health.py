@@ -0,0 +1,174 @@
+"""
+Liveness and readiness checks.
+
+/healthz answers as long as the worker can serve a request; it touches no
+dependency. /readyz checks each tenant's primary database and the SMTP
+relay and reports how long each check took.
+
+Both are cheap enough to poll every few seconds. Results are cached per
+worker: the database check (taking a pooled connection, which pings it,
+and returning it) runs at most once per HEALTH_DB_TTL seconds, and the
+SMTP check (connect, EHLO, NOOP, QUIT; no login) at most once per
+HEALTH_SMTP_TTL seconds, in the background so a slow relay never delays
+the response. Replica lag comes from the router's own periodic
+measurement and does not add queries.
+
+The worker is ready when every tenant's primary database answers. SMTP is
+reported but only counts towards readiness with HEALTH_REQUIRE_SMTP=1.
+"""
+
+import os
+import smtplib
+import threading
+import time
+from collections import namedtuple
+
+HEALTH_DB_TTL = float(os.getenv('HEALTH_DB_TTL', 2))
+HEALTH_SMTP_TTL = float(os.getenv('HEALTH_SMTP_TTL', 60))
+HEALTH_SMTP_TIMEOUT = float(os.getenv('HEALTH_SMTP_TIMEOUT', 3))
+HEALTH_REQUIRE_SMTP = os.getenv('HEALTH_REQUIRE_SMTP', '0') == '1'
+
+# Served for any host, without selecting a tenant
+HEALTH_PATHS = ('/healthz', '/readyz')
+
+CheckResult = namedtuple('CheckResult', 'status latency error checked_at')
+CheckResult.__doc__ = """Outcome of one dependency check.
+
+status     -- 'ok', 'fail', or 'unknown' before the first check completes
+latency    -- seconds the check took, or None
+error      -- error message when status is 'fail'
+checked_at -- time.monotonic() when the check finished
+"""
+
+_NOT_CHECKED = CheckResult('unknown', None, None, None)
+
+_started = time.monotonic()
+
+
+class CachedCheck:
+    """A dependency probe whose result is reused for `ttl` seconds.
+
+    Only one thread runs the probe at a time; the others get the previous
+    result instead of waiting. With background=True the probe runs on its
+    own thread and callers always get the previous result.
+    """
+
+    def __init__(self, probe, ttl, background=False):
+        self.probe = probe
+        self.ttl = ttl
+        self.background = background
+        self._result = _NOT_CHECKED
+        self._running = threading.Lock()
+
+    def _due(self):
+        checked_at = self._result.checked_at
+        return checked_at is None or time.monotonic() - checked_at >= self.ttl
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self.probe()
+            self._result = CheckResult('ok', time.perf_counter() - start, None, time.monotonic())
+        except Exception as e:
+            self._result = CheckResult('fail', time.perf_counter() - start, str(e), time.monotonic())
+
+    def _run_and_release(self):
+        try:
+            self._run()
+        finally:
+            self._running.release()
+
+    def result(self):
+        if self._due() and self._running.acquire(blocking=False):
+            if self.background:
+                threading.Thread(target=self._run_and_release, name='health-check', daemon=True).start()
+            else:
+                self._run_and_release()
+        return self._result
+
+
+def describe(result):
+    """JSON-ready summary of a CheckResult"""
+    summary = {'status': result.status}
+    if result.latency is not None:
+        summary['latency_ms'] = round(result.latency * 1000, 2)
+    if result.checked_at is not None:
+        summary['age_s'] = round(time.monotonic() - result.checked_at, 1)
+    if result.error:
+        summary['error'] = result.error
+    return summary
+
+
+def db_probe(router):
+    """Take a connection from the primary pool (pinging it) and give it back"""
+    def probe():
+        conn = router.primary.connect(track_writes=False)
+        conn.close()
+    return probe
+
+
+def smtp_probe(host, port, timeout=HEALTH_SMTP_TIMEOUT):
+    """Connect to the relay and say hello, without logging in or sending"""
+    def probe():
+        with smtplib.SMTP(host, port, timeout=timeout) as server:
+            server.ehlo()
+            code, message = server.noop()
+            if code != 250:
+                raise smtplib.SMTPResponseException(code, message)
+    return probe
+
+
+_checks = {}
+_checks_lock = threading.Lock()
+
+
+def _check(key, factory):
+    check = _checks.get(key)
+    if check is None:
+        with _checks_lock:
+            check = _checks.get(key)
+            if check is None:
+                check = _checks[key] = factory()
+    return check
+
+
+def replica_status(router):
+    """Last measured lag of each replica (re-measured at most once per lag-check interval)"""
+    replicas = {}
+    for replica in router.replicas:
+        usable = replica.is_usable(router.max_lag, router.check_interval)
+        replicas[replica.name] = {
+            'status': 'ok' if usable else ('lagging' if replica.lag is not None else 'fail'),
+            'lag_s': replica.lag,
+        }
+    return replicas
+
+
+def liveness():
+    """(body, HTTP status) for /healthz"""
+    return {'status': 'ok', 'pid': os.getpid(), 'uptime_s': round(time.monotonic() - _started, 1)}, 200
+
+
+def readiness(app, tenants):
+    """(body, HTTP status) for /readyz: 200 when ready, 503 when not"""
+    ready = True
+    databases = {}
+    for tenant in tenants:
+        result = _check(('db', tenant.key),
+                        lambda: CachedCheck(db_probe(tenant.router), HEALTH_DB_TTL)).result()
+        ready = ready and result.status == 'ok'
+        databases[tenant.key] = describe(result)
+        if tenant.router.replicas:
+            databases[tenant.key]['replicas'] = replica_status(tenant.router)
+
+    smtp = _check('smtp', lambda: CachedCheck(
+        smtp_probe(app.config['MAIL_SERVER'], app.config['MAIL_PORT']), HEALTH_SMTP_TTL, background=True
+    )).result()
+    if HEALTH_REQUIRE_SMTP:
+        ready = ready and smtp.status == 'ok'
+
+    body = {
+        'status': 'ok' if ready else 'fail',
+        'checks': {'db': databases, 'smtp': describe(smtp)},
+    }
+    return body, 200 if ready else 503
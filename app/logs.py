@@ -0,0 +1,315 @@
+"""
+Structured logging for the portal and its scripts.
+
+Records are written as one JSON object per line (LOG_FORMAT=json, the
+default) or as plain text (LOG_FORMAT=text). Loggers hand records to a
+queue; a background listener thread does the formatting and the write, so
+logging never blocks a request on I/O.
+
+Every record carries the request id of the request (or script run) that
+produced it. The id comes from an incoming X-Request-ID header when it is
+well formed, otherwise a new one is generated, and it is returned in the
+X-Request-ID response header. SQL statements are prefixed with a
+/* request_id=... */ comment so the same id shows in the MariaDB process
+list and slow query log, and mail sends are logged with it.
+
+High-volume events (the per-request access log, per-statement SQL logs,
+individual bulk mail sends) are sampled per request at LOG_SAMPLE_RATE, so
+a sampled request is logged completely and an unsampled one not at all.
+Errors, requests slower than LOG_SLOW_MS and statements slower than
+LOG_SLOW_SQL_MS are always logged.
+
+Configuration (environment):
+- LOG_LEVEL: minimum level (default INFO; DEBUG adds per-statement SQL logs)
+- LOG_FORMAT: json (default) or text
+- LOG_FILE: append to this file instead of stderr
+- LOG_SAMPLE_RATE: fraction of requests whose routine events are logged (default 0.1)
+- LOG_SLOW_MS: requests at least this slow are always logged (default 500)
+- LOG_SLOW_SQL_MS: statements at least this slow are logged as warnings (default 100)
+- LOG_SQL_COMMENTS: prefix statements with the request id comment (default 1)
+  (not executemany() statements, which the driver must see start with INSERT)
+- LOG_QUIET_PATHS: paths (health checks) logged only when they fail or are slow
+  (default /healthz,/readyz)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_FILE = os.getenv('LOG_FILE') or None
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.1))
+LOG_SLOW_MS = float(os.getenv('LOG_SLOW_MS', 500))
+LOG_SLOW_SQL_MS = float(os.getenv('LOG_SLOW_SQL_MS', 100))
+LOG_SQL_COMMENTS = os.getenv('LOG_SQL_COMMENTS', '1') == '1'
+LOG_QUIET_PATHS = frozenset(p.strip() for p in os.getenv('LOG_QUIET_PATHS', '/healthz,/readyz').split(',') if p.strip())
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Accepted incoming ids; also keeps them safe inside a SQL comment
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+logger = logging.getLogger('portal')
+sql_logger = logging.getLogger('portal.sql')
+mail_logger = logging.getLogger('portal.mail')
+
+
+class LogContext:
+    """Request id, sampling decision and running totals for one request or run"""
+
+    __slots__ = ('request_id', 'sampled', 'sql_count', 'sql_seconds', 'mail_count')
+
+    def __init__(self, request_id=None, sampled=None):
+        self.request_id = request_id or new_request_id()
+        self.sampled = random.random() < LOG_SAMPLE_RATE if sampled is None else sampled
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.mail_count = 0
+
+
+_context = ContextVar('log_context', default=None)
+
+# name -> callable returning a value to add to every record (e.g. the tenant)
+_context_fields = {}
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def current_context():
+    return _context.get()
+
+
+def current_request_id():
+    context = _context.get()
+    return context.request_id if context else None
+
+
+def add_context_field(name, getter):
+    """Add getter()'s value to every record logged while it is not None"""
+    _context_fields[name] = getter
+
+
+@contextmanager
+def log_context(request_id=None, sampled=None):
+    """Give the records logged inside the block a request id (scripts, background jobs)"""
+    context = LogContext(request_id, sampled)
+    token = _context.set(context)
+    try:
+        yield context
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Stamp records with the request id and context fields, and drop unsampled events.
+
+    Runs in the logging thread, before the record is queued, because the
+    listener thread cannot see the caller's context.
+    """
+
+    def filter(self, record):
+        context = _context.get()
+        if getattr(record, 'sample', False) and context is not None and not context.sampled:
+            return False
+        record.request_id = context.request_id if context else None
+        for name, getter in _context_fields.items():
+            if not hasattr(record, name):
+                try:
+                    value = getter()
+                except Exception:
+                    value = None
+                if value is not None:
+                    setattr(record, name, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record with the message, context and extra fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and key != 'sample' and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with the request id and extra fields appended"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = '-'
+        line = super().format(record)
+        extra = ' '.join(f"{key}={value}" for key, value in record.__dict__.items()
+                         if key not in _STANDARD_ATTRS and key not in ('sample', 'request_id')
+                         and value is not None)
+        return f"{line} {extra}" if extra else line
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps extra fields and defers formatting to the listener"""
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+
+
+def _output_handler():
+    handler = logging.FileHandler(LOG_FILE) if LOG_FILE else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+    return handler
+
+
+def _start_listener(log_queue, handler):
+    global _listener
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=False)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def configure_logging(level=LOG_LEVEL):
+    """Route all logging through the queue to the JSON (or text) output; safe to call twice"""
+    root = logging.getLogger()
+    if any(isinstance(h, ContextQueueHandler) for h in root.handlers):
+        return
+    log_queue = queue.SimpleQueue()
+    queue_handler = ContextQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    handler = _output_handler()
+    _start_listener(log_queue, handler)
+    atexit.register(_stop_listener)
+    # The listener thread does not survive fork(); start a fresh one in each worker
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: _start_listener(log_queue, handler))
+
+
+def sql_comment():
+    """'/* request_id=... */ ' for the current request, or ''"""
+    if not LOG_SQL_COMMENTS:
+        return ''
+    context = _context.get()
+    return f"/* request_id={context.request_id} */ " if context else ''
+
+
+def _statement_summary(query):
+    return ' '.join(query.split())[:200]
+
+
+def record_sql(query, seconds):
+    """Account a statement to the current request and log it if slow (or at DEBUG)"""
+    context = _context.get()
+    if context is not None:
+        context.sql_count += 1
+        context.sql_seconds += seconds
+    duration_ms = round(seconds * 1000, 2)
+    if duration_ms >= LOG_SLOW_SQL_MS:
+        sql_logger.warning("Slow query", extra={'event': 'sql', 'duration_ms': duration_ms,
+                                                 'statement': _statement_summary(query)})
+    elif sql_logger.isEnabledFor(logging.DEBUG):
+        sql_logger.debug("Query", extra={'event': 'sql', 'duration_ms': duration_ms, 'sample': True,
+                                          'statement': _statement_summary(query)})
+
+
+def log_mail(recipients, subject, seconds, error=None, sample=False, **fields):
+    """Log one outgoing message; failures are always logged"""
+    context = _context.get()
+    if context is not None:
+        context.mail_count += 1
+    extra = {'event': 'mail', 'to': ', '.join(recipients), 'subject': subject,
+             'duration_ms': round(seconds * 1000, 2), **fields}
+    if error is not None:
+        extra['error'] = str(error)
+        mail_logger.error("Mail send failed", extra=extra,
+                          exc_info=error if isinstance(error, BaseException) else None)
+    else:
+        extra['sample'] = sample
+        mail_logger.info("Mail sent", extra=extra)
+
+
+class RequestLoggingMiddleware:
+    """WSGI middleware: assigns the request id, echoes it, and writes the access log"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        incoming = environ.get('HTTP_X_REQUEST_ID', '')
+        request_id = incoming if _VALID_REQUEST_ID.match(incoming) else None
+        context = LogContext(request_id)
+        token = _context.set(context)
+        start = time.perf_counter()
+        status = []
+
+        def logging_start_response(status_line, headers, exc_info=None):
+            status.append(int(status_line.split(' ', 1)[0]))
+            headers.append((REQUEST_ID_HEADER, context.request_id))
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, logging_start_response)
+        finally:
+            duration_ms = round((time.perf_counter() - start) * 1000, 2)
+            code = status[0] if status else 500
+            quiet = environ.get('PATH_INFO') in LOG_QUIET_PATHS and code < 400 and duration_ms < LOG_SLOW_MS
+            if not quiet:
+                logger.log(
+                    logging.ERROR if code >= 500 else logging.INFO,
+                    "%s %s %s", environ.get('REQUEST_METHOD'), environ.get('PATH_INFO'), code,
+                    extra={
+                        'event': 'request',
+                        'method': environ.get('REQUEST_METHOD'),
+                        'path': environ.get('PATH_INFO'),
+                        'status': code,
+                        'duration_ms': duration_ms,
+                        'sql_queries': context.sql_count,
+                        'sql_ms': round(context.sql_seconds * 1000, 2),
+                        'mail_sent': context.mail_count,
+                        # Routine requests are sampled; errors and slow requests always logged
+                        'sample': code < 500 and duration_ms < LOG_SLOW_MS,
+                    }
+                )
+            _context.reset(token)
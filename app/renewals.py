@@ -0,0 +1,175 @@
+"""
+Renewals ledger.
+
+Every payment or renewal is a row in the renewals table: the member, the
+membership year it pays for, the amount, how it was paid and which admin
+recorded it. members.paid_thru is derived from the ledger (the latest
+period_year recorded for the member) and is kept in step by the functions
+here, so it is never edited directly and status evaluation works on an
+integer year instead of parsing free text.
+
+Report queries read only the renewals table, from covering indexes:
+(member_id, period_year) is unique, (period_year, method, amount,
+member_id) serves the per-year method and renewal-rate reports, and
+(paid_on, amount) the revenue-by-year report.
+"""
+
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from db import get_db_connection, dict_cursor
+
+# Methods an admin can record; rows seeded by the migration use 'import'
+RENEWAL_METHODS = ('cash', 'check', 'card', 'paypal', 'waived', 'other')
+
+# Sanity bounds for a membership year; life and honorary members are paid through 9999
+MIN_PERIOD = 1900
+MAX_PERIOD = 9999
+
+
+def parse_period(value):
+    """Membership year from form or JSON input, or None if it is not a plausible year"""
+    try:
+        period = int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    return period if MIN_PERIOD <= period <= MAX_PERIOD else None
+
+
+def parse_amount(value):
+    """Decimal amount (two places), None when blank; raises ValueError if invalid"""
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        amount = Decimal(str(value).strip().lstrip('$')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value}")
+    if amount < 0:
+        raise ValueError(f"Invalid amount: {value}")
+    return amount
+
+
+def parse_method(value):
+    method = (value or 'other').strip().lower()
+    return method if method in RENEWAL_METHODS else None
+
+
+def sync_paid_thru(cursor, member_ids):
+    """Set members.paid_thru to the latest period in the ledger for these members"""
+    member_ids = list(member_ids)
+    if not member_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(member_ids))
+    # next_transition_date = CURDATE() has the expiration checker re-evaluate them.
+    # The correlated subquery reads one index range per member and runs on SQLite too
+    cursor.execute(f"""
+        UPDATE members
+        SET paid_thru = (SELECT MAX(r.period_year) FROM renewals r WHERE r.member_id = members.id),
+            next_transition_date = CURDATE()
+        WHERE id IN ({placeholders})
+    """, member_ids)
+
+
+def record_renewals(cursor, renewals):
+    """Add renewals and update paid_thru for the members involved.
+
+    `renewals` is a list of dicts with member_id, period_year and optionally
+    amount, method, reference, recorded_by and paid_on. Recording a period
+    a member already has replaces that entry. Returns the number recorded.
+    """
+    rows = [
+        (r['member_id'], r['period_year'], r.get('amount'), r.get('method') or 'other',
+         r.get('reference') or None, r.get('recorded_by'), r.get('paid_on') or date.today())
+        for r in renewals
+    ]
+    if not rows:
+        return 0
+    cursor.executemany("""
+        INSERT INTO renewals
+            (member_id, period_year, amount, method, reference, recorded_by, paid_on)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            amount = VALUES(amount),
+            method = VALUES(method),
+            reference = VALUES(reference),
+            recorded_by = VALUES(recorded_by),
+            paid_on = VALUES(paid_on),
+            recorded_at = CURRENT_TIMESTAMP
+    """, rows)
+    sync_paid_thru(cursor, sorted({row[0] for row in rows}))
+    return len(rows)
+
+
+def delete_renewal(cursor, renewal_id):
+    """Remove a ledger entry (dict cursor); returns its member id, or None if it did not exist"""
+    cursor.execute("SELECT member_id FROM renewals WHERE id = %s", (renewal_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    member_id = row['member_id']
+    cursor.execute("DELETE FROM renewals WHERE id = %s", (renewal_id,))
+    sync_paid_thru(cursor, [member_id])
+    return member_id
+
+
+def member_renewals(member_id):
+    """A member's ledger, newest period first, with the recording admin's call sign"""
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    cursor.execute("""
+        SELECT r.id, r.period_year, r.amount, r.method, r.reference, r.paid_on,
+               r.recorded_at, a.call_sign AS recorded_by
+        FROM renewals r
+        LEFT JOIN members a ON a.id = r.recorded_by
+        WHERE r.member_id = %s
+        ORDER BY r.period_year DESC
+    """, (member_id,))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return rows
+
+
+# Reports
+
+def revenue_by_year(cursor, start_year, end_year):
+    """Renewal count and revenue per calendar year of payment"""
+    cursor.execute("""
+        SELECT YEAR(paid_on) AS year, COUNT(*) AS renewals, COALESCE(SUM(amount), 0) AS revenue
+        FROM renewals
+        WHERE paid_on >= %s AND paid_on < %s
+        GROUP BY YEAR(paid_on)
+        ORDER BY year
+    """, (date(start_year, 1, 1), date(end_year + 1, 1, 1)))
+    return cursor.fetchall()
+
+
+def revenue_by_method(cursor, period_year):
+    """Renewal count and revenue per payment method for one membership year"""
+    cursor.execute("""
+        SELECT method, COUNT(*) AS renewals, COALESCE(SUM(amount), 0) AS revenue
+        FROM renewals
+        WHERE period_year = %s
+        GROUP BY method
+        ORDER BY revenue DESC
+    """, (period_year,))
+    return cursor.fetchall()
+
+
+def renewal_rate(cursor, period_year):
+    """How many members paid for `period_year` also paid for the following year"""
+    cursor.execute("""
+        SELECT COUNT(*) AS members,
+               COALESCE(SUM(n.member_id IS NOT NULL), 0) AS renewed
+        FROM renewals r
+        LEFT JOIN renewals n ON n.member_id = r.member_id AND n.period_year = r.period_year + 1
+        WHERE r.period_year = %s
+    """, (period_year,))
+    row = cursor.fetchone()
+    members, renewed = int(row['members']), int(row['renewed'])
+    return {
+        'period_year': period_year,
+        'members': members,
+        'renewed': renewed,
+        'rate': renewed / members if members else None,
+    }
@@ -0,0 +1,246 @@
+"""
+Data access for members and password reset tokens.
+
+Routes and scripts read and write the members and password_reset_tokens
+tables through these repositories instead of inline SQL, so the same code
+runs against MariaDB in production and SQLite for local development and
+tests (DB_BACKEND, see db.py).
+
+Repositories wrap a dict cursor and never commit: the caller owns the
+transaction, exactly as with the other cursor helpers (record_changes,
+record_renewals, ...). Get the implementation for a cursor's database
+with member_repository(cursor) and token_repository(cursor).
+
+The SQL is shared; the SQLite classes swap in SQLite's date functions and
+driver error class.
+"""
+
+import sqlite3
+
+
+class DuplicateMember(Exception):
+    """The call sign or email address belongs to another member"""
+
+
+# Columns the expiration checker evaluates a member from
+EVALUATION_COLUMNS = """m.id, m.call_sign, m.name, m.email, m.paid_thru, m.created_at,
+               m.expiration_status, m.expiration_window, m.expiration_notice_sent,
+               COALESCE(b.undeliverable, 0) AS undeliverable"""
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+class MemberRepository:
+    """The members table (MariaDB)"""
+
+    TODAY = 'CURDATE()'
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    @property
+    def IntegrityError(self):
+        # Imported here so the SQLite repositories run without mysqlclient
+        import MySQLdb
+        return MySQLdb.IntegrityError
+
+    def get(self, member_id, columns='*'):
+        """One member's row (just `columns`), or None"""
+        self.cursor.execute(f"SELECT {columns} FROM members WHERE id = %s", (member_id,))
+        return self.cursor.fetchone()
+
+    def principal(self, member_id):
+        """What a session carries about a member: id, call sign, email, admin flag"""
+        return self.get(member_id, 'id, call_sign, email, is_admin')
+
+    def for_login(self, call_sign):
+        self.cursor.execute("SELECT id, call_sign, email, password_hash, is_admin FROM members WHERE call_sign = %s",
+                            (call_sign,))
+        return self.cursor.fetchone()
+
+    def by_email(self, email):
+        self.cursor.execute("SELECT id, call_sign, email FROM members WHERE email = %s", (email,))
+        return self.cursor.fetchone()
+
+    def version(self, member_id):
+        """Row version of a member plus their bounce state, or None if there is no such member"""
+        self.cursor.execute("""
+            SELECT m.row_version, m.updated_at, b.hard_bounces, b.soft_bounces,
+                   b.undeliverable, b.last_bounced_at
+            FROM members m
+            LEFT JOIN email_bounces b ON b.email = m.email
+            WHERE m.id = %s
+        """, (member_id,))
+        return self.cursor.fetchone()
+
+    def call_sign_taken(self, call_sign, member_id):
+        """True if a member other than `member_id` has `call_sign`"""
+        self.cursor.execute("SELECT id FROM members WHERE call_sign = %s AND id != %s", (call_sign, member_id))
+        return self.cursor.fetchone() is not None
+
+    def existing_ids(self, ids):
+        """Which of `ids` are members"""
+        self.cursor.execute(f"SELECT id FROM members WHERE id IN ({_placeholders(ids)})", ids)
+        return [row['id'] for row in self.cursor.fetchall()]
+
+    def with_deliverable_email(self, ids):
+        """id, call sign and email of the members in `ids` with an address that has not bounced"""
+        self.cursor.execute(f"""
+            SELECT m.id, m.call_sign, m.email FROM members m
+            LEFT JOIN email_bounces b ON b.email = m.email AND b.undeliverable = 1
+            WHERE m.id IN ({_placeholders(ids)}) AND m.email IS NOT NULL AND m.email != ''
+            AND b.email IS NULL
+        """, ids)
+        return self.cursor.fetchall()
+
+    def create(self, fields):
+        """Insert a member from a dict of column values; returns the new id.
+
+        The checker evaluates the new member on its next run. Raises
+        DuplicateMember if the call sign or email is already in use.
+        """
+        columns = list(fields)
+        try:
+            self.cursor.execute(f"""
+                INSERT INTO members ({', '.join(columns)}, next_transition_date)
+                VALUES ({_placeholders(columns)}, {self.TODAY})
+            """, [fields[column] for column in columns])
+        except self.IntegrityError as e:
+            raise DuplicateMember(str(e)) from e
+        return self.cursor.lastrowid
+
+    def update(self, member_ids, fields):
+        """Set the columns in `fields` on every member in `member_ids`"""
+        assignments = ', '.join(f"{column} = %s" for column in fields)
+        self.cursor.execute(f"UPDATE members SET {assignments} WHERE id IN ({_placeholders(member_ids)})",
+                            (*fields.values(), *member_ids))
+
+    def set_password(self, member_id, password_hash):
+        self.update([member_id], {'password_hash': password_hash})
+
+    def delete(self, member_ids):
+        """Delete members (their renewals go with them); returns how many existed"""
+        self.cursor.execute(f"DELETE FROM members WHERE id IN ({_placeholders(member_ids)})", member_ids)
+        return self.cursor.rowcount
+
+    def due_for_evaluation(self, today, resync=False):
+        """Members whose next transition has arrived by today (all members on resync)"""
+        due_clause = "" if resync else "WHERE m.next_transition_date <= %s"
+        self.cursor.execute(f"""
+            SELECT {EVALUATION_COLUMNS}
+            FROM members m
+            LEFT JOIN email_bounces b ON b.email = m.email
+            {due_clause}
+            ORDER BY m.call_sign
+        """, () if resync else (today,))
+        return self.cursor.fetchall()
+
+    def save_evaluation(self, member_id, evaluation, notified):
+        """Store a member's evaluated status and next transition date"""
+        notice_sent = f"expiration_notice_sent = {self.TODAY}," if notified else ""
+        self.cursor.execute(f"""
+            UPDATE members
+            SET expiration_status = %s,
+                expiration_window = %s,
+                {notice_sent}
+                next_transition_date = %s
+            WHERE id = %s
+        """, (evaluation.status, evaluation.window, evaluation.next_transition, member_id))
+
+    def terms(self):
+        """id, paid_thru and created_at of every member (enough to evaluate their status)"""
+        self.cursor.execute("SELECT id, paid_thru, created_at FROM members")
+        return self.cursor.fetchall()
+
+    def status_counts(self):
+        """Stored expiration status -> number of members"""
+        self.cursor.execute("""
+            SELECT expiration_status, COUNT(*) as count
+            FROM members
+            GROUP BY expiration_status
+        """)
+        return {row['expiration_status']: row['count'] for row in self.cursor.fetchall()}
+
+    def without_email(self):
+        """Paying members the checker cannot notify"""
+        self.cursor.execute("""
+            SELECT call_sign, paid_thru, created_at
+            FROM members
+            WHERE (email IS NULL OR email = '')
+            AND paid_thru IS NOT NULL
+            ORDER BY call_sign
+        """)
+        return self.cursor.fetchall()
+
+    def undeliverable(self):
+        """Members whose address has bounced, with the last bounce status"""
+        self.cursor.execute("""
+            SELECT m.call_sign, m.email, b.last_status
+            FROM members m
+            JOIN email_bounces b ON b.email = m.email
+            WHERE b.undeliverable = 1
+            ORDER BY m.call_sign
+        """)
+        return self.cursor.fetchall()
+
+
+class TokenRepository:
+    """The password_reset_tokens table (MariaDB)"""
+
+    NOW = 'NOW()'
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def create(self, user_id, token, expires_at):
+        self.create_many([(user_id, token, expires_at)])
+
+    def create_many(self, tokens):
+        """Store (user_id, token, expires_at) tuples"""
+        self.cursor.executemany("""
+            INSERT INTO password_reset_tokens (user_id, token, expires_at)
+            VALUES (%s, %s, %s)
+        """, tokens)
+
+    def user_id(self, token):
+        """Member id a token resets the password of, or None if it is unknown, expired or used"""
+        self.cursor.execute(f"""
+            SELECT user_id FROM password_reset_tokens
+            WHERE token = %s AND expires_at > {self.NOW} AND used = FALSE
+        """, (token,))
+        row = self.cursor.fetchone()
+        return row['user_id'] if row else None
+
+    def mark_used(self, token):
+        self.cursor.execute("UPDATE password_reset_tokens SET used = TRUE WHERE token = %s", (token,))
+
+
+class SQLiteMemberRepository(MemberRepository):
+    """The members table (SQLite)"""
+
+    TODAY = "date('now', 'localtime')"
+    IntegrityError = sqlite3.IntegrityError
+
+
+class SQLiteTokenRepository(TokenRepository):
+    """The password_reset_tokens table (SQLite)"""
+
+    NOW = "datetime('now', 'localtime')"
+
+
+REPOSITORIES = {
+    'mariadb': (MemberRepository, TokenRepository),
+    'sqlite': (SQLiteMemberRepository, SQLiteTokenRepository),
+}
+
+
+def member_repository(cursor):
+    """Members repository for the database `cursor` belongs to"""
+    return REPOSITORIES[getattr(cursor, 'dialect', 'mariadb')][0](cursor)
+
+
+def token_repository(cursor):
+    """Password reset token repository for the database `cursor` belongs to"""
+    return REPOSITORIES[getattr(cursor, 'dialect', 'mariadb')][1](cursor)
@@ -0,0 +1,218 @@
+"""
+Shared in-memory roster snapshot for admin views.
+
+The dashboard listing, status counts and PDF export all work from one
+per-process copy of the members table instead of re-fetching every row as
+DictCursor dicts on each view. Rows are held as __slots__ objects with
+repeated strings (city, state, member type) interned, which
+keeps the snapshot a fraction of the size of the equivalent list of dicts.
+
+Freshness:
+- At most once every ROSTER_REFRESH_INTERVAL seconds the snapshot runs a
+  single version query (row count, MAX(updated_at) and SUM(row_version)).
+  If nothing changed, no rows are fetched. Every update bumps a row's
+  row_version, so the sum moves even when a write commits with an
+  updated_at older than the newest one already seen.
+- If the version moved, rows with updated_at from ROSTER_REFRESH_OVERLAP
+  seconds before the last seen value onwards are fetched and merged by id.
+  The overlap picks up writes stamped before that value but committed
+  after it was read. If the merged rows' row_versions still do not add up
+  to the database's sum (a write committed more than the overlap late),
+  the whole roster is reloaded. Deleted rows are detected by the row count
+  and pruned with an id-only query.
+- Writes in this process call invalidate(), and sessions that just wrote
+  (see db.session_is_sticky) always re-check the version, so admins see
+  their own edits immediately.
+
+Each tenant has its own snapshot; `roster` always refers to the snapshot of
+the tenant being served.
+
+Requires the updated_at column from database/add_roster_change_tracking.sql
+and row_version from database/add_row_versions.sql.
+"""
+
+import os
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+from db import get_db_connection, dict_cursor, session_is_sticky
+from expiration_policy import evaluate_member
+from tenants import PerTenant
+
+ROSTER_REFRESH_INTERVAL = float(os.getenv('ROSTER_REFRESH_INTERVAL', 5))
+ROSTER_REFRESH_OVERLAP = float(os.getenv('ROSTER_REFRESH_OVERLAP', 60))
+
+ROSTER_COLUMNS = ('id', 'call_sign', 'name', 'email', 'city', 'state',
+                  'member_type', 'paid_thru', 'is_admin', 'created_at', 'updated_at', 'row_version')
+
+# Low-cardinality columns whose strings are shared between records
+INTERNED_COLUMNS = ('city', 'state', 'member_type')
+
+
+class RosterMember:
+    """One members row, as the attributes used by the admin views"""
+
+    __slots__ = ROSTER_COLUMNS
+
+    def __init__(self, row):
+        for column in ROSTER_COLUMNS:
+            value = row[column]
+            if column in INTERNED_COLUMNS and value is not None:
+                value = sys.intern(value)
+            setattr(self, column, value)
+
+    def __getitem__(self, key):
+        # Allow member['call_sign'] as well as member.call_sign, like the dict rows
+        return getattr(self, key)
+
+    @property
+    def last_name_key(self):
+        """Sort key matching the export's ORDER BY last word of name, then name"""
+        name = (self.name or '').casefold()
+        return (name.rsplit(' ', 1)[-1], name)
+
+
+class RosterSnapshot:
+    """Per-process roster cache, refreshed incrementally from updated_at"""
+
+    def __init__(self, refresh_interval=ROSTER_REFRESH_INTERVAL, overlap=ROSTER_REFRESH_OVERLAP):
+        self.refresh_interval = refresh_interval
+        self.overlap = timedelta(seconds=overlap)
+        self._lock = threading.Lock()
+        self._members = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._views = {}
+
+    @property
+    def version(self):
+        """(row count, MAX(updated_at), SUM(row_version)) as of the last refresh"""
+        self.refresh()
+        return self._version
+
+    def invalidate(self):
+        """Force a version check on the next access"""
+        self._checked_at = 0.0
+
+    def refresh(self, force=False):
+        """Bring the snapshot up to date if it is due for a check"""
+        due = time.monotonic() - self._checked_at >= self.refresh_interval
+        if not (force or due or session_is_sticky()):
+            return
+        with self._lock:
+            conn = get_db_connection(read_only=True)
+            cursor = dict_cursor(conn)
+            try:
+                self._refresh(cursor)
+            finally:
+                cursor.close()
+                conn.close()
+            self._checked_at = time.monotonic()
+
+    def _refresh(self, cursor):
+        cursor.execute("""
+            SELECT COUNT(*) AS count, MAX(updated_at) AS max_updated, SUM(row_version) AS versions
+            FROM members
+        """)
+        row = cursor.fetchone()
+        version = (row['count'], row['max_updated'], row['versions'] or 0)
+        if version == self._version:
+            return
+
+        members = None
+        if self._version is not None and self._version[1] is not None:
+            members = self._merge_recent(cursor, version)
+        if members is None:
+            cursor.execute(f"SELECT {', '.join(ROSTER_COLUMNS)} FROM members")
+            members = {row['id']: RosterMember(row) for row in cursor.fetchall()}
+
+        # Swap in new state; readers holding the old dict keep a consistent view
+        self._members = members
+        self._views = {}
+        self._version = version
+
+    def _merge_recent(self, cursor, version):
+        """The snapshot with recently updated rows merged in, or None if that is not enough"""
+        # Re-read an overlap before the last seen updated_at: a write can stamp
+        # its rows and commit only after a later updated_at has been read
+        since = self._version[1] - self.overlap
+        cursor.execute(f"SELECT {', '.join(ROSTER_COLUMNS)} FROM members WHERE updated_at >= %s",
+                       (since,))
+        members = dict(self._members)
+        for row in cursor.fetchall():
+            members[row['id']] = RosterMember(row)
+
+        if len(members) != version[0]:
+            cursor.execute("SELECT id FROM members")
+            live_ids = {row['id'] for row in cursor.fetchall()}
+            members = {id: m for id, m in members.items() if id in live_ids}
+
+        # A write committed later than the overlap leaves the versions short
+        if sum(m.row_version for m in members.values()) != version[2]:
+            return None
+        return members
+
+    def _view(self, name, build):
+        self.refresh()
+        views = self._views
+        if name not in views:
+            views[name] = build(self._members.values())
+        return views[name]
+
+    def members_by_name(self):
+        """All members ordered by name, as the dashboard lists them"""
+        return self._view('by_name', lambda members: sorted(
+            members, key=lambda m: (m.name or '').casefold()))
+
+    def members_by_last_name(self):
+        """All members ordered by last name, as the PDF export lists them"""
+        return self._view('by_last_name', lambda members: sorted(
+            members, key=lambda m: m.last_name_key))
+
+    def get(self, member_id):
+        self.refresh()
+        return self._members.get(member_id)
+
+    def __len__(self):
+        self.refresh()
+        return len(self._members)
+
+    def status_counts(self, today=None):
+        """Count members by expiration policy status as of today"""
+        today = today or date.today()
+
+        def count(members):
+            counts = {'active': 0, 'expiring': 0, 'expired': 0, 'unknown': 0}
+            for member in members:
+                counts[evaluate_member(member, today).status] += 1
+            return counts
+
+        return dict(self._view(('status_counts', today), count))
+
+    def memory_usage(self):
+        """Approximate bytes held by the member records and their strings"""
+        seen = set()
+        total = sys.getsizeof(self._members)
+        for member in self._members.values():
+            total += sys.getsizeof(member)
+            for column in ROSTER_COLUMNS:
+                value = getattr(member, column)
+                if value is not None and id(value) not in seen:
+                    seen.add(id(value))
+                    total += sys.getsizeof(value)
+        return total
+
+    def memory_report(self):
+        """Memory usage summary, normalised per 10,000 members"""
+        count = len(self._members)
+        total = self.memory_usage()
+        return {
+            'members': count,
+            'bytes': total,
+            'bytes_per_10k': int(total * 10000 / count) if count else 0,
+        }
+
+
+roster = PerTenant(RosterSnapshot)
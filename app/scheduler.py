@@ -0,0 +1,387 @@
+"""
+Periodic jobs run by the portal's scheduler worker.
+
+The expiration check, bounce processing and backups used to be started by
+cron through shell wrappers, each cold-starting an interpreter (or a
+docker exec) and opening fresh database and SMTP connections. The worker
+(scripts/scheduler_worker.py) declares them as jobs instead and runs them
+in one long-lived process with warm connection pools.
+
+Schedules:
+- "daily HH:MM"          every day at HH:MM (local time)
+- "hourly :MM"           every hour at MM minutes past
+- "every N minutes"      or "every N hours"
+- "off"                  never
+SCHEDULE_<JOB_NAME> in the environment overrides a job's declared schedule,
+e.g. SCHEDULE_EXPIRATION_CHECK="daily 07:30".
+
+Each job runs once per slot, for each tenant (or once overall for jobs
+declared with per_tenant=False):
+- Jitter: a run starts up to `jitter` seconds after its slot. The offset is
+  derived from the job, tenant and slot, so every instance agrees on it.
+- Leader election: an instance must hold the MariaDB named lock for the job
+  (GET_LOCK, released automatically if the instance dies) to run it, so
+  with several workers each slot still runs once. The lock lives as long as
+  the connection that took it, so that connection is pinged every
+  SCHEDULER_LOCK_HEARTBEAT seconds while the job runs; otherwise a long
+  run (a backup) could leave it idle past the server's wait_timeout and
+  drop the lock.
+- Catch-up: the last slot run is stored in scheduled_jobs. A worker that
+  was down over one or more slots runs the job once when it comes back
+  (missed slots are coalesced), if the latest missed slot is no older than
+  the job's `catch_up` seconds (default: one interval). Older slots are
+  recorded as skipped.
+- History: every run is recorded in scheduled_runs with its duration,
+  status and error, and summarised for admins on /admin/scheduler.
+
+A failed run is not retried before the next slot.
+
+Requires database/add_scheduler.sql.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import traceback
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from db import get_db_connection, dict_cursor
+from logs import log_context
+from tenants import activate, tenants
+
+SCHEDULER_POLL_SECONDS = float(os.getenv('SCHEDULER_POLL_SECONDS', 30))
+SCHEDULER_HISTORY_DAYS = int(os.getenv('SCHEDULER_HISTORY_DAYS', 90))
+SCHEDULER_LOCK_HEARTBEAT = float(os.getenv('SCHEDULER_LOCK_HEARTBEAT', 60))
+
+logger = logging.getLogger('portal.scheduler')
+
+# Slots are counted from here, so "every 7 hours" does not restart at midnight
+_EPOCH = datetime(2000, 1, 1)
+
+
+class Schedule:
+    """When a job's slots fall: every `interval`, `offset` after the epoch"""
+
+    def __init__(self, spec):
+        self.spec = ' '.join(spec.split()).lower()
+        self.interval, self.offset = self._parse(self.spec)
+
+    @staticmethod
+    def _parse(spec):
+        if spec == 'off':
+            return None, None
+        match = re.fullmatch(r'daily (\d{1,2}):(\d{2})', spec)
+        if match and int(match[1]) < 24 and int(match[2]) < 60:
+            return timedelta(days=1), timedelta(hours=int(match[1]), minutes=int(match[2]))
+        match = re.fullmatch(r'hourly :(\d{2})', spec)
+        if match and int(match[1]) < 60:
+            return timedelta(hours=1), timedelta(minutes=int(match[1]))
+        match = re.fullmatch(r'every (\d+) (minute|hour)s?', spec)
+        if match and int(match[1]) > 0:
+            unit = 'minutes' if match[2] == 'minute' else 'hours'
+            return timedelta(**{unit: int(match[1])}), timedelta(0)
+        raise ValueError(f"Invalid schedule: {spec!r}")
+
+    @property
+    def enabled(self):
+        return self.interval is not None
+
+    def previous(self, now):
+        """The latest slot at or before `now`"""
+        slots = (now - _EPOCH - self.offset) // self.interval
+        return _EPOCH + self.offset + slots * self.interval
+
+    def next(self, now):
+        """The first slot after `now`"""
+        return self.previous(now) + self.interval
+
+    def __str__(self):
+        return self.spec
+
+
+class Job:
+    """A declared job: what to run, when, and how late it may start"""
+
+    def __init__(self, name, func, schedule, jitter=0, catch_up=None, per_tenant=True):
+        self.name = name
+        self.func = func
+        self.schedule = Schedule(os.getenv(f"SCHEDULE_{name.upper()}", schedule))
+        self.per_tenant = per_tenant
+        if self.schedule.enabled:
+            # Jitter must leave the slot before the next one begins
+            interval = self.schedule.interval.total_seconds()
+            self.jitter = min(jitter, interval / 2)
+            self.catch_up = interval if catch_up is None else catch_up
+        else:
+            self.jitter = self.catch_up = 0
+
+    def start_time(self, slot, tenant_key):
+        """When the run for `slot` starts: the slot plus this job's jitter for it"""
+        if not self.jitter:
+            return slot
+        digest = hashlib.sha1(f"{self.name}:{tenant_key}:{slot.isoformat()}".encode()).digest()
+        return slot + timedelta(seconds=int.from_bytes(digest[:4], 'big') % int(self.jitter + 1))
+
+    def due_slot(self, now, tenant_key):
+        """The latest slot whose start time has passed"""
+        slot = self.schedule.previous(now)
+        if self.start_time(slot, tenant_key) > now:
+            slot -= self.schedule.interval
+        return slot
+
+    def next_run(self, now, tenant_key):
+        slot = self.schedule.next(now)
+        if self.start_time(self.schedule.previous(now), tenant_key) > now:
+            slot = self.schedule.previous(now)
+        return self.start_time(slot, tenant_key)
+
+
+def lock_name(tenant, job):
+    """Named lock for a job; includes the database, since tenants may share a server"""
+    return f"scheduler.{tenant.db_config.get('db')}.{job.name}"[:64]
+
+
+class LockHeartbeat:
+    """Pings the connection holding a job's lock from a background thread until stopped.
+
+    The job itself uses other pooled connections, so nothing else touches
+    this one while the heartbeat runs.
+    """
+
+    def __init__(self, conn, job_name, interval=SCHEDULER_LOCK_HEARTBEAT):
+        self.conn = conn
+        self.job_name = job_name
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lock-heartbeat-{job_name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.conn.ping()
+            except Exception:
+                logger.exception("Lost the connection holding the lock for job %s", self.job_name,
+                                 extra={'event': 'job_lock_lost', 'job': self.job_name})
+                return
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class Scheduler:
+    """Registry of jobs and the loop that runs them"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.host = f"{socket.gethostname()}:{os.getpid()}"
+        # (tenant key, job name) -> last slot run, as last read from the database
+        self._last_slot = {}
+        self._stop = threading.Event()
+
+    def job(self, name, schedule, jitter=0, catch_up=None, per_tenant=True):
+        """Decorator declaring `func` as job `name`"""
+        def register(func):
+            self.jobs[name] = Job(name, func, schedule, jitter, catch_up, per_tenant)
+            return func
+        return register
+
+    def targets(self, job):
+        """Tenants `job` runs for"""
+        if job.per_tenant:
+            return list(tenants)
+        return [tenants.default or next(iter(tenants))]
+
+    def register(self, now=None):
+        """Record each job's schedule and next run, and load the last slots run"""
+        now = now or datetime.now()
+        for job in self.jobs.values():
+            for tenant in self.targets(job):
+                with activate(tenant):
+                    conn = get_db_connection(track_writes=False)
+                    cursor = dict_cursor(conn)
+                    try:
+                        cursor.execute("""
+                            INSERT INTO scheduled_jobs (name, schedule, next_run_at)
+                            VALUES (%s, %s, %s)
+                            ON DUPLICATE KEY UPDATE schedule = VALUES(schedule), next_run_at = VALUES(next_run_at)
+                        """, (job.name, str(job.schedule),
+                              job.next_run(now, tenant.key) if job.schedule.enabled else None))
+                        cursor.execute("SELECT last_slot FROM scheduled_jobs WHERE name = %s", (job.name,))
+                        self._last_slot[(tenant.key, job.name)] = cursor.fetchone()['last_slot']
+                        conn.commit()
+                    finally:
+                        cursor.close()
+                        conn.close()
+
+    def run_pending(self, now=None):
+        """Run every job whose slot is due; returns the number of runs"""
+        runs = 0
+        for job in self.jobs.values():
+            if not job.schedule.enabled:
+                continue
+            for tenant in self.targets(job):
+                if self._stop.is_set():
+                    return runs
+                now_ = now or datetime.now()
+                slot = job.due_slot(now_, tenant.key)
+                last = self._last_slot.get((tenant.key, job.name))
+                if last is not None and last >= slot:
+                    continue
+                with activate(tenant):
+                    runs += self._run(job, tenant, slot, now_)
+        return runs
+
+    def _run(self, job, tenant, slot, now):
+        """Run `job` for `slot` if this instance wins the lock and it is still due"""
+        conn = get_db_connection(track_writes=False)
+        cursor = dict_cursor(conn)
+        name = lock_name(tenant, job)
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0) AS locked", (name,))
+            if not cursor.fetchone()['locked']:
+                return 0
+            try:
+                return self._run_locked(cursor, conn, job, tenant, slot, now)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s) AS released", (name,))
+                if cursor.fetchone()['released'] != 1:
+                    logger.error("Lock for job %s was lost during the run", job.name, extra={
+                        'event': 'job_lock_lost', 'job': job.name, 'slot': slot.isoformat()})
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _run_locked(self, cursor, conn, job, tenant, slot, now):
+        # Another instance may have run the slot while we were deciding
+        cursor.execute("SELECT last_slot FROM scheduled_jobs WHERE name = %s", (job.name,))
+        row = cursor.fetchone()
+        last = row['last_slot'] if row else None
+        self._last_slot[(tenant.key, job.name)] = last
+        if last is not None and last >= slot:
+            return 0
+
+        next_run = job.next_run(now, tenant.key)
+        if (now - slot).total_seconds() > job.catch_up + job.jitter:
+            logger.warning("Skipping missed run of %s", job.name, extra={
+                'event': 'job_skipped', 'job': job.name, 'slot': slot.isoformat()})
+            self._finish_slot(cursor, conn, job, tenant, slot, 'skipped', next_run)
+            return 0
+
+        # Runs left 'running' by an instance that died can no longer be running: we hold the lock
+        cursor.execute("""
+            UPDATE scheduled_runs SET status = 'abandoned'
+            WHERE job_name = %s AND status = 'running'
+        """, (job.name,))
+        cursor.execute("""
+            INSERT INTO scheduled_runs (job_name, slot, host, started_at, status)
+            VALUES (%s, %s, %s, NOW(3), 'running')
+        """, (job.name, slot, self.host))
+        run_id = cursor.lastrowid
+        conn.commit()
+
+        start = time.perf_counter()
+        status, error = 'ok', None
+        with log_context(sampled=True) as context:
+            logger.info("Job %s started", job.name, extra={
+                'event': 'job_start', 'job': job.name, 'slot': slot.isoformat(), 'run_id': run_id})
+            heartbeat = LockHeartbeat(conn, job.name)
+            try:
+                job.func()
+            except Exception as e:
+                status = 'failed'
+                error = ''.join(traceback.format_exception_only(type(e), e)).strip()[:2000]
+                logger.exception("Job %s failed", job.name, extra={'event': 'job_failed', 'job': job.name})
+            finally:
+                heartbeat.stop()
+            duration_ms = round((time.perf_counter() - start) * 1000)
+            logger.info("Job %s finished", job.name, extra={
+                'event': 'job_finish', 'job': job.name, 'status': status, 'duration_ms': duration_ms,
+                'sql_queries': context.sql_count, 'mail_sent': context.mail_count})
+
+        cursor.execute("""
+            UPDATE scheduled_runs
+            SET finished_at = NOW(3), duration_ms = %s, status = %s, error = %s
+            WHERE id = %s
+        """, (duration_ms, status, error, run_id))
+        cursor.execute("""
+            DELETE FROM scheduled_runs
+            WHERE job_name = %s AND started_at < NOW() - INTERVAL %s DAY
+        """, (job.name, SCHEDULER_HISTORY_DAYS))
+        self._finish_slot(cursor, conn, job, tenant, slot, status, job.next_run(datetime.now(), tenant.key))
+        return 1
+
+    def _finish_slot(self, cursor, conn, job, tenant, slot, status, next_run):
+        cursor.execute("""
+            INSERT INTO scheduled_jobs (name, schedule, last_slot, last_status, next_run_at)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                schedule = VALUES(schedule),
+                last_slot = VALUES(last_slot),
+                last_status = VALUES(last_status),
+                next_run_at = VALUES(next_run_at)
+        """, (job.name, str(job.schedule), slot, status, next_run))
+        conn.commit()
+        self._last_slot[(tenant.key, job.name)] = slot
+
+    def stop(self):
+        """Ask run_forever() to return once the current job finishes"""
+        self._stop.set()
+
+    def run_forever(self, poll=SCHEDULER_POLL_SECONDS):
+        self.register()
+        logger.info("Scheduler started", extra={
+            'event': 'scheduler_start', 'host': self.host,
+            'jobs': {name: str(job.schedule) for name, job in self.jobs.items()}})
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception:
+                # Database unavailable and the like; try again next poll
+                logger.exception("Scheduler pass failed", extra={'event': 'scheduler_error'})
+            self._stop.wait(poll)
+        logger.info("Scheduler stopped", extra={'event': 'scheduler_stop', 'host': self.host})
+
+
+# Admin view
+
+JobSummary = namedtuple('JobSummary', 'name schedule last_status next_run_at runs failures '
+                                      'avg_ms max_ms last_run')
+
+
+def job_summaries(cursor, days=30):
+    """Each job's schedule and state, with run counts and durations over `days`"""
+    cursor.execute("""
+        SELECT j.name, j.schedule, j.last_status, j.next_run_at,
+               COUNT(r.id) AS runs,
+               COALESCE(SUM(r.status = 'failed'), 0) AS failures,
+               AVG(r.duration_ms) AS avg_ms,
+               MAX(r.duration_ms) AS max_ms,
+               MAX(r.started_at) AS last_run
+        FROM scheduled_jobs j
+        LEFT JOIN scheduled_runs r ON r.job_name = j.name AND r.started_at >= NOW() - INTERVAL %s DAY
+        GROUP BY j.name, j.schedule, j.last_status, j.next_run_at
+        ORDER BY j.name
+    """, (days,))
+    return [JobSummary(row['name'], row['schedule'], row['last_status'], row['next_run_at'],
+                       int(row['runs']), int(row['failures']),
+                       None if row['avg_ms'] is None else round(float(row['avg_ms'])),
+                       row['max_ms'], row['last_run'])
+            for row in cursor.fetchall()]
+
+
+def recent_runs(cursor, limit=50):
+    """The latest runs of all jobs, newest first"""
+    cursor.execute("""
+        SELECT id, job_name, slot, host, started_at, finished_at, duration_ms, status, error
+        FROM scheduled_runs
+        ORDER BY started_at DESC
+        LIMIT %s
+    """, (limit,))
+    return cursor.fetchall()
@@ -0,0 +1,333 @@
+"""
+Server-side session store.
+
+The session cookie only carries an opaque random id; the session contents,
+including the authenticated principal (id, call sign, email, admin flag),
+live on the server. Authenticating a request is a single session lookup
+instead of a members query.
+
+Backends (SESSION_BACKEND):
+- "memory": an LRU of up to SESSION_CACHE_SIZE sessions in this process.
+  Single worker only: another worker does not see the session, so the
+  user appears logged out and flashes, logouts and revocations are lost.
+- "database": sessions are stored in the portal_sessions table, shared by
+  every worker, and each worker caches the sessions it has read for up to
+  SESSION_CACHE_SECONDS. The cookie carries the session's version as well
+  as its id, and every save bumps it, so a request whose session was
+  written by another worker (a flash, the read-your-writes stickiness in
+  db_sticky_until) misses the cache and reads the new version. Logouts and
+  revocations bump a shared counter (portal_session_state), which each
+  worker reads at most every SESSION_REVOCATION_CHECK seconds, dropping its
+  cache when it has changed. A cached request therefore costs no query,
+  and a revoked session stops working on every worker within
+  SESSION_REVOCATION_CHECK seconds.
+
+The default is "memory" for a single worker and "database" when
+WEB_CONCURRENCY (the worker count the server is started with) is above 1.
+
+Sessions expire PERMANENT_SESSION_LIFETIME after login regardless of
+activity; expiry is checked on the server, not trusted to the cookie.
+Use revoke_member_sessions() when a member's password, call sign or role
+changes.
+"""
+
+import copy
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+from datetime import datetime, timezone
+
+from flask import current_app, session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from db import get_db_connection, dict_cursor
+
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY') or 1)
+SESSION_BACKEND = os.getenv('SESSION_BACKEND') or ('database' if WEB_CONCURRENCY > 1 else 'memory')
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', 10000))
+SESSION_CACHE_SECONDS = float(os.getenv('SESSION_CACHE_SECONDS', 30))
+SESSION_REVOCATION_CHECK = float(os.getenv('SESSION_REVOCATION_CHECK', 1))
+
+# Purge expired rows from portal_sessions once every this many saves
+PURGE_EVERY = 500
+
+SessionEntry = namedtuple('SessionEntry', 'member_id data expires_at version')
+
+serializer = TaggedJSONSerializer()
+
+
+def _now():
+    return time.time()
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict whose contents are kept in a SessionStore"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None, version=0):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.version = version
+        self.new = sid is None
+        self.modified = False
+        self.rotate = False
+
+
+class MemorySessionStore:
+    """LRU of sessions held in this process"""
+
+    def __init__(self, max_entries=SESSION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._by_member = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def get(self, sid, version=None):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is not None:
+                self._entries.move_to_end(sid)
+            return entry
+
+    def save(self, sid, entry):
+        with self._lock:
+            self._remove(sid)
+            self._entries[sid] = entry
+            if entry.member_id is not None:
+                self._by_member[entry.member_id].add(sid)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, sid):
+        with self._lock:
+            self._remove(sid)
+
+    def revoke_member(self, member_id, keep_sid=None):
+        """Delete every session belonging to member_id except keep_sid"""
+        with self._lock:
+            sids = [sid for sid in self._by_member.get(member_id, ()) if sid != keep_sid]
+            for sid in sids:
+                self._remove(sid)
+            return len(sids)
+
+    def _remove(self, sid):
+        entry = self._entries.pop(sid, None)
+        if entry is not None and entry.member_id is not None:
+            sids = self._by_member.get(entry.member_id)
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._by_member[entry.member_id]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DatabaseSessionStore:
+    """Sessions stored in portal_sessions, shared by every worker.
+
+    Sessions read are cached in the process (see the module docstring for
+    how writes and revocations on other workers reach the cache).
+    """
+
+    def __init__(self, max_entries=SESSION_CACHE_SIZE, cache_seconds=SESSION_CACHE_SECONDS,
+                 revocation_check=SESSION_REVOCATION_CHECK):
+        self.max_entries = max_entries
+        self.cache_seconds = cache_seconds
+        self.revocation_check = revocation_check
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._revocations = None
+        self._checked_at = 0
+        self._saves = 0
+
+    @staticmethod
+    def _key(sid):
+        # Only a hash of the id is stored, so a database dump does not expose live sessions
+        return hashlib.sha256(sid.encode('utf-8')).hexdigest()
+
+    def get(self, sid, version=None):
+        """The session's entry, from the cache when it holds `version` of it"""
+        self._check_revocations()
+        with self._lock:
+            cached = self._cache.get(sid)
+            if cached is not None:
+                entry, cached_at = cached
+                if entry.version == version and time.monotonic() - cached_at < self.cache_seconds:
+                    self._cache.move_to_end(sid)
+                    return entry
+                del self._cache[sid]
+
+        conn = get_db_connection()
+        cursor = dict_cursor(conn)
+        cursor.execute("""
+            SELECT member_id, data, expires_at, version FROM portal_sessions
+            WHERE session_key = %s AND expires_at > %s
+        """, (self._key(sid), _now()))
+        row = cursor.fetchone()
+        cursor.close()
+        conn.close()
+
+        if row is None:
+            return None
+        entry = SessionEntry(row['member_id'], serializer.loads(row['data']),
+                             float(row['expires_at']), row['version'])
+        self._cache_entry(sid, entry)
+        return entry
+
+    def _cache_entry(self, sid, entry):
+        with self._lock:
+            self._cache[sid] = (entry, time.monotonic())
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _check_revocations(self):
+        """Drop the cache if any worker has revoked a session since the last check"""
+        if time.monotonic() - self._checked_at < self.revocation_check:
+            return
+        conn = get_db_connection()
+        cursor = dict_cursor(conn)
+        cursor.execute("SELECT revocations FROM portal_session_state WHERE id = 1")
+        row = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        revocations = row['revocations'] if row else None
+        with self._lock:
+            if revocations != self._revocations:
+                self._cache.clear()
+                self._revocations = revocations
+            self._checked_at = time.monotonic()
+
+    def _revoked(self, cursor, sid=None):
+        """Have every worker drop its cache (this one: just `sid`, if given)"""
+        cursor.execute("UPDATE portal_session_state SET revocations = revocations + 1 WHERE id = 1")
+        with self._lock:
+            if sid is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(sid, None)
+
+    def save(self, sid, entry):
+        conn = get_db_connection(track_writes=False)
+        cursor = conn.cursor()
+        cursor.execute("""
+            REPLACE INTO portal_sessions (session_key, member_id, data, expires_at, version)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (self._key(sid), entry.member_id, serializer.dumps(entry.data), entry.expires_at, entry.version))
+        self._saves += 1
+        if self._saves % PURGE_EVERY == 0:
+            cursor.execute("DELETE FROM portal_sessions WHERE expires_at <= %s", (_now(),))
+        conn.commit()
+        cursor.close()
+        conn.close()
+        self._cache_entry(sid, entry)
+
+    def delete(self, sid):
+        conn = get_db_connection(track_writes=False)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM portal_sessions WHERE session_key = %s", (self._key(sid),))
+        self._revoked(cursor, sid)
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+    def revoke_member(self, member_id, keep_sid=None):
+        conn = get_db_connection(track_writes=False)
+        cursor = conn.cursor()
+        if keep_sid is None:
+            cursor.execute("DELETE FROM portal_sessions WHERE member_id = %s", (member_id,))
+        else:
+            cursor.execute("DELETE FROM portal_sessions WHERE member_id = %s AND session_key != %s",
+                           (member_id, self._key(keep_sid)))
+        count = cursor.rowcount
+        # The cache is keyed by session id, not member, so all of it goes
+        self._revoked(cursor)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return count
+
+
+def make_session_store(backend=SESSION_BACKEND):
+    if backend == 'memory':
+        return MemorySessionStore()
+    if backend == 'database':
+        return DatabaseSessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface backed by a MemorySessionStore or DatabaseSessionStore"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        # The cookie is "<session id>.<version>" (see DatabaseSessionStore)
+        sid, _, version = request.cookies.get(self.get_cookie_name(app), '').partition('.')
+        if sid:
+            entry = self.store.get(sid, int(version) if version.isdigit() else None)
+            if entry is not None and entry.expires_at > _now():
+                # Copy so in-place changes to nested values never leak into the store
+                return ServerSideSession(copy.deepcopy(entry.data), sid=sid, expires_at=entry.expires_at,
+                                         version=entry.version)
+            if entry is not None:
+                self.store.delete(sid)
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.sid is not None and (session.rotate or not session):
+            self.store.delete(session.sid)
+            if not session:
+                response.delete_cookie(name, domain=domain, path=path)
+                return
+            session.sid = None
+            session.new = True
+
+        if not session or not (session.new or session.modified):
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+            # Lifetime runs from login; it is not extended by activity
+            session.expires_at = _now() + app.permanent_session_lifetime.total_seconds()
+
+        user_id = session.get('_user_id')
+        member_id = int(user_id) if user_id is not None else None
+        session.version += 1
+        self.store.save(session.sid, SessionEntry(member_id, dict(session), session.expires_at, session.version))
+
+        # Sent on every save, so the browser's next request asks for this version
+        expires = datetime.fromtimestamp(session.expires_at, timezone.utc) if session.permanent else None
+        response.set_cookie(
+            name, f"{session.sid}.{session.version}", expires=expires, domain=domain, path=path,
+            httponly=self.get_cookie_httponly(app), secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def rotate_session():
+    """Issue a new session id on the next response (call on login)"""
+    if hasattr(session, 'rotate'):
+        session.rotate = True
+
+
+def revoke_member_sessions(member_id, keep_current=False):
+    """Log a member out everywhere, optionally keeping the current session"""
+    interface = current_app.session_interface
+    if not isinstance(interface, ServerSideSessionInterface):
+        return 0
+    keep_sid = getattr(session, 'sid', None) if keep_current else None
+    return interface.store.revoke_member(member_id, keep_sid)
@@ -0,0 +1,274 @@
+"""
+Multi-tenant support: one portal deployment serving several clubs.
+
+Each tenant is matched on the request's host name and has its own
+organisation details (name, logo, contact addresses, admin summary
+recipients), its own database and connection pools, and its own roster
+snapshot and session store.
+
+Without TENANTS_FILE the portal serves a single tenant configured from the
+environment (ORG_NAME, DB_*, ADMIN_EMAILS, ...), exactly as before.
+
+TENANTS_FILE names a JSON file:
+
+    {
+      "default": "irc",
+      "tenants": [
+        {
+          "key": "irc",
+          "hosts": ["members.ircinc.org"],
+          "org_name": "Indiana Repeater Council",
+          "org_short_name": "IRC",
+          "db": {"db": "irc_membership_db"},
+          "admin_emails": ["chairman@ircinc.org"]
+        }
+      ]
+    }
+
+Optional tenant fields: logo, app_url, support_url, support_email,
+from_email, db_replica_hosts, db_pool_size and db_password_env. "db" is
+merged over the DB_* settings, so tenants on the same server only need a
+database name; db_password_env names an environment variable holding the
+password so it is not kept in the file. Requests for a host that matches no
+tenant are served by "default" when one is named, otherwise they get a 404.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from werkzeug.exceptions import NotFound
+
+from db import DB_CONFIG, DB_POOL_SIZE, make_router, reset_router, use_router
+from db import router as default_router
+from email_templates import EmailRenderer, default_static_context
+from logs import add_context_field
+
+TENANTS_FILE = os.getenv('TENANTS_FILE') or None
+
+DEFAULT_ADMIN_EMAILS = 'chairman@ircinc.org,ak9r.irc@gmail.com,serc1mp@sbcglobal.net'
+
+
+class Tenant:
+    """One club served by the portal"""
+
+    def __init__(self, key, hosts=(), org_name='Indiana Repeater Council', org_short_name='IRC',
+                 logo='irc-logo1.gif', app_url='http://localhost:5000',
+                 support_url='https://service-desk.ircinc.org', support_email='chairman@ircinc.org',
+                 from_email=None, admin_emails=(), db=None, db_replica_hosts=(),
+                 db_pool_size=None, db_password_env=None, router=None):
+        self.key = key
+        self.hosts = [host.lower() for host in hosts]
+        self.name = org_name
+        self.short_name = org_short_name
+        self.logo = logo
+        self.app_url = app_url.rstrip('/')
+        self.support_url = support_url
+        self.support_email = support_email
+        self.from_email = from_email
+        self.admin_emails = list(admin_emails)
+        self.db_overrides = dict(db or {})
+        if db_password_env:
+            self.db_overrides['passwd'] = os.getenv(db_password_env, '')
+        self.db_replica_hosts = list(db_replica_hosts)
+        self.db_pool_size = db_pool_size
+        self._router = router
+        self._renderer = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """The single tenant described by the environment, sharing the default router"""
+        static = default_static_context()
+        return cls(
+            'default',
+            org_name=static['org_name'],
+            org_short_name=static['org_short'],
+            logo=os.getenv('ORG_LOGO', 'irc-logo1.gif'),
+            app_url=static['app_url'],
+            support_url=static['support_url'],
+            support_email=static['support_email'],
+            from_email=os.getenv('SMTP_FROM_EMAIL') or None,
+            admin_emails=[e.strip() for e in os.getenv('ADMIN_EMAILS', DEFAULT_ADMIN_EMAILS).split(',') if e.strip()],
+            router=default_router,
+        )
+
+    @property
+    def db_config(self):
+        return {**DB_CONFIG, **self.db_overrides}
+
+    @property
+    def router(self):
+        """This tenant's database router, created on first use"""
+        if self._router is None:
+            with self._lock:
+                if self._router is None:
+                    self._router = make_router(self.db_config, self.db_replica_hosts,
+                                               self.db_pool_size or DB_POOL_SIZE)
+        return self._router
+
+    def email_context(self):
+        """Static context for this tenant's emails"""
+        return {
+            'app_url': self.app_url,
+            'org_name': self.name,
+            'org_short': self.short_name,
+            'support_url': self.support_url,
+            'support_host': self.support_url.split('://', 1)[-1],
+            'support_email': self.support_email,
+        }
+
+    @property
+    def email_renderer(self):
+        if self._renderer is None:
+            self._renderer = EmailRenderer(static=self.email_context())
+        return self._renderer
+
+    def __repr__(self):
+        return f"<Tenant {self.key}>"
+
+
+class TenantRegistry:
+    """Tenants by key and by host name"""
+
+    def __init__(self, tenants, default_key=None):
+        self._by_key = {}
+        self._by_host = {}
+        for tenant in tenants:
+            if tenant.key in self._by_key:
+                raise ValueError(f"Duplicate tenant key: {tenant.key}")
+            self._by_key[tenant.key] = tenant
+            for host in tenant.hosts:
+                if host in self._by_host:
+                    raise ValueError(f"Host {host} is assigned to more than one tenant")
+                self._by_host[host] = tenant
+        if default_key is not None and default_key not in self._by_key:
+            raise ValueError(f"Unknown default tenant: {default_key}")
+        self.default = self._by_key.get(default_key)
+
+    def get(self, key):
+        return self._by_key.get(key)
+
+    def for_host(self, host):
+        """Tenant serving `host` (port ignored), the default tenant, or None"""
+        host = (host or '').lower()
+        if ':' in host and not host.endswith(']'):
+            host = host.rsplit(':', 1)[0]
+        return self._by_host.get(host, self.default)
+
+    def __iter__(self):
+        return iter(self._by_key.values())
+
+    def __len__(self):
+        return len(self._by_key)
+
+
+def load_tenants(path=TENANTS_FILE):
+    """Registry from TENANTS_FILE, or a single tenant from the environment"""
+    if not path:
+        tenant = Tenant.from_env()
+        return TenantRegistry([tenant], default_key=tenant.key)
+    with open(path) as f:
+        data = json.load(f)
+    return TenantRegistry([Tenant(**spec) for spec in data['tenants']], data.get('default'))
+
+
+tenants = load_tenants()
+
+_current = ContextVar('tenant', default=None)
+
+
+def current_tenant():
+    """The tenant being served, or the default tenant outside a request"""
+    tenant = _current.get() or tenants.default
+    if tenant is None:
+        raise RuntimeError("No tenant selected and no default tenant configured")
+    return tenant
+
+
+def _tenant_key():
+    tenant = _current.get()
+    return tenant.key if tenant is not None and len(tenants) > 1 else None
+
+
+# Name the tenant in log records when more than one is served
+add_context_field('tenant', _tenant_key)
+
+
+@contextmanager
+def activate(tenant):
+    """Serve `tenant` (and use its database) inside the with block"""
+    token = _current.set(tenant)
+    router_token = use_router(tenant.router)
+    try:
+        yield tenant
+    finally:
+        reset_router(router_token)
+        _current.reset(token)
+
+
+def select_tenants(key=None, all_tenants=False):
+    """Tenants a script should run for: one by key, all, or the default"""
+    if all_tenants:
+        return list(tenants)
+    if key:
+        tenant = tenants.get(key)
+        if tenant is None:
+            raise SystemExit(f"Unknown tenant: {key} (known: {', '.join(t.key for t in tenants)})")
+        return [tenant]
+    return [current_tenant()]
+
+
+class PerTenant:
+    """One object per tenant, created by `factory` on first use.
+
+    Attribute access is delegated to the current tenant's object, so a
+    module-level PerTenant can stand in for what used to be a single
+    process-wide instance (roster snapshot, session store).
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The current tenant's object"""
+        key = current_tenant().key
+        instance = self._instances.get(key)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(key)
+                if instance is None:
+                    instance = self._instances[key] = self._factory()
+        return instance
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+    def __len__(self):
+        return len(self.current())
+
+
+class TenantMiddleware:
+    """WSGI middleware that activates the tenant for the request's host.
+
+    Paths in `open_paths` (health checks) are served for any host, without
+    a tenant when the host matches none.
+    """
+
+    def __init__(self, wsgi_app, registry=None, open_paths=()):
+        self.wsgi_app = wsgi_app
+        self.registry = registry if registry is not None else tenants
+        self.open_paths = frozenset(open_paths)
+
+    def __call__(self, environ, start_response):
+        tenant = self.registry.for_host(environ.get('HTTP_HOST') or environ.get('SERVER_NAME'))
+        if tenant is None:
+            if environ.get('PATH_INFO') in self.open_paths:
+                return self.wsgi_app(environ, start_response)
+            return NotFound()(environ, start_response)
+        with activate(tenant):
+            return self.wsgi_app(environ, start_response)
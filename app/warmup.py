@@ -0,0 +1,84 @@
+"""
+Start-up warm-up hooks for the membership portal.
+
+Each hook does work that would otherwise be paid by the first request a
+worker serves: importing reportlab for the PDF export, opening database
+connections, and compiling the Jinja templates. Which hooks run is set per
+deployment with the WARMUP_HOOKS environment variable (comma separated,
+empty to disable), e.g. WARMUP_HOOKS=reportlab,templates
+"""
+
+import time
+
+DEFAULT_WARMUP_HOOKS = 'reportlab,db_pool,templates'
+
+WARMUP_HOOKS = {}
+
+
+def warmup_hook(name):
+    """Register a warm-up hook under the given name"""
+    def decorator(f):
+        WARMUP_HOOKS[name] = f
+        return f
+    return decorator
+
+
+@warmup_hook('reportlab')
+def preload_reportlab(app):
+    """Import the reportlab modules used by the PDF export and membership cards"""
+    import reportlab.lib.colors
+    import reportlab.lib.enums
+    import reportlab.lib.pagesizes
+    import reportlab.lib.styles
+    import reportlab.lib.units
+    import reportlab.pdfgen.canvas
+    import reportlab.platypus
+    import PIL.ImageDraw
+    # Building the sample stylesheet loads the base fonts
+    reportlab.lib.styles.getSampleStyleSheet()
+
+
+@warmup_hook('db_pool')
+def warm_db_pool(app):
+    """Open pooled database connections to each tenant's primary and any replicas"""
+    from tenants import tenants
+    for tenant in tenants:
+        tenant.router.warm(app.config.get('DB_POOL_WARM'))
+
+
+@warmup_hook('templates')
+def compile_templates(app):
+    """Compile every template into the Jinja cache"""
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+
+def parse_hook_names(value):
+    """Split a WARMUP_HOOKS setting into hook names"""
+    if value is None:
+        value = DEFAULT_WARMUP_HOOKS
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def run_warmup(app, names):
+    """Run the named hooks, recording how long each took.
+
+    A failing hook is logged and skipped so that, for example, a database
+    that is still starting does not prevent the web worker from booting.
+    Returns a dict of hook name to elapsed seconds (None if it failed).
+    """
+    timings = {}
+    for name in names:
+        hook = WARMUP_HOOKS.get(name)
+        if hook is None:
+            app.logger.warning("Unknown warm-up hook: %s", name)
+            continue
+        start = time.perf_counter()
+        try:
+            hook(app)
+            timings[name] = time.perf_counter() - start
+            app.logger.info("Warm-up %s completed in %.1f ms", name, timings[name] * 1000)
+        except Exception as e:
+            timings[name] = None
+            app.logger.warning("Warm-up %s failed: %s", name, e)
+    return timings
@@ -0,0 +1,19 @@
+-- Migration: Add indexes for the analytics reports (Reports page, CSV downloads)
+-- Run this on the database
+
+USE irc_membership_db;
+
+-- Covering indexes: each grouped count reads only its index, never the member rows
+CREATE INDEX idx_members_state_city ON members (state, city, expiration_status);
+CREATE INDEX idx_members_type_status ON members (member_type, expiration_status);
+
+-- Replaces the paid_thru index from add_renewals_ledger.sql with a covering one
+DROP INDEX idx_members_paid_thru ON members;
+CREATE INDEX idx_members_paid_thru ON members (paid_thru, expiration_status);
+
+-- The report cache's version check reads MAX(recorded_at)
+CREATE INDEX idx_renewals_recorded_at ON renewals (recorded_at);
+
+-- Show results
+SHOW INDEX FROM members WHERE Key_name IN ('idx_members_state_city', 'idx_members_type_status', 'idx_members_paid_thru');
+SHOW INDEX FROM renewals WHERE Key_name = 'idx_renewals_recorded_at';
@@ -0,0 +1,27 @@
+-- Migration: Add bulk job tracking for admin bulk actions
+-- Run this on the database
+
+USE irc_membership_db;
+
+-- One row per bulk email job; progress is updated as messages are sent
+CREATE TABLE IF NOT EXISTS bulk_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    action VARCHAR(32) NOT NULL COMMENT 'send-notice or reset-password',
+    requested_by INT NOT NULL COMMENT 'Admin member id',
+    total INT NOT NULL DEFAULT 0,
+    processed INT NOT NULL DEFAULT 0,
+    failed INT NOT NULL DEFAULT 0,
+    status VARCHAR(16) NOT NULL DEFAULT 'running' COMMENT 'running, done, failed, abandoned',
+    errors TEXT DEFAULT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP NULL DEFAULT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT 'Last progress write; stale running jobs are abandoned',
+    INDEX idx_bulk_jobs_created (created_at)
+);
+
+-- Tables created before the progress heartbeat
+ALTER TABLE bulk_jobs
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT 'Last progress write; stale running jobs are abandoned';
+
+-- Show results
+DESCRIBE bulk_jobs;
@@ -0,0 +1,45 @@
+-- Migration: Add the roster change feed and its consumers
+-- Run this on the database
+
+USE irc_membership_db;
+
+-- Single row handing out event ids; writers lock it until they commit,
+-- so events become visible in id order
+CREATE TABLE IF NOT EXISTS change_feed_state (
+    id TINYINT UNSIGNED PRIMARY KEY,
+    last_id BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Last event id handed out',
+    pruned_through BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Events up to here were deleted by retention'
+);
+
+INSERT IGNORE INTO change_feed_state (id) VALUES (1);
+
+-- One row per member write; id is the feed cursor
+CREATE TABLE IF NOT EXISTS member_changes (
+    id BIGINT UNSIGNED PRIMARY KEY COMMENT 'Cursor, from change_feed_state.last_id',
+    member_id INT NOT NULL,
+    op VARCHAR(8) NOT NULL COMMENT 'insert, update, delete',
+    payload TEXT NOT NULL COMMENT 'Member snapshot as JSON (id and call_sign for deletes)',
+    created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    INDEX idx_member_changes_created (created_at)
+);
+
+-- Systems reading the feed: by API token, by webhook, or both
+CREATE TABLE IF NOT EXISTS feed_consumers (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(64) NOT NULL UNIQUE,
+    token_hash CHAR(64) NOT NULL UNIQUE COMMENT 'SHA-256 of the API token',
+    webhook_url VARCHAR(500) NULL DEFAULT NULL,
+    webhook_secret VARCHAR(128) NULL DEFAULT NULL COMMENT 'HMAC key for X-Portal-Signature',
+    delivered_through BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Last event id acknowledged by the webhook',
+    failures INT NOT NULL DEFAULT 0 COMMENT 'Consecutive failed deliveries',
+    next_attempt_at DATETIME NULL DEFAULT NULL,
+    last_delivery_at DATETIME NULL DEFAULT NULL,
+    last_error VARCHAR(500) NULL DEFAULT NULL,
+    active TINYINT(1) NOT NULL DEFAULT 1,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Show results
+DESCRIBE member_changes;
+DESCRIBE feed_consumers;
+SELECT * FROM change_feed_state;
@@ -0,0 +1,20 @@
+-- Migration: Add bounce tracking for undeliverable email addresses
+-- Run this on the database
+
+USE irc_membership_db;
+
+-- One row per address that has bounced; filled by scripts/process_bounces.py
+CREATE TABLE IF NOT EXISTS email_bounces (
+    email VARCHAR(100) NOT NULL PRIMARY KEY COMMENT 'Lower-case address',
+    hard_bounces INT NOT NULL DEFAULT 0 COMMENT 'Permanent failures (5.x.x)',
+    soft_bounces INT NOT NULL DEFAULT 0 COMMENT 'Transient failures given up on (4.x.x)',
+    last_status VARCHAR(16) DEFAULT NULL COMMENT 'Last DSN status code',
+    last_diagnostic VARCHAR(255) DEFAULT NULL,
+    first_bounced_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_bounced_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    undeliverable TINYINT(1) NOT NULL DEFAULT 0 COMMENT 'Skip this address when sending',
+    INDEX idx_email_bounces_undeliverable (undeliverable)
+);
+
+-- Show results
+DESCRIBE email_bounces;
@@ -0,0 +1,22 @@
+-- Migration: Add rolling-window expiration policy tracking
+-- Run this on the database, then run the expiration checker once with
+-- --resync so stored statuses match the new policy before any emails go out
+
+USE irc_membership_db;
+
+-- Reminder window (days before end of term) the member was last notified for,
+-- and the next date their status or window changes
+ALTER TABLE members
+ADD COLUMN expiration_window SMALLINT DEFAULT NULL COMMENT 'Reminder window in days last notified while expiring',
+ADD COLUMN next_transition_date DATE DEFAULT NULL COMMENT 'Next date the expiration checker needs to evaluate this member';
+
+-- The checker only reads members whose next transition has arrived
+CREATE INDEX idx_members_next_transition ON members (next_transition_date);
+
+-- Evaluate everyone on the next run
+UPDATE members SET next_transition_date = CURDATE();
+
+-- Show results
+SELECT COUNT(*) as total_members,
+       SUM(CASE WHEN next_transition_date <= CURDATE() THEN 1 ELSE 0 END) as due_for_check
+FROM members;
@@ -0,0 +1,27 @@
+-- Migration: Add server-side session storage
+-- Only needed when SESSION_BACKEND=database (multiple web workers or containers)
+
+USE irc_membership_db;
+
+-- One row per logged-in browser session; session_key is a SHA-256 of the cookie value
+CREATE TABLE IF NOT EXISTS portal_sessions (
+    session_key CHAR(64) NOT NULL PRIMARY KEY,
+    member_id INT DEFAULT NULL,
+    data TEXT NOT NULL,
+    expires_at DOUBLE NOT NULL COMMENT 'Unix timestamp',
+    version INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Bumped on every save; also in the cookie',
+    INDEX idx_portal_sessions_member (member_id),
+    INDEX idx_portal_sessions_expires (expires_at)
+);
+
+-- Bumped on every logout or revocation; workers drop their session cache when it changes
+CREATE TABLE IF NOT EXISTS portal_session_state (
+    id TINYINT UNSIGNED PRIMARY KEY,
+    revocations BIGINT UNSIGNED NOT NULL DEFAULT 0
+);
+
+INSERT IGNORE INTO portal_session_state (id) VALUES (1);
+
+-- Show results
+DESCRIBE portal_sessions;
+SELECT * FROM portal_session_state;
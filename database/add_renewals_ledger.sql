@@ -0,0 +1,55 @@
+-- Migration: Add the renewals ledger and derive paid_thru from it
+-- Run this on the database. Members whose paid_thru was not a plain year
+-- are listed at the end; their original values are kept in
+-- members_paid_thru_legacy. Record a renewal for each of them in the portal.
+-- Afterwards run the expiration checker once with --resync.
+
+USE irc_membership_db;
+
+-- One row per membership year paid for by a member
+CREATE TABLE IF NOT EXISTS renewals (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    member_id INT NOT NULL,
+    period_year SMALLINT UNSIGNED NOT NULL COMMENT 'Membership year paid for',
+    amount DECIMAL(8,2) DEFAULT NULL COMMENT 'NULL when not known (imported)',
+    method VARCHAR(16) NOT NULL DEFAULT 'other' COMMENT 'cash, check, card, paypal, waived, other, import',
+    reference VARCHAR(64) DEFAULT NULL COMMENT 'Check number, transaction id, ...',
+    recorded_by INT DEFAULT NULL COMMENT 'Admin member id',
+    paid_on DATE NOT NULL,
+    recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_renewals_member_period (member_id, period_year),
+    INDEX idx_renewals_period (period_year, method, amount, member_id),
+    INDEX idx_renewals_paid_on (paid_on, amount),
+    CONSTRAINT fk_renewals_member FOREIGN KEY (member_id) REFERENCES members (id) ON DELETE CASCADE
+);
+
+-- Keep the free-text values that are not a year
+CREATE TABLE IF NOT EXISTS members_paid_thru_legacy (
+    member_id INT NOT NULL PRIMARY KEY,
+    paid_thru VARCHAR(50) DEFAULT NULL,
+    saved_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO members_paid_thru_legacy (member_id, paid_thru)
+SELECT id, paid_thru FROM members
+WHERE paid_thru IS NOT NULL AND TRIM(paid_thru) NOT REGEXP '^[0-9]{4}$';
+
+-- Seed the ledger with each member's current paid-through year
+INSERT IGNORE INTO renewals (member_id, period_year, amount, method, reference, paid_on)
+SELECT id, CAST(TRIM(paid_thru) AS UNSIGNED), NULL, 'import', 'Imported from paid_thru', COALESCE(DATE(created_at), CURDATE())
+FROM members
+WHERE TRIM(paid_thru) REGEXP '^[0-9]{4}$';
+
+-- paid_thru becomes a derived integer year, maintained from the ledger
+UPDATE members SET paid_thru = NULL WHERE paid_thru IS NOT NULL AND TRIM(paid_thru) NOT REGEXP '^[0-9]{4}$';
+ALTER TABLE members
+MODIFY paid_thru SMALLINT UNSIGNED DEFAULT NULL COMMENT 'Derived: latest renewals.period_year';
+CREATE INDEX idx_members_paid_thru ON members (paid_thru);
+
+-- Show results
+SELECT COUNT(*) AS renewals, COUNT(DISTINCT member_id) AS members, MIN(period_year), MAX(period_year)
+FROM renewals;
+SELECT m.call_sign, l.paid_thru AS legacy_paid_thru
+FROM members_paid_thru_legacy l
+JOIN members m ON m.id = l.member_id
+ORDER BY m.call_sign;
@@ -0,0 +1,14 @@
+-- Migration: Add row change tracking for the in-memory roster snapshot
+-- Run this on the database
+
+USE irc_membership_db;
+
+-- Last modification time of each member row, maintained by MariaDB
+ALTER TABLE members
+ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'Last time this row changed';
+
+-- The portal fetches only rows changed since its last refresh
+CREATE INDEX idx_members_updated_at ON members (updated_at);
+
+-- Show results
+SELECT COUNT(*) as total_members, MAX(updated_at) as last_change FROM members;
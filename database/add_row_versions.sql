@@ -0,0 +1,21 @@
+-- Migration: Add row versions for conditional GET (ETag / 304) on member pages
+-- Run this on the database
+
+USE irc_membership_db;
+
+-- Incremented by the trigger below on every update of a member row
+ALTER TABLE members
+ADD COLUMN row_version INT UNSIGNED NOT NULL DEFAULT 1 COMMENT 'Bumped on every update; part of page ETags';
+
+CREATE TRIGGER IF NOT EXISTS members_row_version
+BEFORE UPDATE ON members
+FOR EACH ROW SET NEW.row_version = OLD.row_version + 1;
+
+-- Microsecond resolution, so two edits within one second still change the
+-- roster version (COUNT(*), MAX(updated_at)) the dashboard ETag is built from
+ALTER TABLE members
+MODIFY updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6) COMMENT 'Last time this row changed';
+
+-- Show results
+SHOW TRIGGERS LIKE 'members';
+SELECT COUNT(*) AS total_members, MAX(row_version) AS max_row_version, MAX(updated_at) AS last_change FROM members;
@@ -0,0 +1,33 @@
+-- Migration: Add scheduler state and run history for the scheduler worker
+-- Run this on the database
+
+USE irc_membership_db;
+
+-- One row per job: its schedule and the last slot run, shared by all workers
+CREATE TABLE IF NOT EXISTS scheduled_jobs (
+    name VARCHAR(64) PRIMARY KEY,
+    schedule VARCHAR(64) NOT NULL COMMENT 'e.g. daily 09:00, every 15 minutes, off',
+    last_slot DATETIME NULL DEFAULT NULL COMMENT 'Latest slot run or skipped',
+    last_status VARCHAR(16) NULL DEFAULT NULL COMMENT 'ok, failed, skipped',
+    next_run_at DATETIME NULL DEFAULT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- One row per run; rows older than SCHEDULER_HISTORY_DAYS are deleted by the worker
+CREATE TABLE IF NOT EXISTS scheduled_runs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    job_name VARCHAR(64) NOT NULL,
+    slot DATETIME NOT NULL COMMENT 'Scheduled time this run is for',
+    host VARCHAR(128) NOT NULL COMMENT 'Worker host and pid',
+    started_at DATETIME(3) NOT NULL,
+    finished_at DATETIME(3) NULL DEFAULT NULL,
+    duration_ms INT UNSIGNED NULL DEFAULT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'running' COMMENT 'running, ok, failed, abandoned',
+    error TEXT DEFAULT NULL,
+    INDEX idx_scheduled_runs_job (job_name, started_at),
+    INDEX idx_scheduled_runs_started (started_at)
+);
+
+-- Show results
+DESCRIBE scheduled_jobs;
+DESCRIBE scheduled_runs;
@@ -0,0 +1,185 @@
+-- IRC Membership Portal - SQLite Schema
+-- The full schema (all migrations applied) for DB_BACKEND=sqlite, the local
+-- development and test mode. Not used with MariaDB.
+--
+-- The portal runs this automatically the first time it opens an empty
+-- SQLite database (see SQLITE_SCHEMA in app/db.py). Column types keep the
+-- MariaDB names so dates, timestamps and amounts come back as the same
+-- Python types.
+--
+-- Keep in step with the MariaDB migrations in this directory.
+
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE IF NOT EXISTS members (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    call_sign VARCHAR(20) NOT NULL UNIQUE,
+    password_hash VARCHAR(255) NOT NULL,
+    email VARCHAR(100) DEFAULT NULL UNIQUE,
+    name VARCHAR(100) DEFAULT NULL,
+    primary_rep VARCHAR(100) DEFAULT NULL,
+    rep_call VARCHAR(20) DEFAULT NULL,
+    address VARCHAR(200) DEFAULT NULL,
+    city VARCHAR(100) DEFAULT NULL,
+    state VARCHAR(2) DEFAULT NULL,
+    zip VARCHAR(10) DEFAULT NULL,
+    telephone VARCHAR(20) DEFAULT NULL,
+    paid_thru SMALLINT DEFAULT NULL,
+    member_type VARCHAR(20) DEFAULT NULL,
+    is_admin TINYINT NOT NULL DEFAULT 0,
+    admin_comments TEXT DEFAULT NULL,
+    expiration_notice_sent DATE DEFAULT NULL,
+    expiration_status VARCHAR(20) DEFAULT 'unknown',
+    expiration_window SMALLINT DEFAULT NULL,
+    next_transition_date DATE DEFAULT NULL,
+    row_version INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_members_next_transition ON members (next_transition_date);
+CREATE INDEX IF NOT EXISTS idx_members_updated_at ON members (updated_at);
+CREATE INDEX IF NOT EXISTS idx_members_state_city ON members (state, city, expiration_status);
+CREATE INDEX IF NOT EXISTS idx_members_type_status ON members (member_type, expiration_status);
+CREATE INDEX IF NOT EXISTS idx_members_paid_thru ON members (paid_thru, expiration_status);
+
+-- Stands in for MariaDB's BEFORE UPDATE trigger and ON UPDATE CURRENT_TIMESTAMP(6)
+CREATE TRIGGER IF NOT EXISTS members_row_version
+AFTER UPDATE ON members
+FOR EACH ROW
+BEGIN
+    UPDATE members
+    SET row_version = OLD.row_version + 1,
+        updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')
+    WHERE id = NEW.id;
+END;
+
+CREATE TABLE IF NOT EXISTS password_reset_tokens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES members (id) ON DELETE CASCADE,
+    token VARCHAR(64) NOT NULL UNIQUE,
+    expires_at DATETIME NOT NULL,
+    used TINYINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS email_bounces (
+    email VARCHAR(100) NOT NULL PRIMARY KEY,
+    hard_bounces INTEGER NOT NULL DEFAULT 0,
+    soft_bounces INTEGER NOT NULL DEFAULT 0,
+    last_status VARCHAR(16) DEFAULT NULL,
+    last_diagnostic VARCHAR(255) DEFAULT NULL,
+    first_bounced_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    last_bounced_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    undeliverable TINYINT NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_email_bounces_undeliverable ON email_bounces (undeliverable);
+
+CREATE TABLE IF NOT EXISTS renewals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    member_id INTEGER NOT NULL REFERENCES members (id) ON DELETE CASCADE,
+    period_year SMALLINT NOT NULL,
+    amount DECIMAL(8,2) DEFAULT NULL,
+    method VARCHAR(16) NOT NULL DEFAULT 'other',
+    reference VARCHAR(64) DEFAULT NULL,
+    recorded_by INTEGER DEFAULT NULL,
+    paid_on DATE NOT NULL,
+    recorded_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    UNIQUE (member_id, period_year)
+);
+
+CREATE INDEX IF NOT EXISTS idx_renewals_period ON renewals (period_year, method, amount, member_id);
+CREATE INDEX IF NOT EXISTS idx_renewals_paid_on ON renewals (paid_on, amount);
+CREATE INDEX IF NOT EXISTS idx_renewals_recorded_at ON renewals (recorded_at);
+
+CREATE TABLE IF NOT EXISTS bulk_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    action VARCHAR(32) NOT NULL,
+    requested_by INTEGER NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    status VARCHAR(16) NOT NULL DEFAULT 'running',
+    errors TEXT DEFAULT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    finished_at TIMESTAMP NULL DEFAULT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_bulk_jobs_created ON bulk_jobs (created_at);
+
+CREATE TABLE IF NOT EXISTS portal_sessions (
+    session_key CHAR(64) NOT NULL PRIMARY KEY,
+    member_id INTEGER DEFAULT NULL,
+    data TEXT NOT NULL,
+    expires_at DOUBLE NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_portal_sessions_member ON portal_sessions (member_id);
+CREATE INDEX IF NOT EXISTS idx_portal_sessions_expires ON portal_sessions (expires_at);
+
+CREATE TABLE IF NOT EXISTS portal_session_state (
+    id INTEGER PRIMARY KEY,
+    revocations INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO portal_session_state (id) VALUES (1);
+
+CREATE TABLE IF NOT EXISTS scheduled_jobs (
+    name VARCHAR(64) PRIMARY KEY,
+    schedule VARCHAR(64) NOT NULL,
+    last_slot DATETIME NULL DEFAULT NULL,
+    last_status VARCHAR(16) NULL DEFAULT NULL,
+    next_run_at DATETIME NULL DEFAULT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS scheduled_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_name VARCHAR(64) NOT NULL,
+    slot DATETIME NOT NULL,
+    host VARCHAR(128) NOT NULL,
+    started_at DATETIME NOT NULL,
+    finished_at DATETIME NULL DEFAULT NULL,
+    duration_ms INTEGER NULL DEFAULT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'running',
+    error TEXT DEFAULT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_scheduled_runs_job ON scheduled_runs (job_name, started_at);
+CREATE INDEX IF NOT EXISTS idx_scheduled_runs_started ON scheduled_runs (started_at);
+
+CREATE TABLE IF NOT EXISTS change_feed_state (
+    id INTEGER PRIMARY KEY,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    pruned_through INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO change_feed_state (id) VALUES (1);
+
+CREATE TABLE IF NOT EXISTS member_changes (
+    id INTEGER PRIMARY KEY,
+    member_id INTEGER NOT NULL,
+    op VARCHAR(8) NOT NULL,
+    payload TEXT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_member_changes_created ON member_changes (created_at);
+
+CREATE TABLE IF NOT EXISTS feed_consumers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(64) NOT NULL UNIQUE,
+    token_hash CHAR(64) NOT NULL UNIQUE,
+    webhook_url VARCHAR(500) NULL DEFAULT NULL,
+    webhook_secret VARCHAR(128) NULL DEFAULT NULL,
+    delivered_through INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NULL DEFAULT NULL,
+    last_delivery_at DATETIME NULL DEFAULT NULL,
+    last_error VARCHAR(500) NULL DEFAULT NULL,
+    active TINYINT NOT NULL DEFAULT 1,
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Analytics Report
+
+Runs the reports behind the admin Reports page (app/analytics.py): member
+counts by state, city, member type and paid-through year, and year-over-year
+retention from the renewals ledger. Prints each report with its query time,
+and optionally writes every report as CSV.
+
+Each report is one GROUP BY query over a covering index
+(database/add_analytics_indexes.sql); on a 100,000-member roster all of
+them together should finish well under a second.
+
+Usage:
+    python3 analytics_report.py                    # all reports, top 10 rows each
+    python3 analytics_report.py --report city --rows 50
+    python3 analytics_report.py --csv /backups/reports --tenant w9club
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+from analytics import REPORT_TITLES, build_report, report_csv
+from db import get_db_connection, dict_cursor
+from tenants import activate, select_tenants
+
+
+def format_value(key, value):
+    if value is None:
+        return '-'
+    if key in ('retention', 'churn'):
+        return f"{value:.1%}"
+    return str(value)
+
+
+def print_report(report, limit):
+    print(report.title)
+    widths = [max(len(label), 6) for _, label in report.columns]
+    print('  ' + '  '.join(label.ljust(width) for (_, label), width in zip(report.columns, widths)))
+    for row in report.rows[:limit]:
+        print('  ' + '  '.join(format_value(key, row[key]).ljust(width)
+                               for (key, _), width in zip(report.columns, widths)))
+    if len(report.rows) > limit:
+        print(f"  ... {len(report.rows) - limit} more rows")
+
+
+def run(cursor, names, years, limit, csv_dir, prefix):
+    total = 0.0
+    for name in names:
+        start = time.perf_counter()
+        report = build_report(cursor, name, years)
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        print_report(report, limit)
+        print(f"  ({len(report.rows)} rows in {elapsed * 1000:.1f}ms)\n")
+        if csv_dir:
+            path = os.path.join(csv_dir, f"{prefix}_{name}.csv")
+            with open(path, 'w', newline='') as f:
+                f.write(report_csv(report))
+            print(f"  Written to {path}\n")
+    print(f"All reports: {total * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Membership analytics reports')
+    parser.add_argument('--report', choices=list(REPORT_TITLES), action='append',
+                        help='report to run (repeatable; default all)')
+    parser.add_argument('--years', type=int, default=10, help='membership years of retention history')
+    parser.add_argument('--rows', type=int, default=10, help='rows of each report to print')
+    parser.add_argument('--csv', metavar='DIR', help='also write each report as CSV to this directory')
+    tenant_group = parser.add_mutually_exclusive_group()
+    tenant_group.add_argument('--tenant', metavar='KEY', help='tenant to report on')
+    tenant_group.add_argument('--all-tenants', action='store_true', help='report on every tenant')
+    args = parser.parse_args()
+
+    if args.csv:
+        os.makedirs(args.csv, exist_ok=True)
+
+    for tenant in select_tenants(args.tenant, args.all_tenants):
+        with activate(tenant):
+            print("=" * 60)
+            print(f"{tenant.short_name} Analytics Report")
+            print("=" * 60)
+            conn = get_db_connection(read_only=True)
+            cursor = dict_cursor(conn)
+            try:
+                run(cursor, args.report or list(REPORT_TITLES), args.years, args.rows, args.csv, tenant.short_name)
+            finally:
+                cursor.close()
+                conn.close()
+            print()
+
+
+if __name__ == '__main__':
+    main()
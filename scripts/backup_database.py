@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Database Backup
+
+Python version of backup_and_email.sh, run daily by the scheduler worker
+(scheduler_worker.py) or by hand. For each tenant it:
+
+1. Dumps the database with mariadb-dump (schema, data, routines, triggers)
+2. Exports the members table to CSV
+3. Zips both into BACKUP_DIR and emails the archive to the tenant's admins
+4. Deletes archives older than BACKUP_RETENTION_DAYS
+
+mariadb-dump connects to the tenant's database server over the network
+with the portal's credentials, so it needs the MariaDB client installed
+where this runs (BACKUP_DUMP_COMMAND names another binary). With
+DB_BACKEND=sqlite the dump is written by Python's sqlite3 instead.
+
+Configuration (environment):
+- BACKUP_DIR: where archives are kept (required)
+- BACKUP_RETENTION_DAYS: archives older than this are deleted (default 30)
+- BACKUP_DUMP_COMMAND: dump program (default mariadb-dump)
+
+Usage:
+    python3 backup_database.py
+    python3 backup_database.py --tenant w9club --no-email
+"""
+
+import argparse
+import csv
+import glob
+import io
+import logging
+import os
+import smtplib
+import subprocess
+import sys
+import time
+import zipfile
+from datetime import datetime
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+from db import DB_BACKEND, get_db_connection, dict_cursor
+from logs import configure_logging, log_context, log_mail
+from tenants import activate, current_tenant, select_tenants
+
+BACKUP_DIR = os.getenv('BACKUP_DIR') or None
+BACKUP_RETENTION_DAYS = int(os.getenv('BACKUP_RETENTION_DAYS', 30))
+BACKUP_DUMP_COMMAND = os.getenv('BACKUP_DUMP_COMMAND', 'mariadb-dump')
+
+SMTP_CONFIG = {
+    'host': os.getenv('SMTP_HOST'),
+    'port': int(os.getenv('SMTP_PORT', 587)),
+    'user': os.getenv('SMTP_USER'),
+    'password': os.getenv('SMTP_PASSWORD'),
+    'from_email': os.getenv('SMTP_FROM_EMAIL')
+}
+
+CSV_COLUMNS = ('call_sign', 'name', 'email', 'city', 'state', 'member_type', 'paid_thru', 'admin', 'created_at')
+
+logger = logging.getLogger('portal.backup')
+
+
+def dump_database(config):
+    """SQL dump of the tenant's database, as bytes"""
+    if DB_BACKEND == 'sqlite':
+        return dump_sqlite()
+    command = [
+        BACKUP_DUMP_COMMAND,
+        f"--host={config.get('host', 'localhost')}",
+        f"--port={config.get('port', 3306)}",
+        f"--user={config.get('user', '')}",
+        '--single-transaction', '--quick', '--skip-lock-tables', '--routines', '--triggers',
+        config['db'],
+    ]
+    # Password through the environment, not the process list
+    env = dict(os.environ, MYSQL_PWD=config.get('passwd', ''))
+    result = subprocess.run(command, env=env, capture_output=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"{BACKUP_DUMP_COMMAND} failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+def dump_sqlite():
+    """SQL dump of the current tenant's SQLite development database, as bytes"""
+    conn = get_db_connection(track_writes=False)
+    try:
+        return '\n'.join(conn.iterdump()).encode()
+    finally:
+        conn.close()
+
+
+def export_members_csv(cursor):
+    """(CSV text of the members table, member count, admin count)"""
+    cursor.execute("""
+        SELECT call_sign, name, email, city, state, member_type, paid_thru,
+               CASE WHEN is_admin = 1 THEN 'Yes' ELSE 'No' END AS admin, created_at
+        FROM members
+        ORDER BY call_sign
+    """)
+    output = io.StringIO()
+    writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC)
+    writer.writerow(CSV_COLUMNS)
+    members = admins = 0
+    for row in cursor.fetchall():
+        writer.writerow(['' if row[column] is None else row[column] for column in CSV_COLUMNS])
+        members += 1
+        admins += row['admin'] == 'Yes'
+    return output.getvalue(), members, admins
+
+
+def send_backup_email(tenant, path, members, admins):
+    name = os.path.basename(path)
+    size_kb = os.path.getsize(path) / 1024
+    msg = MIMEMultipart()
+    msg['From'] = tenant.from_email or SMTP_CONFIG['from_email']
+    msg['To'] = ', '.join(tenant.admin_emails)
+    msg['Subject'] = f"{tenant.short_name} Membership Backup - {datetime.now():%m%d%Y_%H%M} ({members} members)"
+    msg.attach(MIMEText(f"""{tenant.short_name} Membership Database Backup Report
+=====================================
+Date: {datetime.now():%Y-%m-%d %H:%M:%S}
+Backup File: {name}
+Size: {size_kb:,.0f} KB
+Members: {members}
+Admins: {admins}
+Database: {tenant.db_config['db']}
+
+Backup Contents:
+- Full SQL dump (schema + data)
+- CSV export (members table)
+
+Restore Instructions:
+1. unzip {name}
+2. docker exec -i irc_membership_db mariadb -u root -p {tenant.db_config['db']} < {name[:-4]}.sql
+
+This is an automated backup from the {tenant.short_name} Membership Portal.
+
+73,
+{tenant.name}
+Automated Backup System
+=====================================
+""", 'plain'))
+    with open(path, 'rb') as f:
+        msg.attach(MIMEApplication(f.read(), 'zip', Name=name))
+    msg.get_payload()[-1].add_header('Content-Disposition', 'attachment', filename=name)
+
+    start = time.perf_counter()
+    try:
+        with smtplib.SMTP(SMTP_CONFIG['host'], SMTP_CONFIG['port']) as server:
+            server.starttls()
+            server.login(SMTP_CONFIG['user'], SMTP_CONFIG['password'])
+            server.send_message(msg)
+    except Exception as e:
+        log_mail(tenant.admin_emails, msg['Subject'], time.perf_counter() - start, error=e)
+        raise
+    log_mail(tenant.admin_emails, msg['Subject'], time.perf_counter() - start)
+
+
+def prune_backups(directory, prefix, days=BACKUP_RETENTION_DAYS):
+    """Delete this tenant's archives older than `days`; returns how many"""
+    cutoff = time.time() - days * 86400
+    removed = 0
+    for path in glob.glob(os.path.join(directory, f"{prefix}_*.zip")):
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def run_backup(tenant=None, email=True):
+    """Back up the current (or given) tenant's database; returns the archive path"""
+    tenant = tenant or current_tenant()
+    if not BACKUP_DIR:
+        raise RuntimeError("BACKUP_DIR is not set")
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    started = time.perf_counter()
+    config = tenant.db_config
+    name = f"{config['db']}_{datetime.now():%m%d%Y_%H%M}"
+    path = os.path.join(BACKUP_DIR, f"{name}.zip")
+
+    print(f"Starting {tenant.short_name} backup at {datetime.now():%Y-%m-%d %H:%M:%S}")
+    dump = dump_database(config)
+    print(f"✓ SQL dump completed ({len(dump) / 1024:,.0f} KB)")
+
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    try:
+        members_csv, members, admins = export_members_csv(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+    print(f"✓ CSV export completed: {members} members ({admins} admins)")
+
+    # Written under a temporary name so a partial archive is never mistaken for a backup
+    with zipfile.ZipFile(path + '.part', 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        archive.writestr(f"{name}.sql", dump)
+        archive.writestr(f"{name}_members.csv", members_csv)
+    os.replace(path + '.part', path)
+    print(f"✓ ZIP created: {path}")
+
+    if email:
+        if tenant.admin_emails:
+            send_backup_email(tenant, path, members, admins)
+            print(f"✓ Backup emailed to: {', '.join(tenant.admin_emails)}")
+        else:
+            print("✗ No admin emails configured - backup kept locally only")
+
+    removed = prune_backups(BACKUP_DIR, config['db'])
+    logger.info("Backup finished", extra={
+        'event': 'backup', 'file': path, 'bytes': os.path.getsize(path), 'members': members,
+        'emailed': email and bool(tenant.admin_emails), 'pruned': removed,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Back up the membership database and email it to the admins')
+    parser.add_argument('--no-email', action='store_true', help='keep the archive locally without emailing it')
+    tenant_group = parser.add_mutually_exclusive_group()
+    tenant_group.add_argument('--tenant', metavar='KEY', help='tenant to back up')
+    tenant_group.add_argument('--all-tenants', action='store_true', help='back up every tenant')
+    args = parser.parse_args()
+
+    if not BACKUP_DIR:
+        parser.error('set BACKUP_DIR in the environment')
+
+    configure_logging()
+    for tenant in select_tenants(args.tenant, args.all_tenants):
+        with activate(tenant), log_context(sampled=True):
+            run_backup(tenant, email=not args.no_email)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Email Rendering Benchmark
+
+Measures how fast notification emails are rendered with the shared
+templates (app/email_templates.py), comparing:
+- per-message rendering that binds the static context every time
+- per-message rendering through one EmailRenderer (static context bound once)
+- render_batch() for the whole run
+
+Usage:
+    python3 bench_email_render.py                   # 10,000 messages
+    python3 bench_email_render.py --messages 50000
+    python3 bench_email_render.py --template update_notice
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+from email_templates import EmailRenderer, TEMPLATES, to_mime
+
+
+def contexts(count):
+    """Per-recipient context for `count` synthetic members"""
+    today = date.today()
+    for i in range(count):
+        yield {
+            'call_sign': f"K{i % 10}{chr(65 + i % 26)}{chr(65 + (i // 26) % 26)}{chr(65 + (i // 676) % 26)}",
+            'paid_thru': today.year,
+            'current_year': today.year,
+            'term_end': f"December 31, {today.year}",
+            'days_remaining': i % 60,
+            'reset_url': f"https://portal.example.org/reset-password/{i:032x}",
+        }
+
+
+def timed(label, count, render):
+    start = time.perf_counter()
+    render()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else float('inf')
+    print(f"  {label:<34} {elapsed:8.3f}s  {rate:12,.0f} msgs/sec")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark notification email rendering')
+    parser.add_argument('--messages', type=int, default=10000, help='messages to render (default 10000)')
+    parser.add_argument('--template', default='membership_expiring', choices=sorted(TEMPLATES),
+                        help='template to render (default membership_expiring)')
+    parser.add_argument('--mime', action='store_true', help='also time building MIME messages')
+    args = parser.parse_args()
+
+    batch = list(contexts(args.messages))
+    print(f"Rendering {args.messages:,} '{args.template}' messages")
+    print()
+
+    def unbound():
+        for context in batch:
+            EmailRenderer().render(args.template, **context)
+
+    renderer = EmailRenderer()
+
+    def bound():
+        for context in batch:
+            renderer.render(args.template, **context)
+
+    def batched():
+        renderer.render_batch(args.template, batch)
+
+    baseline = timed('per message, bind every time', args.messages, unbound)
+    cached = timed('per message, bound renderer', args.messages, bound)
+    batch_rate = timed('render_batch', args.messages, batched)
+
+    if args.mime:
+        emails = renderer.render_batch(args.template, batch)
+        timed('MIME build (to_mime)', args.messages, lambda: [
+            to_mime(email, 'noreply@example.org', 'member@example.org') for email in emails])
+
+    print()
+    print(f"Bound renderer speed-up:  {cached / baseline:.1f}x")
+    print(f"render_batch speed-up:    {batch_rate / baseline:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
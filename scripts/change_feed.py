@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Change Feed Consumers
+
+Manages the systems that mirror the roster from the change feed
+(app/changes.py). Each consumer gets an API token for GET /api/changes and,
+optionally, a webhook URL that the scheduler worker pushes changes to,
+signed with the consumer's secret. The token and secret are printed once,
+when the consumer is added.
+
+Usage:
+    python3 change_feed.py add repeaters                     # pull only
+    python3 change_feed.py add lists --webhook https://lists.example.org/hooks/irc
+    python3 change_feed.py list
+    python3 change_feed.py reset lists --cursor 0            # redeliver everything retained
+    python3 change_feed.py deliver                           # push pending webhooks now
+    python3 change_feed.py remove repeaters
+"""
+
+import argparse
+import os
+import secrets
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+from changes import deliver_webhooks, hash_token
+from db import get_db_connection, dict_cursor
+from logs import configure_logging, log_context
+from tenants import activate, select_tenants
+
+
+def add_consumer(cursor, args):
+    if args.webhook and not args.webhook.startswith(('https://', 'http://')):
+        sys.exit("✗ --webhook must be an http(s) URL")
+    token = secrets.token_urlsafe(32)
+    secret = secrets.token_hex(32) if args.webhook else None
+    # New consumers start at the current end of the feed unless asked for the history
+    cursor.execute("SELECT last_id, pruned_through FROM change_feed_state WHERE id = 1")
+    state = cursor.fetchone()
+    start = state['pruned_through'] if args.from_start else state['last_id']
+    cursor.execute("""
+        INSERT INTO feed_consumers (name, token_hash, webhook_url, webhook_secret, delivered_through)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (args.name, hash_token(token), args.webhook, secret, start))
+    print(f"✓ Added consumer {args.name}")
+    print(f"  API token:      {token}")
+    if secret:
+        print(f"  Webhook URL:    {args.webhook}")
+        print(f"  Webhook secret: {secret}")
+        print(f"  First delivery: changes after cursor {start}")
+    else:
+        print(f"  Start polling from cursor {start}")
+    print("  Store these now; they are not shown again.")
+
+
+def list_consumers(cursor):
+    cursor.execute("SELECT last_id, pruned_through FROM change_feed_state WHERE id = 1")
+    state = cursor.fetchone()
+    print(f"Latest cursor: {state['last_id']}  (retained after {state['pruned_through']})")
+    cursor.execute("""
+        SELECT name, webhook_url, delivered_through, failures, next_attempt_at,
+               last_delivery_at, last_error, active
+        FROM feed_consumers
+        ORDER BY name
+    """)
+    consumers = cursor.fetchall()
+    if not consumers:
+        print("No consumers.")
+    for c in consumers:
+        status = 'active' if c['active'] else 'disabled'
+        print(f"\n{c['name']} ({status})")
+        if not c['webhook_url']:
+            print("  Pull only (GET /api/changes)")
+            continue
+        print(f"  Webhook: {c['webhook_url']}")
+        print(f"  Delivered through {c['delivered_through']} "
+              f"({state['last_id'] - c['delivered_through']} behind); last delivery {c['last_delivery_at'] or 'never'}")
+        if c['failures']:
+            print(f"  ✗ {c['failures']} failed attempts, next at {c['next_attempt_at']}: {c['last_error']}")
+
+
+def update_consumer(cursor, sql, params, name):
+    # Checked first: rowcount only counts rows an UPDATE actually changed
+    cursor.execute("SELECT id FROM feed_consumers WHERE name = %s", (name,))
+    if cursor.fetchone() is None:
+        sys.exit(f"✗ No consumer named {name}")
+    cursor.execute(sql, (*params, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage roster change feed consumers')
+    tenant_group = parser.add_mutually_exclusive_group()
+    tenant_group.add_argument('--tenant', metavar='KEY', help='tenant to act on')
+    tenant_group.add_argument('--all-tenants', action='store_true', help='act on every tenant (list, deliver)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='add a consumer and print its token')
+    add.add_argument('name')
+    add.add_argument('--webhook', metavar='URL', help='push changes to this URL')
+    add.add_argument('--from-start', action='store_true', help='start from the oldest retained change')
+    commands.add_parser('list', help='show consumers and how far behind their webhooks are')
+    reset = commands.add_parser('reset', help='move a webhook consumer\'s position and clear its failures')
+    reset.add_argument('name')
+    reset.add_argument('--cursor', type=int, required=True, help='redeliver changes after this cursor')
+    for command, description in (('enable', 'resume a consumer'), ('disable', 'stop a consumer'),
+                                 ('remove', 'delete a consumer')):
+        commands.add_parser(command, help=description).add_argument('name')
+    commands.add_parser('deliver', help='push pending changes to webhooks now')
+    args = parser.parse_args()
+
+    if args.all_tenants and args.command not in ('list', 'deliver'):
+        parser.error(f'--all-tenants cannot be used with {args.command}')
+
+    configure_logging()
+    for tenant in select_tenants(args.tenant, args.all_tenants):
+        with activate(tenant), log_context(sampled=True):
+            print(f"=== {tenant.short_name} change feed ===")
+            if args.command == 'deliver':
+                deliver_webhooks()
+                print("✓ Delivery pass finished (see the log for details)")
+                continue
+            conn = get_db_connection()
+            cursor = dict_cursor(conn)
+            try:
+                if args.command == 'add':
+                    add_consumer(cursor, args)
+                elif args.command == 'list':
+                    list_consumers(cursor)
+                elif args.command == 'reset':
+                    update_consumer(cursor, """
+                        UPDATE feed_consumers
+                        SET delivered_through = %s, failures = 0, next_attempt_at = NULL, last_error = NULL
+                        WHERE name = %s
+                    """, (args.cursor,), args.name)
+                    print(f"✓ {args.name} will receive changes after cursor {args.cursor}")
+                elif args.command in ('enable', 'disable'):
+                    update_consumer(cursor, "UPDATE feed_consumers SET active = %s WHERE name = %s",
+                                    (int(args.command == 'enable'),), args.name)
+                    print(f"✓ {args.name} {args.command}d")
+                else:
+                    update_consumer(cursor, "DELETE FROM feed_consumers WHERE name = %s", (), args.name)
+                    print(f"✓ {args.name} removed")
+                conn.commit()
+            finally:
+                cursor.close()
+                conn.close()
+
+
+if __name__ == '__main__':
+    main()
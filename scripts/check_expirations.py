@@ -5,34 +5,63 @@ IRC Membership Expiration Notification Script
 Checks member expiration status and sends notifications when status changes.
 Runs via cron - only sends emails when status actually changes.
 
-Status Definitions:
-- ACTIVE: Paid through a future year (2027+)
-- EXPIRING: Paid through current year (2026)
-- EXPIRED: Paid through a past year (2025 or earlier)
-
-Notifications are sent when status changes, not on a schedule.
-This prevents spam while keeping members informed.
+Status Definitions (see app/expiration_policy.py):
+- ACTIVE: More than the largest reminder window before the end of term
+- EXPIRING: Within a reminder window (default 60/30/7 days) of the end of term
+- EXPIRED: Past the end of term
+
+Notifications are sent when status changes or a smaller reminder window is
+reached, not on a schedule. Each member's next transition date is stored, so
+a run only looks at members whose next transition has arrived.
+
+Usage:
+    python3 check_expirations.py            # normal run
+    python3 check_expirations.py --resync   # recompute stored status for everyone, send nothing
+    python3 check_expirations.py --dry-run  # show what a run would do, change nothing
+    python3 check_expirations.py --dry-run --as-of 2026-12-01 --report plan.json
+    python3 check_expirations.py --tenant club2  # one tenant of a multi-tenant deployment
+    python3 check_expirations.py --all-tenants   # every tenant in TENANTS_FILE
+
+Progress is printed to stdout; structured log records (mail sends and
+failures, slow queries, the run summary) go to stderr, or LOG_FILE, with
+the run's request id (see app/logs.py).
+
+Dry runs only read from the database (inside a READ ONLY transaction) and
+never send mail. --as-of evaluates members on another date, as if the
+checker had not run in between. The JSON report has the projected counts,
+the plan for each member and the estimated time to send at NOTIFY_SEND_RATE.
 """
 
+import argparse
+import json
+import logging
 import smtplib
 import os
 import sys
+import time
+from collections import Counter
 from datetime import datetime, date
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-import MySQLdb
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-DB_CONFIG = {
-    'host': 'db',
-    'user': os.getenv('DB_USER'),
-    'passwd': os.getenv('DB_PASSWORD'),
-    'db': os.getenv('DB_NAME'),
-    'charset': 'utf8mb4'
-}
+# Shared portal modules live in the web app directory
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+from bounces import BOUNCE_ADDRESS
+from changes import record_changes
+from db import get_db_connection, dict_cursor
+from email_templates import to_mime
+from expiration_policy import evaluate_member
+from logs import configure_logging, current_request_id, log_context, log_mail
+from repositories import member_repository
+from tenants import activate, current_tenant, select_tenants, tenants
 
 SMTP_CONFIG = {
     'host': os.getenv('SMTP_HOST'),
@@ -42,139 +71,128 @@ SMTP_CONFIG = {
     'from_email': os.getenv('SMTP_FROM_EMAIL')
 }
 
-APP_URL = os.getenv('APP_URL', 'http://localhost:5000')
-ADMIN_EMAILS = ['chairman@ircinc.org', 'ak9r.irc@gmail.com', 'serc1mp@sbcglobal.net']
-
-def get_current_status(paid_thru):
-    """Determine current status based on paid_thru year"""
-    if not paid_thru:
-        return 'unknown'
-    
-    try:
-        paid_year = int(paid_thru)
-        current_year = date.today().year
-        
-        if paid_year < current_year:
-            # Paid through past year = expired
-            return 'expired'
-        elif paid_year == current_year:
-            # Paid through current year = expiring
-            return 'expiring'
-        else:  # paid_year > current_year
-            # Paid through future year = active
-            return 'active'
-    except (ValueError, TypeError):
-        return 'unknown'
-
-def send_member_notification(member, new_status):
-    """Send expiration notification to member"""
-    
-    if not member['email']:
-        return False, "No email address"
-    
-    msg = MIMEMultipart()
-    msg['From'] = SMTP_CONFIG['from_email']
-    msg['To'] = member['email']
-    
-    # Customize subject and body based on status
-    if new_status == 'expired':
-        msg['Subject'] = f"IRC Membership Expired - {member['call_sign']}"
-        body = f"""Hello {member['call_sign']},
-
-This is a notification that your Indiana Repeater Council membership has EXPIRED.
+logger = logging.getLogger('portal.expirations')
 
-Your membership was paid through: {member['paid_thru'] or 'Unknown'}
-Current year: {date.today().year}
+# Maximum notification emails sent per minute (0 = no limit)
+NOTIFY_SEND_RATE = float(os.getenv('NOTIFY_SEND_RATE', 60))
 
-To renew your membership and maintain your benefits, please contact IRC regarding renewal and payment options.
-
-You can still access the membership portal to update your contact information at:
-{APP_URL}
-
-If you have already renewed, please disregard this message. It may take a few days for the system to reflect your payment.
+# Notification template for each status; the static parts are bound once per tenant
+STATUS_TEMPLATES = {
+    'expired': 'membership_expired',
+    'expiring': 'membership_expiring',
+    'active': 'membership_active',
+}
 
-For questions about your membership status or to renew:
-Website: https://service-desk.ircinc.org
-Email: chairman@ircinc.org
+def from_address():
+    """Sender for the current tenant's mail"""
+    return current_tenant().from_email or SMTP_CONFIG['from_email']
 
-Thank you for your past support of the Indiana Repeater Council!
+class NotificationMailer:
+    """One SMTP connection for a run's emails, opened on first use.
 
-73,
-Indiana Repeater Council
-Membership Team
-"""
+    After a failed send the connection is dropped and the next email opens
+    a new one. A reused connection the server has closed is reopened and
+    the email sent again.
+    """
     
-    elif new_status == 'expiring':
-        msg['Subject'] = f"IRC Membership Expiring Soon - {member['call_sign']}"
-        body = f"""Hello {member['call_sign']},
-
-This is a friendly reminder that your Indiana Repeater Council membership expires at the end of this year.
-
-Your membership is paid through: {member['paid_thru']}
-Current year: {date.today().year}
-
-To ensure uninterrupted membership, please renew before December 31, {date.today().year}.
-
-For renewal information:
-Website: https://service-desk.ircinc.org
-Email: chairman@ircinc.org
-
-You can access the membership portal at any time to update your information:
-{APP_URL}
-
-Thank you for your continued support of the Indiana Repeater Council!
-
-73,
-Indiana Repeater Council
-Membership Team
-"""
+    def __init__(self):
+        self._server = None
     
-    elif new_status == 'active':
-        # Member renewed or was updated - send confirmation
-        msg['Subject'] = f"IRC Membership Active - {member['call_sign']}"
-        body = f"""Hello {member['call_sign']},
-
-Thank you! Your Indiana Repeater Council membership is now ACTIVE.
-
-Your membership is paid through: {member['paid_thru']}
-
-You can access the membership portal at:
-{APP_URL}
-
-If you have any questions, please contact us:
-Website: https://service-desk.ircinc.org
-Email: chairman@ircinc.org
-
-Thank you for supporting the Indiana Repeater Council!
-
-73,
-Indiana Repeater Council
-Membership Team
-"""
-    else:
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_CONFIG['host'], SMTP_CONFIG['port'])
+        try:
+            server.starttls()
+            server.login(SMTP_CONFIG['user'], SMTP_CONFIG['password'])
+        except Exception:
+            server.close()
+            raise
+        return server
+    
+    def send(self, msg, **kwargs):
+        while True:
+            reused = self._server is not None
+            try:
+                if not reused:
+                    self._server = self._connect()
+                self._server.send_message(msg, **kwargs)
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.close()
+                if not reused:
+                    raise
+            except Exception:
+                self.close()
+                raise
+    
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                self._server.close()
+            self._server = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+def render_member_notification(member, evaluation, today=None):
+    """Render the notification for a member's new status, or None if there is none"""
+    template = STATUS_TEMPLATES.get(evaluation.status)
+    if template is None:
+        return None
+    
+    today = today or date.today()
+    return current_tenant().email_renderer.render(
+        template,
+        call_sign=member['call_sign'],
+        paid_thru=member['paid_thru'] or 'Unknown',
+        current_year=today.year,
+        term_end=evaluation.term_end.strftime('%B %d, %Y') if evaluation.term_end else 'Unknown',
+        days_remaining=(evaluation.term_end - today).days if evaluation.term_end else 0
+    )
+
+def send_member_notification(member, evaluation, mailer, today=None):
+    """Send expiration notification to member over the run's NotificationMailer"""
+    
+    if not member['email']:
+        return False, "No email address"
+    
+    email = render_member_notification(member, evaluation, today)
+    if email is None:
         return False, "Unknown status"
     
-    msg.attach(MIMEText(body, 'plain'))
+    msg = to_mime(email, from_address(), member['email'])
     
+    start = time.perf_counter()
     try:
-        with smtplib.SMTP(SMTP_CONFIG['host'], SMTP_CONFIG['port']) as server:
-            server.starttls()
-            server.login(SMTP_CONFIG['user'], SMTP_CONFIG['password'])
-            server.send_message(msg)
-        return True, "Sent"
+        mailer.send(msg, from_addr=BOUNCE_ADDRESS)
     except Exception as e:
+        log_mail([member['email']], msg['Subject'], time.perf_counter() - start, error=e,
+                 call_sign=member['call_sign'], status=evaluation.status)
         return False, str(e)
+    log_mail([member['email']], msg['Subject'], time.perf_counter() - start,
+             call_sign=member['call_sign'], status=evaluation.status)
+    return True, "Sent"
 
-def send_admin_summary(notifications):
+def send_admin_summary(notifications, mailer):
     """Send summary of notifications to administrators"""
     
     if not notifications:
         return
     
+    tenant = current_tenant()
+    if not tenant.admin_emails:
+        logger.warning("No admin emails configured - summary not sent")
+        print("✗ No admin emails configured - summary not sent")
+        return
+    
     msg = MIMEMultipart()
-    msg['From'] = SMTP_CONFIG['from_email']
-    msg['To'] = ', '.join(ADMIN_EMAILS)
-    msg['Subject'] = f"IRC Membership Expiration Notifications - {date.today().strftime('%Y-%m-%d')}"
+    msg['From'] = from_address()
+    msg['To'] = ', '.join(tenant.admin_emails)
+    msg['Subject'] = f"{tenant.short_name} Membership Expiration Notifications - {date.today().strftime('%Y-%m-%d')}"
     
     # Build summary
     expired_count = sum(1 for n in notifications if n['new_status'] == 'expired')
@@ -182,7 +200,7 @@ def send_admin_summary(notifications):
     renewed_count = sum(1 for n in notifications if n['new_status'] == 'active')
     failed_count = sum(1 for n in notifications if not n['sent'])
     
-    body = f"""IRC Membership Expiration Notification Summary
+    body = f"""{tenant.short_name} Membership Expiration Notification Summary
 =========================================
 Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
@@ -223,6 +241,13 @@ Members Without Email Addresses:
     else:
         body += "\n  (none)"
     
+    body += "\n\nMembers With Undeliverable Email (bounced):\n"
+    if notifications and notifications[0].get('undeliverable_members'):
+        for member in notifications[0]['undeliverable_members']:
+            body += f"\n  • {member['call_sign']} - {member['email']} ({member['last_status']})"
+    else:
+        body += "\n  (none)"
+    
     body += """
 
 Action Required:
@@ -231,123 +256,363 @@ Action Required:
 - Update membership records as needed
 
 Access the membership portal:
-""" + APP_URL + """
+""" + tenant.app_url + """
 
 73,
-IRC Membership Notification System
+""" + tenant.short_name + """ Membership Notification System
 """
     
     msg.attach(MIMEText(body, 'plain'))
     
+    start = time.perf_counter()
     try:
-        with smtplib.SMTP(SMTP_CONFIG['host'], SMTP_CONFIG['port']) as server:
-            server.starttls()
-            server.login(SMTP_CONFIG['user'], SMTP_CONFIG['password'])
-            server.send_message(msg)
+        mailer.send(msg)
+        log_mail(tenant.admin_emails, msg['Subject'], time.perf_counter() - start)
         print("✓ Admin summary sent")
     except Exception as e:
+        log_mail(tenant.admin_emails, msg['Subject'], time.perf_counter() - start, error=e)
         print(f"✗ Failed to send admin summary: {e}")
 
+def plan_member(member, today, resync=False):
+    """Decide what a run on `today` does for one member, without side effects.
+    
+    Returns (evaluation, old_status, action) where action is 'notify',
+    'no_email' (a notice is due but there is no address), 'undeliverable'
+    (a notice is due but the address has bounced) or 'update' (only the
+    stored status and next transition date change).
+    """
+    evaluation = evaluate_member(member, today)
+    old_status = member['expiration_status'] or 'unknown'
+    
+    # Notify if status changed or a smaller reminder window was reached
+    changed = (evaluation.status != old_status or evaluation.window != member['expiration_window'])
+    
+    if resync or not changed or evaluation.status == 'unknown':
+        action = 'update'
+    elif not member['email']:
+        action = 'no_email'
+    elif member['undeliverable']:
+        action = 'undeliverable'
+    else:
+        action = 'notify'
+    return evaluation, old_status, action
+
+def estimated_send_seconds(message_count):
+    """Time to send message_count emails at NOTIFY_SEND_RATE, or None if unlimited"""
+    if NOTIFY_SEND_RATE <= 0:
+        return None
+    return round(message_count * 60 / NOTIFY_SEND_RATE, 1)
+
+def wait_for_send_slot(last_sent):
+    """Sleep as needed to keep under NOTIFY_SEND_RATE; returns the new send time"""
+    if NOTIFY_SEND_RATE > 0 and last_sent is not None:
+        delay = last_sent + 60 / NOTIFY_SEND_RATE - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    return time.monotonic()
+
+def build_dry_run_report(cursor, as_of, resync=False):
+    """Plan a run as of `as_of` from a read-only cursor and return the report dict"""
+    repository = member_repository(cursor)
+    members = repository.due_for_evaluation(as_of, resync)
+    
+    plan = []
+    actions = Counter()
+    transitions = Counter()
+    for member in members:
+        evaluation, old_status, action = plan_member(member, as_of, resync)
+        actions[action] += 1
+        entry = {
+            'id': member['id'],
+            'call_sign': member['call_sign'],
+            'email': member['email'] or None,
+            'paid_thru': member['paid_thru'],
+            'old_status': old_status,
+            'new_status': evaluation.status,
+            'old_window': member['expiration_window'],
+            'new_window': evaluation.window,
+            'term_end': evaluation.term_end.isoformat() if evaluation.term_end else None,
+            'next_transition': evaluation.next_transition.isoformat() if evaluation.next_transition else None,
+            'action': action,
+            'subject': None,
+        }
+        if action != 'update':
+            transitions[f"{old_status}->{evaluation.status}"] += 1
+            if action == 'notify':
+                # Rendering here checks the templates without sending anything
+                entry['subject'] = render_member_notification(member, evaluation, as_of).subject
+        plan.append(entry)
+    
+    # Projected status of every member on as_of
+    status_totals = Counter(evaluate_member(m, as_of).status for m in repository.terms())
+    
+    member_notices = actions['notify']
+    # The admin summary goes out whenever any notice was due, sent or not
+    admin_summary = 1 if member_notices or actions['no_email'] or actions['undeliverable'] else 0
+    
+    return {
+        'mode': 'dry-run',
+        'as_of': as_of.isoformat(),
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'resync': resync,
+        'members_checked': len(members),
+        'counts': {
+            'notify': member_notices,
+            'no_email': actions['no_email'],
+            'undeliverable': actions['undeliverable'],
+            'update_only': actions['update'],
+            'transitions': dict(sorted(transitions.items())),
+            'status_totals': {status: status_totals.get(status, 0)
+                              for status in ('active', 'expiring', 'expired', 'unknown')},
+        },
+        'messages': {
+            'member_notices': member_notices,
+            'admin_summary': admin_summary,
+            'total': member_notices + admin_summary,
+        },
+        'send_rate_per_minute': NOTIFY_SEND_RATE or None,
+        'estimated_send_seconds': estimated_send_seconds(member_notices + admin_summary),
+        'plan': plan,
+    }
+
+def print_dry_run_report(report):
+    """Human-readable summary of a dry-run report"""
+    counts = report['counts']
+    if len(tenants) > 1:
+        print(f"Tenant: {current_tenant().name} ({report['tenant']})")
+    print(f"Dry run as of {report['as_of']} - nothing will be sent or saved\n")
+    for entry in report['plan']:
+        if entry['action'] == 'notify':
+            print(f"Would notify: {entry['call_sign']} ({entry['old_status']} → {entry['new_status']}) "
+                  f"<{entry['email']}> \"{entry['subject']}\"")
+        elif entry['action'] == 'no_email':
+            print(f"No email:     {entry['call_sign']} ({entry['old_status']} → {entry['new_status']})")
+        elif entry['action'] == 'undeliverable':
+            print(f"Bounced:      {entry['call_sign']} ({entry['old_status']} → {entry['new_status']}) "
+                  f"<{entry['email']}>")
+    
+    print(f"\n{'-' * 60}")
+    print(f"Members checked: {report['members_checked']}")
+    print(f"Notifications: {counts['notify']}")
+    print(f"Due but no email address: {counts['no_email']}")
+    print(f"Due but address undeliverable: {counts['undeliverable']}")
+    print(f"Status stored without notice: {counts['update_only']}")
+    for transition, count in counts['transitions'].items():
+        print(f"  {transition}: {count}")
+    totals = counts['status_totals']
+    print(f"Projected totals: {totals['active']} active, {totals['expiring']} expiring, "
+          f"{totals['expired']} expired, {totals['unknown']} unknown")
+    seconds = report['estimated_send_seconds']
+    if seconds is None:
+        print("Estimated send time: no rate limit configured")
+    else:
+        print(f"Estimated send time: {seconds:.0f}s at {report['send_rate_per_minute']:g}/min")
+    print(f"{'-' * 60}")
+
+def run_dry_run(args):
+    """Plan a run for the current tenant without sending mail or writing; returns the report"""
+    as_of = args.as_of or date.today()
+    
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    try:
+        # Any accidental write fails inside a read-only transaction
+        cursor.execute("START TRANSACTION READ ONLY")
+        report = build_dry_run_report(cursor, as_of, args.resync)
+    finally:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+    report['tenant'] = current_tenant().key
+    
+    if args.report != '-':
+        print_dry_run_report(report)
+    return report
+
+def write_dry_run_reports(args, reports):
+    """Write the JSON report; several tenants' reports are wrapped in {"tenants": [...]}"""
+    document = reports[0] if len(reports) == 1 else {'tenants': reports}
+    output = json.dumps(document, indent=2, default=str)
+    if args.report == '-':
+        print(output)
+    else:
+        with open(args.report, 'w') as f:
+            f.write(output + '\n')
+        print(f"Report written to {args.report}")
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}' (expected YYYY-MM-DD)")
+
 def main():
+    parser = argparse.ArgumentParser(description='Membership expiration check')
+    parser.add_argument('--resync', action='store_true',
+                        help='Recompute stored status for all members without sending email')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Show what a run would do without sending email or changing the database')
+    parser.add_argument('--as-of', type=parse_date, metavar='YYYY-MM-DD',
+                        help='Evaluate members as of this date (dry run only)')
+    parser.add_argument('--report', metavar='FILE',
+                        help='Write the dry-run plan as JSON to FILE ("-" for stdout only)')
+    tenant_group = parser.add_mutually_exclusive_group()
+    tenant_group.add_argument('--tenant', metavar='KEY', help='Tenant to check (default: the default tenant)')
+    tenant_group.add_argument('--all-tenants', action='store_true', help='Check every tenant in turn')
+    args = parser.parse_args()
+    
+    if (args.as_of or args.report) and not args.dry_run:
+        parser.error('--as-of and --report require --dry-run')
+    
+    configure_logging()
+    reports = []
+    for tenant in select_tenants(args.tenant, args.all_tenants):
+        # One request id per tenant run; a cron run is low volume, so log everything
+        with activate(tenant), log_context(sampled=True):
+            if args.dry_run:
+                reports.append(run_dry_run(args))
+            else:
+                run_check(args)
+    
+    if args.report:
+        write_dry_run_reports(args, reports)
+
+def run_check(args):
+    """Check the current tenant's members and send notifications"""
+    # One SMTP connection for the whole run, as bulk email jobs use
+    with NotificationMailer() as mailer:
+        check_members(args, mailer)
+
+def check_members(args, mailer):
+    """run_check() over an open NotificationMailer"""
+    tenant = current_tenant()
+    
     print("=" * 60)
-    print("IRC Membership Expiration Notification Check")
+    print(f"{tenant.short_name} Membership Expiration Notification Check")
     print("=" * 60)
-    print(f"Run time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    if len(tenants) > 1:
+        print(f"Tenant: {tenant.name} ({tenant.key})")
+    print(f"Run time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Run id: {current_request_id()}\n")
     
-    conn = MySQLdb.connect(**DB_CONFIG)
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+    started = time.perf_counter()
+    today = date.today()
     
-    # Get all members
-    cursor.execute("""
-        SELECT id, call_sign, name, email, paid_thru, 
-               expiration_status, expiration_notice_sent
-        FROM members
-        ORDER BY call_sign
-    """)
-    members = cursor.fetchall()
+    # Full scans go to a replica when one is configured; updates go to the primary
+    read_conn = get_db_connection(read_only=True)
+    read_cursor = dict_cursor(read_conn)
+    conn = get_db_connection()
+    cursor = dict_cursor(conn)
+    reader = member_repository(read_cursor)
+    writer = member_repository(cursor)
+    
+    members = reader.due_for_evaluation(today, args.resync)
     
     print(f"Checking {len(members)} members...\n")
     
     notifications = []
     status_changes = 0
+    last_sent = None
     
-    # Get overall statistics
-    cursor.execute("""
-        SELECT 
-            SUM(CASE WHEN CAST(paid_thru AS UNSIGNED) > YEAR(CURDATE()) THEN 1 ELSE 0 END) as active,
-            SUM(CASE WHEN CAST(paid_thru AS UNSIGNED) = YEAR(CURDATE()) THEN 1 ELSE 0 END) as expiring,
-            SUM(CASE WHEN CAST(paid_thru AS UNSIGNED) < YEAR(CURDATE()) THEN 1 ELSE 0 END) as expired
-        FROM members
-        WHERE paid_thru IS NOT NULL AND paid_thru != ''
-    """)
-    stats = cursor.fetchone()
+    for member in members:
+        evaluation, old_status, action = plan_member(member, today, args.resync)
+        current_status = evaluation.status
+        
+        if action == 'update':
+            # Nothing to tell the member; just schedule the next check
+            writer.save_evaluation(member['id'], evaluation, notified=False)
+            if current_status != old_status:
+                record_changes(cursor, [member['id']], 'update')
+            conn.commit()
+            continue
+        
+        status_changes += 1
+        print(f"Status change: {member['call_sign']} ({old_status} → {current_status})")
+        
+        if action == 'undeliverable':
+            # Don't keep retrying a dead address; flag it to the admins instead
+            sent, error = False, "Undeliverable address (bounced)"
+            writer.save_evaluation(member['id'], evaluation, notified=False)
+            if current_status != old_status:
+                record_changes(cursor, [member['id']], 'update')
+            conn.commit()
+        else:
+            # Send notification to member
+            if action == 'notify':
+                last_sent = wait_for_send_slot(last_sent)
+            sent, error = send_member_notification(member, evaluation, mailer, today)
+        
+        if sent:
+            print(f"  ✓ Notification sent to {member['email']}")
+            
+            # Update database; status changes also go to the roster change feed
+            writer.save_evaluation(member['id'], evaluation, notified=True)
+            if current_status != old_status:
+                record_changes(cursor, [member['id']], 'update')
+            conn.commit()
+        elif action == 'undeliverable':
+            print(f"  ✗ Skipped: {error}")
+        else:
+            # Leave next_transition_date as is so the next run retries
+            print(f"  ✗ Failed to send: {error}")
+        
+        # Track for admin summary
+        notifications.append({
+            'call_sign': member['call_sign'],
+            'email': member['email'],
+            'old_status': old_status,
+            'new_status': current_status,
+            'sent': sent,
+            'error': error if not sent else None
+        })
+    
+    # Get overall statistics from the stored statuses
+    stats = reader.status_counts()
     
     # Get members without email
-    cursor.execute("""
-        SELECT call_sign, paid_thru
-        FROM members
-        WHERE (email IS NULL OR email = '')
-        AND paid_thru IS NOT NULL
-        ORDER BY call_sign
-    """)
     no_email_members = [
-        {'call_sign': m['call_sign'], 'status': get_current_status(m['paid_thru'])}
-        for m in cursor.fetchall()
+        {'call_sign': m['call_sign'], 'status': evaluate_member(m, today).status}
+        for m in reader.without_email()
     ]
     
-    for member in members:
-        current_status = get_current_status(member['paid_thru'])
-        old_status = member['expiration_status'] or 'unknown'
-        
-        # Check if status changed
-        if current_status != old_status:
-            status_changes += 1
-            print(f"Status change: {member['call_sign']} ({old_status} → {current_status})")
-            
-            # Send notification to member
-            sent, error = send_member_notification(member, current_status)
-            
-            if sent:
-                print(f"  ✓ Notification sent to {member['email']}")
-                
-                # Update database
-                cursor.execute("""
-                    UPDATE members
-                    SET expiration_status = %s,
-                        expiration_notice_sent = CURDATE()
-                    WHERE id = %s
-                """, (current_status, member['id']))
-                conn.commit()
-            else:
-                print(f"  ✗ Failed to send: {error}")
-            
-            # Track for admin summary
-            notifications.append({
-                'call_sign': member['call_sign'],
-                'email': member['email'],
-                'old_status': old_status,
-                'new_status': current_status,
-                'sent': sent,
-                'error': error if not sent else None,
-                'total_active': stats['active'] or 0,
-                'total_expiring': stats['expiring'] or 0,
-                'total_expired': stats['expired'] or 0,
-                'no_email_members': no_email_members
-            })
+    # Get members whose address has bounced
+    undeliverable_members = reader.undeliverable()
+    
+    for notif in notifications:
+        notif.update({
+            'total_active': stats.get('active', 0),
+            'total_expiring': stats.get('expiring', 0),
+            'total_expired': stats.get('expired', 0),
+            'no_email_members': no_email_members,
+            'undeliverable_members': undeliverable_members
+        })
     
     print(f"\n{'-' * 60}")
+    if args.resync:
+        print(f"Resynced {len(members)} members (no notifications sent)")
     print(f"Status changes detected: {status_changes}")
     print(f"Notifications sent: {len([n for n in notifications if n['sent']])}")
     print(f"Failed: {len([n for n in notifications if not n['sent']])}")
     print(f"{'-' * 60}\n")
+    logger.info("Expiration check finished", extra={
+        'event': 'expiration_check',
+        'resync': args.resync,
+        'members_checked': len(members),
+        'status_changes': status_changes,
+        'sent': len([n for n in notifications if n['sent']]),
+        'failed': len([n for n in notifications if not n['sent']]),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
     
     # Send admin summary if there were any notifications
     if notifications:
         print("Sending admin summary...")
-        send_admin_summary(notifications)
+        send_admin_summary(notifications, mailer)
     else:
         print("No status changes - no notifications sent")
     
+    read_cursor.close()
+    read_conn.close()
     cursor.close()
     conn.close()
     
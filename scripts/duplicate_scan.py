@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Duplicate Scan
+
+Runs the duplicate and data-quality scanner (app/duplicates.py) and prints
+the merge candidates and inconsistent city/state spellings it finds.
+
+With --synthetic it benchmarks the scanner instead. It builds a roster of
+random members, adds near-duplicates of some of them (new call sign,
+typoed or plus-addressed email, misspelled name, same phone or address),
+and reports the scan time, the comparisons made against all possible
+pairs, and how many of the planted duplicates were found.
+
+Usage:
+    python3 duplicate_scan.py                         # scan the live roster (needs DB access)
+    python3 duplicate_scan.py --tenant w9club --limit 100
+    python3 duplicate_scan.py --synthetic 100000      # benchmark on a synthetic roster
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+from duplicates import fetch_members, scan
+
+FIRST_NAMES = ['James', 'John', 'Robert', 'Michael', 'William', 'David', 'Richard', 'Joseph', 'Thomas',
+               'Charles', 'Mary', 'Patricia', 'Jennifer', 'Linda', 'Elizabeth', 'Barbara', 'Susan',
+               'Jessica', 'Sarah', 'Karen', 'Daniel', 'Paul', 'Mark', 'Donald', 'George', 'Kenneth',
+               'Steven', 'Edward', 'Brian', 'Ronald', 'Anthony', 'Kevin', 'Jason', 'Gary', 'Nancy', 'Betty']
+SYLLABLES = ['an', 'ber', 'cal', 'den', 'els', 'for', 'gan', 'har', 'ing', 'jon', 'kel', 'lor', 'man',
+             'ner', 'ols', 'per', 'quin', 'ros', 'son', 'ter', 'ulm', 'van', 'wel', 'yor', 'zim', 'ley']
+CITIES = [('Indianapolis', 'IN'), ('Carmel', 'IN'), ('Fishers', 'IN'), ('Fort Wayne', 'IN'),
+          ('South Bend', 'IN'), ('Saint John', 'IN'), ('Lafayette', 'IN'), ('Muncie', 'IN'),
+          ('Chicago', 'IL'), ('Louisville', 'KY'), ('Dayton', 'OH'), ('Columbus', 'OH')]
+# Spellings a typist might use instead
+CITY_TYPOS = {'Fort Wayne': 'Ft. Wayne', 'Saint John': 'St John', 'Indianapolis': 'Indianaplis',
+              'Fishers': 'fishers'}
+
+
+def synthetic_member(rng, i):
+    first = rng.choice(FIRST_NAMES)
+    last = ''.join(rng.choice(SYLLABLES) for _ in range(3)).capitalize()
+    city, state = rng.choice(CITIES)
+    call_sign = f"K{i % 10}{chr(65 + i % 26)}{chr(65 + (i // 26) % 26)}{chr(65 + (i // 676) % 26)}"
+    return {
+        'id': i + 1,
+        'call_sign': call_sign,
+        'name': f"{first} {last}",
+        'email': f"{first.lower()}.{last.lower()}{i}@example.com",
+        'address': f"{rng.randint(1, 9999)} {rng.choice(SYLLABLES).capitalize()} St",
+        'city': city,
+        'state': state,
+        'zip': f"{rng.randint(46000, 47999)}",
+        'telephone': f"{317 + i // 10000}-555-{i % 10000:04d}" if rng.random() < 0.7 else None,
+    }
+
+
+def misspell(rng, value):
+    position = rng.randrange(1, len(value) - 1)
+    return value[:position] + value[position + 1:]
+
+
+def near_duplicate(rng, member, new_id):
+    """Same person, re-entered under a new call sign with some fields varied"""
+    duplicate = dict(member, id=new_id, call_sign=f"N{new_id}X")
+    change = rng.choice(['email_plus', 'email_typo', 'name_typo', 'new_email'])
+    local, domain = member['email'].split('@')
+    if change == 'email_plus':
+        duplicate['email'] = f"{local}+radio@{domain}"
+    elif change == 'email_typo':
+        duplicate['email'] = f"{misspell(rng, local)}@{domain}"
+    elif change == 'name_typo':
+        duplicate['name'] = misspell(rng, member['name'])
+        duplicate['email'] = member['email'].upper()
+    else:
+        duplicate['email'] = f"{local}.{new_id}@example.net"
+    if rng.random() < 0.5:
+        duplicate['city'] = CITY_TYPOS.get(member['city'], member['city'])
+    return duplicate
+
+
+def synthetic_roster(count, duplicate_rate):
+    rng = random.Random(42)
+    members = [synthetic_member(rng, i) for i in range(count)]
+    planted = set()
+    for member in rng.sample(members[:count], int(count * duplicate_rate)):
+        duplicate = near_duplicate(rng, member, len(members) + 1)
+        members.append(duplicate)
+        planted.add((member['id'], duplicate['id']))
+    return members, planted
+
+
+def print_result(result, limit):
+    print(f"Merge candidates: {len(result.candidates)}")
+    for candidate in result.candidates[:limit]:
+        a, b = candidate.member, candidate.other
+        print(f"  {candidate.score:.2f}  {a['call_sign']:<8} {a['name'] or '':<28} "
+              f"{b['call_sign']:<8} {b['name'] or '':<28} {', '.join(candidate.reasons)}")
+    print(f"\nInconsistent spellings: {len(result.spellings)}")
+    for spelling in result.spellings[:limit]:
+        where = f" ({spelling.state})" if spelling.state else ''
+        variants = ', '.join(f"{value!r} x{count}" for value, count in spelling.variants)
+        print(f"  {spelling.field}{where}: use {spelling.suggested!r}; found {variants}")
+
+
+def print_timing(result):
+    pairs = result.members * (result.members - 1) // 2
+    print(f"\nScanned {result.members:,} members in {result.seconds:.2f}s: "
+          f"{result.comparisons:,} comparisons of {pairs:,} possible pairs "
+          f"({result.comparisons / pairs if pairs else 0:.4%}), {result.skipped_blocks} oversized blocks skipped")
+
+
+def benchmark(count, duplicate_rate, limit):
+    start = time.perf_counter()
+    members, planted = synthetic_roster(count, duplicate_rate)
+    print(f"Built {len(members):,} synthetic members with {len(planted):,} planted duplicates "
+          f"in {time.perf_counter() - start:.2f}s\n")
+    result = scan(members)
+    print_result(result, limit)
+    found = {(c.member['id'], c.other['id']) for c in result.candidates}
+    print(f"\nPlanted duplicates found: {len(found & planted):,} of {len(planted):,} "
+          f"({len(found & planted) / len(planted) if planted else 0:.1%}); "
+          f"other candidates: {len(found - planted):,}")
+    print_timing(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find probable duplicate members and inconsistent spellings')
+    parser.add_argument('--synthetic', type=int, metavar='N', help='benchmark on N synthetic members instead')
+    parser.add_argument('--duplicates', type=float, default=0.01, help='fraction of synthetic members to duplicate')
+    parser.add_argument('--limit', type=int, default=25, help='candidates and spellings to print')
+    tenant_group = parser.add_mutually_exclusive_group()
+    tenant_group.add_argument('--tenant', metavar='KEY', help='tenant to scan')
+    tenant_group.add_argument('--all-tenants', action='store_true', help='scan every tenant')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        benchmark(args.synthetic, args.duplicates, args.limit)
+        return
+
+    from db import get_db_connection, dict_cursor
+    from tenants import activate, select_tenants
+
+    for tenant in select_tenants(args.tenant, args.all_tenants):
+        with activate(tenant):
+            print("=" * 60)
+            print(f"{tenant.short_name} Duplicate Scan")
+            print("=" * 60)
+            conn = get_db_connection(read_only=True)
+            cursor = dict_cursor(conn)
+            try:
+                rows = fetch_members(cursor)
+            finally:
+                cursor.close()
+                conn.close()
+            result = scan(rows)
+            print_result(result, args.limit)
+            print_timing(result)
+            print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Bounce Processing Script
+
+Reads bounce / delivery status notification messages and records failed
+recipients in the email_bounces table (see app/bounces.py). Addresses that
+keep bouncing are marked undeliverable, and the portal and the expiration
+checker stop sending to them.
+
+Messages are handled one at a time and only their leading BOUNCE_MAX_BYTES
+are parsed. Processed messages are removed from the source (moved to a
+"processed" subdirectory for --dir) unless --keep is given, so running the
+script again does not count the same bounce twice.
+
+Usage:
+    python3 process_bounces.py --mbox /var/mail/bounces
+    python3 process_bounces.py --maildir /home/bounces/Maildir
+    python3 process_bounces.py --dir /docker/irc-membership-db/bounces   # *.eml file drop
+    python3 process_bounces.py --mbox /var/mail/bounces --dry-run        # parse only
+    python3 process_bounces.py --dir /bounces --all-tenants              # shared bounce mailbox
+
+With --all-tenants every bounce is recorded in each tenant's database, for
+a bounce mailbox shared by all the clubs in a multi-tenant deployment.
+"""
+
+import argparse
+import glob
+import logging
+import mailbox
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+from bounces import is_hard, read_bounce, record_bounces
+from db import get_db_connection
+from logs import configure_logging, log_context
+from tenants import activate, select_tenants
+
+# Messages parsed between database writes
+BOUNCE_BATCH_SIZE = int(os.getenv('BOUNCE_BATCH_SIZE', 500))
+
+logger = logging.getLogger('portal.bounces')
+
+
+def mailbox_messages(box):
+    """Yield (key, file) for each message in an mbox or Maildir"""
+    # Snapshot the keys; processed messages are removed while iterating
+    for key in list(box.keys()):
+        fp = box.get_file(key)
+        try:
+            yield key, fp
+        finally:
+            fp.close()
+
+
+def directory_messages(path):
+    """Yield (path, file) for each .eml file in a drop directory, oldest first"""
+    files = sorted(glob.glob(os.path.join(path, '*.eml')), key=os.path.getmtime)
+    for filename in files:
+        with open(filename, 'rb') as fp:
+            yield filename, fp
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record bounced email addresses')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--mbox', metavar='PATH', help='mbox file to read')
+    source.add_argument('--maildir', metavar='PATH', help='Maildir to read')
+    source.add_argument('--dir', metavar='PATH', help='directory of .eml files to read')
+    parser.add_argument('--keep', action='store_true', help='leave processed messages in place')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='parse and report only; no database changes, nothing removed')
+    tenant_group = parser.add_mutually_exclusive_group()
+    tenant_group.add_argument('--tenant', metavar='KEY', help='tenant to record bounces for')
+    tenant_group.add_argument('--all-tenants', action='store_true',
+                              help='record bounces for every tenant')
+    args = parser.parse_args()
+
+    configure_logging()
+    with log_context(sampled=True):
+        process(args)
+
+
+def process(args):
+    """Read the bounces named by args and record them for the target tenants"""
+    targets = [] if args.dry_run else select_tenants(args.tenant, args.all_tenants)
+    started = time.perf_counter()
+
+    print("=" * 60)
+    print("IRC Membership Bounce Processing")
+    print("=" * 60)
+    print(f"Run time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+
+    box = None
+    if args.mbox:
+        box = mailbox.mbox(args.mbox, create=False)
+        messages = mailbox_messages(box)
+    elif args.maildir:
+        box = mailbox.Maildir(args.maildir, factory=None, create=False)
+        messages = mailbox_messages(box)
+    else:
+        messages = directory_messages(args.dir)
+
+    consume = not (args.keep or args.dry_run)
+    if box is not None and consume:
+        box.lock()
+
+    read = not_bounces = hard = soft = addresses = 0
+    batch = []
+    processed = []
+
+    def flush():
+        nonlocal addresses
+        for tenant in targets if batch else ():
+            with activate(tenant):
+                conn = get_db_connection()
+                cursor = conn.cursor()
+                addresses += record_bounces(cursor, batch)
+                conn.commit()
+                cursor.close()
+                conn.close()
+        # Only remove messages once their bounces are committed
+        if consume:
+            for key in processed:
+                if box is not None:
+                    box.discard(key)
+                else:
+                    done_dir = os.path.join(args.dir, 'processed')
+                    os.makedirs(done_dir, exist_ok=True)
+                    shutil.move(key, done_dir)
+        batch.clear()
+        processed.clear()
+
+    try:
+        for key, fp in messages:
+            read += 1
+            try:
+                bounces = read_bounce(fp)
+            except Exception as e:
+                logger.warning("Could not parse message %s", key, exc_info=True,
+                               extra={'event': 'bounce_parse'})
+                print(f"  ✗ Could not parse message {key}: {e}")
+                continue
+            if not bounces:
+                not_bounces += 1
+            for bounce in bounces:
+                if is_hard(bounce.status):
+                    hard += 1
+                else:
+                    soft += 1
+                if args.dry_run:
+                    print(f"  {bounce.email}: {bounce.status} {bounce.diagnostic}")
+            batch.extend(bounces)
+            processed.append(key)
+            if len(processed) >= BOUNCE_BATCH_SIZE:
+                flush()
+        flush()
+    finally:
+        if box is not None:
+            if consume:
+                box.flush()
+                box.unlock()
+            box.close()
+
+    print(f"\n{'-' * 60}")
+    print(f"Messages read: {read}")
+    print(f"Not bounces (ignored): {not_bounces}")
+    print(f"Permanent failures: {hard}")
+    print(f"Transient failures: {soft}")
+    if args.dry_run:
+        print("Dry run - database not updated, no messages removed")
+    else:
+        print(f"Addresses updated: {addresses}")
+    print(f"{'-' * 60}")
+    logger.info("Bounce processing finished", extra={
+        'event': 'bounce_processing', 'dry_run': args.dry_run, 'read': read,
+        'not_bounces': not_bounces, 'hard': hard, 'soft': soft, 'addresses': addresses,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+
+
+if __name__ == '__main__':
+    main()
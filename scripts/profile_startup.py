@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Portal Start-up Profiler
+
+Reports where worker start-up time goes: the slowest imports (from
+Python's -X importtime output) and the duration of each warm-up hook run
+by create_app().
+
+Usage (inside the web container, from the app directory):
+    python3 /path/to/profile_startup.py [--top 25] [--app-dir /app]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import app as portal
+imported = time.perf_counter()
+print(json.dumps({
+    'import_seconds': imported - start,
+    'warmup': portal.app.extensions.get('warmup', {}),
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """Parse -X importtime lines into (cumulative_us, self_us, module) tuples"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, module = line[len('import time:'):].split('|', 2)
+            rows.append((int(cumulative_us), int(self_us), module.rstrip()))
+        except ValueError:
+            continue
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile portal start-up time')
+    parser.add_argument('--top', type=int, default=25, help='Number of imports to list')
+    parser.add_argument('--app-dir', default=os.getenv('PORTAL_APP_DIR',
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')))
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=args.app_dir, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        sys.exit(result.returncode)
+
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(result.stderr)
+
+    print("=" * 60)
+    print("IRC Membership Portal Start-up Profile")
+    print("=" * 60)
+    print(f"Process wall time:     {wall * 1000:8.1f} ms")
+    print(f"import app (total):    {probe['import_seconds'] * 1000:8.1f} ms")
+    print(f"Modules imported:      {len(rows):8d}")
+
+    print(f"\nWarm-up hooks:")
+    if probe['warmup']:
+        for name, seconds in probe['warmup'].items():
+            shown = 'FAILED' if seconds is None else f"{seconds * 1000:.1f} ms"
+            print(f"  {name:<20} {shown:>12}")
+    else:
+        print("  (none configured)")
+
+    print(f"\nTop {args.top} imports by cumulative time:")
+    print(f"  {'cumulative':>12} {'self':>10}  module")
+    for cumulative_us, self_us, module in sorted(rows, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:9.1f} ms {self_us / 1000:7.1f} ms  {module}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Card Pre-Render
+
+Renders every member's membership card (app/cards.py) into the card cache,
+so that after a "download your card" announcement the portal serves them
+from disk instead of rendering on demand. Cards already rendered for the
+member's current row version are skipped. Run it where the portal's
+CARD_CACHE_DIR is mounted.
+
+Usage:
+    python3 render_cards.py                       # PDF and PNG for every member
+    python3 render_cards.py --format pdf --tenant w9club
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+from cards import CARD_COLUMNS, CARD_FORMATS, cards
+from db import get_db_connection, dict_cursor
+from tenants import activate, select_tenants
+
+
+def render_all(formats):
+    conn = get_db_connection(read_only=True)
+    cursor = dict_cursor(conn)
+    try:
+        cursor.execute(f"SELECT {CARD_COLUMNS} FROM members ORDER BY id")
+        members = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    start = time.perf_counter()
+    rendered = cached = 0
+    for member in members:
+        for fmt in formats:
+            if os.path.exists(cards.path(member, fmt)):
+                cached += 1
+                continue
+            # No waiting on the render limit here: this is the only caller
+            cards.card(member, fmt, wait=None)
+            rendered += 1
+    elapsed = time.perf_counter() - start
+    print(f"✓ {len(members)} members: {rendered} cards rendered, {cached} already cached "
+          f"in {elapsed:.1f}s ({elapsed / rendered * 1000 if rendered else 0:.0f} ms per card)")
+    print(f"  Cache: {cards.directory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render every member\'s membership card into the card cache')
+    parser.add_argument('--format', choices=sorted(CARD_FORMATS), action='append',
+                        help='card format to render (repeatable; default both)')
+    tenant_group = parser.add_mutually_exclusive_group()
+    tenant_group.add_argument('--tenant', metavar='KEY', help='tenant to render')
+    tenant_group.add_argument('--all-tenants', action='store_true', help='render every tenant')
+    args = parser.parse_args()
+
+    for tenant in select_tenants(args.tenant, args.all_tenants):
+        with activate(tenant):
+            print(f"{tenant.short_name} membership cards")
+            render_all(args.format or sorted(CARD_FORMATS))
+
+
+if __name__ == '__main__':
+    main()
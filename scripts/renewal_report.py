@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Renewal Report
+
+Revenue and renewal figures from the renewals ledger (app/renewals.py):
+revenue per year of payment, revenue per payment method for a membership
+year, and how many members paid for one year renewed for the next. Each
+query reads only the ledger's covering indexes, so the report runs in
+milliseconds.
+
+Usage:
+    python3 renewal_report.py                  # current membership year, last 5 years of revenue
+    python3 renewal_report.py --year 2025
+    python3 renewal_report.py --years 10 --tenant w9club
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+from db import get_db_connection, dict_cursor
+from renewals import renewal_rate, revenue_by_method, revenue_by_year
+from tenants import activate, select_tenants
+
+
+def print_report(cursor, year, years):
+    timings = {}
+
+    start = time.perf_counter()
+    by_year = revenue_by_year(cursor, year - years + 1, year)
+    timings['revenue by year'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    by_method = revenue_by_method(cursor, year)
+    timings['revenue by method'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    previous = renewal_rate(cursor, year - 1)
+    timings['renewal rate'] = time.perf_counter() - start
+
+    print("Revenue by year paid")
+    for row in by_year:
+        print(f"  {row['year']}: {row['renewals']:>6} renewals  ${row['revenue']:>10,.2f}")
+
+    print(f"\nMembership year {year} by payment method")
+    for row in by_method:
+        print(f"  {row['method']:<8} {row['renewals']:>6} renewals  ${row['revenue']:>10,.2f}")
+
+    print(f"\nRenewal rate {year - 1} → {year}")
+    if previous['rate'] is None:
+        print(f"  No renewals recorded for {year - 1}")
+    else:
+        print(f"  {previous['renewed']} of {previous['members']} members renewed ({previous['rate']:.1%})")
+
+    print("\nQuery times: " + ', '.join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in timings.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Revenue and renewal report from the renewals ledger')
+    parser.add_argument('--year', type=int, default=date.today().year, help='membership year to report on')
+    parser.add_argument('--years', type=int, default=5, help='years of revenue history to show')
+    tenant_group = parser.add_mutually_exclusive_group()
+    tenant_group.add_argument('--tenant', metavar='KEY', help='tenant to report on')
+    tenant_group.add_argument('--all-tenants', action='store_true', help='report on every tenant')
+    args = parser.parse_args()
+
+    for tenant in select_tenants(args.tenant, args.all_tenants):
+        with activate(tenant):
+            print("=" * 60)
+            print(f"{tenant.short_name} Renewal Report")
+            print("=" * 60)
+            conn = get_db_connection(read_only=True)
+            cursor = dict_cursor(conn)
+            try:
+                print_report(cursor, args.year, args.years)
+            finally:
+                cursor.close()
+                conn.close()
+            print()
+
+
+if __name__ == '__main__':
+    main()
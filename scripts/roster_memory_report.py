@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Roster Memory Report
+
+Compares the memory held by the shared roster snapshot (app/roster.py)
+with the list of DictCursor dicts the admin views used to fetch, and
+reports both per 10,000 members.
+
+Usage:
+    python3 roster_memory_report.py              # synthetic roster of 10,000 members
+    python3 roster_memory_report.py --members 50000
+    python3 roster_memory_report.py --live       # measure the real roster (needs DB access)
+"""
+
+import argparse
+import os
+import random
+import sys
+import tracemalloc
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+from roster import RosterMember, roster
+
+CITIES = ['Indianapolis', 'Carmel', 'Fishers', 'Noblesville', 'Westfield', 'Muncie',
+          'Bloomington', 'Lafayette', 'Fort Wayne', 'Evansville', 'South Bend', 'Kokomo']
+MEMBER_TYPES = ['FULL', 'ASSOCIATE', 'LIFE', 'HONORARY']
+
+
+def synthetic_rows(count):
+    """Generate DictCursor-style rows resembling the members table"""
+    rng = random.Random(42)
+    now = datetime.now()
+    for i in range(count):
+        call_sign = f"K{i % 10}{chr(65 + i % 26)}{chr(65 + (i // 26) % 26)}{chr(65 + (i // 676) % 26)}"
+        yield {
+            'id': i + 1,
+            'call_sign': call_sign,
+            'name': f"Member {i} Lastname{i % 997}",
+            'email': f"{call_sign.lower()}@example.com",
+            # Fresh str objects per row, as the database driver returns them
+            'city': ''.join(rng.choice(CITIES)),
+            'state': ''.join('IN'),
+            'member_type': ''.join(rng.choice(MEMBER_TYPES)),
+            'paid_thru': rng.randint(2020, 2030),
+            'is_admin': 0,
+            'created_at': now,
+            'updated_at': now,
+            'row_version': 1,
+        }
+
+
+def measure(build):
+    """Return (result, bytes allocated and still held by build())"""
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def per_10k(total, count):
+    return int(total * 10000 / count) if count else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report roster snapshot memory usage')
+    parser.add_argument('--members', type=int, default=10000, help='Synthetic roster size')
+    parser.add_argument('--live', action='store_true', help='Measure the live roster instead')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("IRC Membership Roster Memory Report")
+    print("=" * 60)
+
+    if args.live:
+        _, snapshot_bytes = measure(lambda: roster.refresh(force=True))
+        report = roster.memory_report()
+        print(f"Members:                 {report['members']:>12,}")
+        print(f"Snapshot (tracemalloc):  {snapshot_bytes:>12,} bytes")
+        print(f"Snapshot (getsizeof):    {report['bytes']:>12,} bytes")
+        print(f"Per 10,000 members:      {per_10k(snapshot_bytes, report['members']):>12,} bytes")
+        return
+
+    count = args.members
+    # Each build holds its own strings, as a fresh fetch from the database would
+    dicts, dict_bytes = measure(lambda: list(synthetic_rows(count)))
+    del dicts
+    records, record_bytes = measure(lambda: {row['id']: RosterMember(row) for row in synthetic_rows(count)})
+
+    print(f"Members:                 {count:>12,}")
+    print(f"\n{'':24} {'total bytes':>14} {'per 10k':>14}")
+    print(f"{'List of dicts':24} {dict_bytes:>14,} {per_10k(dict_bytes, count):>14,}")
+    print(f"{'Roster snapshot':24} {record_bytes:>14,} {per_10k(record_bytes, count):>14,}")
+    if dict_bytes:
+        print(f"\nSnapshot uses {record_bytes / dict_bytes:.0%} of the dict representation")
+
+
+if __name__ == '__main__':
+    main()
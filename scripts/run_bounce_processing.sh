@@ -0,0 +1,20 @@
+#!/bin/bash
+
+# IRC Membership Bounce Processing - Cron Wrapper
+# Runs process_bounces.py inside the Docker container.
+# The bounce mailbox or drop directory must be mounted into the container,
+# e.g. ./run_bounce_processing.sh --dir /bounces
+
+cd /docker/irc-membership-db
+
+# Copy script and .env to container
+docker cp process_bounces.py irc_membership_web:/tmp/process_bounces.py
+docker cp .env irc_membership_web:/tmp/.env
+
+# Process bounces
+docker exec irc_membership_web python3 /tmp/process_bounces.py "$@"
+
+# Clean up
+docker exec irc_membership_web rm -f /tmp/process_bounces.py /tmp/.env
+
+exit 0
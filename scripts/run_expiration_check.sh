@@ -10,7 +10,7 @@ docker cp check_expirations.py irc_membership_web:/tmp/check_expirations.py
 docker cp .env irc_membership_web:/tmp/.env
 
 # Run the checker
-docker exec irc_membership_web python3 /tmp/check_expirations.py
+docker exec irc_membership_web python3 /tmp/check_expirations.py "$@"
 
 # Clean up
 docker exec irc_membership_web rm -f /tmp/check_expirations.py /tmp/.env
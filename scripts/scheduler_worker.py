@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Scheduler Worker
+
+Long-running process that runs the portal's periodic jobs (see
+app/scheduler.py) in place of the cron wrappers:
+
+- expiration_check   the expiration checker (check_expirations.py), daily
+- bounce_processing  record bounces from BOUNCE_MBOX, BOUNCE_MAILDIR or
+                     BOUNCE_DIR (process_bounces.py), every 15 minutes;
+                     off unless one of them is set
+- backup             database dump, member CSV and email to the admins
+                     (backup_database.py), daily; off unless BACKUP_DIR is set
+- webhook_delivery   send roster changes to webhook consumers and prune the
+                     change feed (app/changes.py), every minute
+
+Override a schedule with SCHEDULE_<JOB> (e.g. SCHEDULE_BACKUP="daily 03:15",
+or "off"). Several workers can run at once; each slot is run by one of them.
+
+Usage:
+    python3 scheduler_worker.py               # run until stopped (SIGTERM / Ctrl-C)
+    python3 scheduler_worker.py --list        # show jobs, schedules and next runs
+    python3 scheduler_worker.py --run backup  # run one job now, for every tenant it covers
+"""
+
+import argparse
+import os
+import signal
+import sys
+from argparse import Namespace
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+import backup_database
+import check_expirations
+import process_bounces
+from changes import deliver_webhooks
+from logs import configure_logging, log_context
+from scheduler import Scheduler
+from tenants import activate, current_tenant
+
+BOUNCE_SOURCES = {'mbox': os.getenv('BOUNCE_MBOX'), 'maildir': os.getenv('BOUNCE_MAILDIR'),
+                  'dir': os.getenv('BOUNCE_DIR')}
+
+scheduler = Scheduler()
+
+
+@scheduler.job('expiration_check', 'daily 09:00', jitter=300)
+def expiration_check():
+    check_expirations.run_check(Namespace(resync=False))
+
+
+# One shared bounce mailbox; each bounce is recorded for every tenant
+@scheduler.job('bounce_processing', 'every 15 minutes' if any(BOUNCE_SOURCES.values()) else 'off',
+               jitter=60, per_tenant=False)
+def bounce_processing():
+    process_bounces.process(Namespace(**BOUNCE_SOURCES, keep=False, dry_run=False,
+                                      tenant=None, all_tenants=True))
+
+
+@scheduler.job('backup', 'daily 02:00' if backup_database.BACKUP_DIR else 'off', jitter=600)
+def backup():
+    backup_database.run_backup(current_tenant())
+
+
+@scheduler.job('webhook_delivery', 'every 1 minute', jitter=10)
+def webhook_delivery():
+    deliver_webhooks()
+
+
+def list_jobs():
+    now = datetime.now()
+    for job in scheduler.jobs.values():
+        if not job.schedule.enabled:
+            print(f"{job.name:<20} off")
+            continue
+        for tenant in scheduler.targets(job):
+            print(f"{job.name:<20} {str(job.schedule):<20} {tenant.key:<12} "
+                  f"next {job.next_run(now, tenant.key):%Y-%m-%d %H:%M:%S}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the portal\'s scheduled jobs')
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--list', action='store_true', help='list jobs and their next runs, then exit')
+    action.add_argument('--run', metavar='JOB', choices=sorted(scheduler.jobs), help='run one job now and exit')
+    args = parser.parse_args()
+
+    if args.list:
+        list_jobs()
+        return
+
+    configure_logging()
+    if args.run:
+        # Manual run: not recorded as a slot, so the scheduled run still happens
+        job = scheduler.jobs[args.run]
+        for tenant in scheduler.targets(job):
+            with activate(tenant), log_context(sampled=True):
+                job.func()
+        return
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
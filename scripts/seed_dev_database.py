@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Development Database Seeder
+
+Fills the local SQLite database used with DB_BACKEND=sqlite (see
+app/db.py) so the portal, the scripts and benchmarks run on a laptop
+without a MariaDB container. The schema is created by the portal itself
+the first time it opens an empty database; this adds data:
+
+- the test accounts from tests/test_data_setup.sql, all with the password
+  TestPass123! (TEST1ADM is an admin)
+- optionally, a synthetic roster of --members N members with renewals,
+  for benchmarks and the roster and analytics pages
+
+Refuses to run unless DB_BACKEND=sqlite, so it can never touch a real
+database.
+
+Usage:
+    DB_BACKEND=sqlite python3 seed_dev_database.py
+    DB_BACKEND=sqlite python3 seed_dev_database.py --reset --members 5000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import bcrypt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if not os.path.isdir(APP_DIR):
+    APP_DIR = '/app'
+sys.path.insert(0, APP_DIR)
+
+from db import DB_BACKEND, get_db_connection, dict_cursor
+from repositories import member_repository
+from tenants import activate, current_tenant, select_tenants
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'test_data_setup.sql')
+TEST_PASSWORD = 'TestPass123!'
+
+STATES = ['IN'] * 8 + ['IL', 'OH', 'MI', 'KY']
+CITIES = ['Indianapolis', 'Carmel', 'Fishers', 'Noblesville', 'Lafayette', 'Muncie', 'Kokomo', 'Bloomington']
+MEMBER_TYPES = ['FULL'] * 6 + ['ASSOCIATE'] * 3 + ['LIFE']
+
+
+def load_test_accounts(conn, password_hash):
+    """Run tests/test_data_setup.sql with a real password hash; returns how many accounts it added"""
+    with open(TEST_DATA) as f:
+        script = f.read().replace('$2b$12$YOUR_HASH_HERE', password_hash)
+    cursor = dict_cursor(conn)
+    count = "SELECT COUNT(*) AS count FROM members WHERE call_sign LIKE 'TEST%'"
+    try:
+        cursor.execute(count)
+        if cursor.fetchone()['count']:
+            return 0
+        conn.executescript(script)
+        cursor.execute(count)
+        return cursor.fetchone()['count']
+    finally:
+        cursor.close()
+
+
+def synthetic_members(count, password_hash, seed=0):
+    """Column values for `count` made-up members"""
+    rng = random.Random(seed)
+    this_year = date.today().year
+    for n in range(count):
+        call_sign = f"KD9{n:05d}"
+        paid_thru = None if rng.random() < 0.05 else this_year + rng.choice([-3, -2, -1, -1, 0, 0, 0, 1, 1, 2])
+        yield {
+            'call_sign': call_sign,
+            'password_hash': password_hash,
+            'email': f"{call_sign.lower()}@example.org" if rng.random() < 0.9 else None,
+            'name': f"Member {n}",
+            'city': rng.choice(CITIES),
+            'state': rng.choice(STATES),
+            'zip': f"46{rng.randrange(1000):03d}",
+            'member_type': rng.choice(MEMBER_TYPES),
+            'paid_thru': paid_thru,
+            'is_admin': 0,
+        }
+
+
+def add_synthetic_members(cursor, count, password_hash):
+    """Insert synthetic members with a renewal for their paid_thru year; returns the renewal count"""
+    members = member_repository(cursor)
+    renewals = []
+    for fields in synthetic_members(count, password_hash):
+        member_id = members.create(fields)
+        if fields['paid_thru'] is not None:
+            paid_on = date(fields['paid_thru'] - 1, 12, 1) + timedelta(days=member_id % 60)
+            renewals.append((member_id, fields['paid_thru'], '25.00', 'check', paid_on))
+    # New members only, so a plain insert (the ledger's upsert is MariaDB SQL)
+    cursor.executemany("""
+        INSERT INTO renewals (member_id, period_year, amount, method, paid_on)
+        VALUES (%s, %s, %s, %s, %s)
+    """, renewals)
+    return len(renewals)
+
+
+def seed(args, password_hash):
+    tenant = current_tenant()
+    pool = tenant.router.primary
+    # Before the first connection, so the schema is created afresh
+    if args.reset and pool.path != ':memory:':
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(pool.path + suffix):
+                os.remove(pool.path + suffix)
+        print(f"✓ Removed {pool.path}")
+
+    conn = get_db_connection()
+    try:
+        added = load_test_accounts(conn, password_hash)
+        print(f"✓ Test accounts: {added} added" if added else "✓ Test accounts already present")
+        if args.members:
+            start = time.perf_counter()
+            cursor = dict_cursor(conn)
+            renewals = add_synthetic_members(cursor, args.members, password_hash)
+            cursor.close()
+            conn.commit()
+            print(f"✓ {args.members} synthetic members and {renewals} renewals added "
+                  f"in {time.perf_counter() - start:.1f}s")
+    finally:
+        conn.close()
+    print(f"  Database: {pool.path}")
+    print(f"  Log in as TEST1ADM (admin) or TEST2MEM with password {TEST_PASSWORD}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill the local SQLite development database with test data')
+    parser.add_argument('--members', type=int, default=0, metavar='N', help='also add N synthetic members')
+    parser.add_argument('--reset', action='store_true', help='delete the database file first')
+    tenant_group = parser.add_mutually_exclusive_group()
+    tenant_group.add_argument('--tenant', metavar='KEY', help='tenant to seed')
+    tenant_group.add_argument('--all-tenants', action='store_true', help='seed every tenant')
+    args = parser.parse_args()
+
+    if DB_BACKEND != 'sqlite':
+        parser.error('only for the local SQLite database: set DB_BACKEND=sqlite')
+
+    # One hash for every account: bcrypt is deliberately slow
+    password_hash = bcrypt.hashpw(TEST_PASSWORD.encode(), bcrypt.gensalt()).decode()
+    for tenant in select_tenants(args.tenant, args.all_tenants):
+        with activate(tenant):
+            print(f"=== {tenant.short_name} development database ===")
+            seed(args, password_hash)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+IRC Membership Portal SQLite Smoke Test
+
+Runs the portal end to end on a fresh in-memory SQLite database
+(DB_BACKEND=sqlite, SQLITE_DIR=:memory:), in this process, with no database
+server and without mysqlclient installed. It exercises the paths that use
+MariaDB-specific SQL, through the translation in app/db.py:
+
+- login, dashboard and database-backed sessions
+- Add Member with a first payment, renewals (upsert and paid_thru sync),
+  bulk Paid Thru and member deletion
+- bounce recording and the undeliverable flag
+- the change feed API and webhook delivery, retry back-off and pruning
+- a scheduler pass (named lock, run history, Scheduler page)
+- the backup dump
+
+Email is suppressed. Exits non-zero if any check fails.
+
+Usage (from a checkout, with app/templates linked as in
+documentation/LOCAL_DEVELOPMENT.md):
+    python3 scripts/smoke_test_sqlite.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import traceback
+from datetime import date, datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Before any portal module reads its settings; never touches a real database
+os.environ['DB_BACKEND'] = 'sqlite'
+os.environ['SQLITE_DIR'] = ':memory:'
+os.environ['SESSION_BACKEND'] = 'database'
+os.environ['WARMUP_HOOKS'] = ''
+os.environ['CARD_CACHE_DIR'] = tempfile.mkdtemp(prefix='portal-cards-')
+os.environ['BACKUP_DIR'] = tempfile.mkdtemp(prefix='portal-backups-')
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.getenv('PORTAL_APP_DIR') or os.path.join(SCRIPTS_DIR, '..', 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, SCRIPTS_DIR)
+
+import bcrypt
+
+from app import create_app
+from backup_database import dump_sqlite
+from bounces import Bounce, BOUNCE_HARD_LIMIT, record_bounces
+from changes import deliver_webhooks, hash_token
+from db import get_db_connection, dict_cursor
+from scheduler import Scheduler
+from seed_dev_database import TEST_PASSWORD, load_test_accounts
+
+results = []
+
+
+def check(name):
+    """Decorator running a check now and recording whether it passed"""
+    def run(func):
+        try:
+            func()
+        except Exception:
+            results.append(False)
+            print(f"✗ {name}")
+            print('    ' + traceback.format_exc().strip().replace('\n', '\n    '))
+        else:
+            results.append(True)
+            print(f"✓ {name}")
+    return run
+
+
+def query(sql, args=None):
+    conn = get_db_connection()
+    cursor = dict_cursor(conn)
+    try:
+        cursor.execute(sql, args)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def execute(sql, args=None):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, args)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def member(call_sign):
+    rows = query("SELECT * FROM members WHERE call_sign = %s", (call_sign,))
+    return rows[0] if rows else None
+
+
+class WebhookReceiver(BaseHTTPRequestHandler):
+    batches = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        WebhookReceiver.batches.append(json.loads(body))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    if not os.path.isdir(os.path.join(APP_DIR, 'templates')):
+        sys.exit("✗ app/templates is missing: ln -s ../templates app/templates")
+
+    print("=" * 60)
+    print("IRC Membership Portal SQLite Smoke Test")
+    print("=" * 60)
+
+    app = create_app({'TESTING': True, 'MAIL_SUPPRESS_SEND': True})
+    client = app.test_client()
+    this_year = date.today().year
+
+    @check("Test accounts load")
+    def _():
+        conn = get_db_connection()
+        try:
+            password_hash = bcrypt.hashpw(TEST_PASSWORD.encode(), bcrypt.gensalt(4)).decode()
+            assert load_test_accounts(conn, password_hash) > 0
+        finally:
+            conn.close()
+
+    @check("Admin login, dashboard and database session")
+    def _():
+        response = client.post('/login', data={'call_sign': 'TEST1ADM', 'password': TEST_PASSWORD})
+        assert response.status_code == 302, response.status_code
+        assert client.get('/dashboard').status_code == 200
+        assert query("SELECT COUNT(*) AS count FROM portal_sessions")[0]['count'] == 1
+
+    @check("Add Member with a first payment")
+    def _():
+        response = client.post('/admin/add-member', data={
+            'call_sign': 'K9SMK', 'email': 'k9smk@example.org', 'name': 'Smoke Test',
+            'paid_thru': str(this_year), 'amount': '25', 'method': 'check'})
+        assert response.status_code == 302, response.status_code
+        row = member('K9SMK')
+        assert row and row['paid_thru'] == this_year, row
+        assert query("SELECT COUNT(*) AS count FROM password_reset_tokens WHERE user_id = %s",
+                     (row['id'],))[0]['count'] == 1
+
+    @check("Renewals: record, replace and paid_thru sync")
+    def _():
+        member_id = member('K9SMK')['id']
+        for amount in ('30', '35'):
+            response = client.post(f'/admin/member/{member_id}/renewals', data={
+                'period_year': str(this_year + 1), 'amount': amount, 'method': 'cash'})
+            assert response.status_code == 302, response.status_code
+        rows = query("SELECT amount FROM renewals WHERE member_id = %s AND period_year = %s",
+                     (member_id, this_year + 1))
+        assert len(rows) == 1 and Decimal(rows[0]['amount']) == Decimal('35'), rows
+        assert member('K9SMK')['paid_thru'] == this_year + 1
+
+    @check("Bulk Paid Thru update")
+    def _():
+        ids = [member('TEST2MEM')['id'], member('K9SMK')['id']]
+        response = client.post('/admin/bulk/update', json={'ids': ids, 'paid_thru': str(this_year + 2)})
+        assert response.status_code == 200, response.get_json()
+        assert member('TEST2MEM')['paid_thru'] == this_year + 2
+
+    @check("Bounces mark an address undeliverable")
+    def _():
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            for _ in range(BOUNCE_HARD_LIMIT):
+                record_bounces(cursor, [Bounce('k9smk@example.org', '5.1.1', 'user unknown')])
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        row = query("SELECT hard_bounces, undeliverable FROM email_bounces WHERE email = %s",
+                    ('k9smk@example.org',))[0]
+        assert row['hard_bounces'] == BOUNCE_HARD_LIMIT and row['undeliverable'] == 1, row
+
+    @check("Change feed API")
+    def _():
+        execute("INSERT INTO feed_consumers (name, token_hash) VALUES (%s, %s)",
+                ('smoke-pull', hash_token('smoke-token')))
+        response = client.get('/api/changes?cursor=0', headers={'Authorization': 'Bearer smoke-token'})
+        assert response.status_code == 200, response.status_code
+        assert any(event['member']['call_sign'] == 'K9SMK' for event in response.get_json()['changes'])
+
+    @check("Webhook delivery, retry back-off and pruning")
+    def _():
+        server = HTTPServer(('127.0.0.1', 0), WebhookReceiver)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            execute("""
+                INSERT INTO feed_consumers (name, token_hash, webhook_url, webhook_secret)
+                VALUES (%s, %s, %s, %s), (%s, %s, %s, %s)
+            """, ('smoke-hook', hash_token('hook-token'), f"http://127.0.0.1:{server.server_port}/", 'secret',
+                  'smoke-down', hash_token('down-token'), 'http://127.0.0.1:9/', 'secret'))
+            with app.app_context():
+                deliver_webhooks(max_seconds=10)
+        finally:
+            server.shutdown()
+        assert WebhookReceiver.batches, "no batch delivered"
+        down = query("SELECT failures, next_attempt_at FROM feed_consumers WHERE name = 'smoke-down'")[0]
+        assert down['failures'] == 1 and down['next_attempt_at'] > datetime.now(), down
+
+    @check("Scheduler pass, run history and Scheduler page")
+    def _():
+        ran = []
+        scheduler = Scheduler()
+        scheduler.job('smoke', 'every 1 minute')(lambda: ran.append(1))
+        scheduler.register()
+        assert scheduler.run_pending() == 1 and ran == [1]
+        assert scheduler.run_pending() == 0
+        runs = query("SELECT status FROM scheduled_runs WHERE job_name = 'smoke'")
+        assert [run['status'] for run in runs] == ['ok'], runs
+        assert client.get('/admin/scheduler').status_code == 200
+
+    @check("Backup dump")
+    def _():
+        assert b'CREATE TABLE' in dump_sqlite() and b'K9SMK' in dump_sqlite()
+
+    @check("Delete member")
+    def _():
+        member_id = member('K9SMK')['id']
+        assert client.post(f'/admin/delete-member/{member_id}').status_code == 302
+        assert member('K9SMK') is None
+        assert not query("SELECT id FROM renewals WHERE member_id = %s", (member_id,))
+
+    @check("Ran without mysqlclient")
+    def _():
+        assert 'MySQLdb' not in sys.modules
+
+    print("=" * 60)
+    print(f"{sum(results)} of {len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+"""
+pytest setup: the portal modules are imported from app/, on an in-memory
+SQLite database (see documentation/LOCAL_DEVELOPMENT.md), so the tests need
+no database server and no mysqlclient.
+"""
+
+import os
+import sys
+
+os.environ.setdefault('DB_BACKEND', 'sqlite')
+os.environ.setdefault('SQLITE_DIR', ':memory:')
+os.environ.setdefault('WARMUP_HOOKS', '')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
@@ -0,0 +1,16 @@
+"""Change feed long-polling (changes.py)"""
+
+import time
+
+from changes import CHANGE_FEED_MAX_WAITERS, WEB_THREADS, FeedWatcher
+
+
+def test_waiters_leave_a_thread_for_page_traffic():
+    assert CHANGE_FEED_MAX_WAITERS < WEB_THREADS
+
+
+def test_no_waiters_is_a_plain_poll():
+    watcher = FeedWatcher(max_waiters=0)
+    start = time.monotonic()
+    assert watcher.wait(after=10 ** 9, timeout=5) is False
+    assert time.monotonic() - start < 1
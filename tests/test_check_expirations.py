@@ -0,0 +1,79 @@
+"""Expiration checker mail (scripts/check_expirations.py)"""
+
+import os
+import smtplib
+import sys
+from argparse import Namespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import check_expirations
+from check_expirations import NotificationMailer, run_check
+from db import get_db_connection, dict_cursor
+from repositories import member_repository
+from tenants import activate, tenants
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP, recording connections and messages"""
+
+    connections = []
+
+    def __init__(self, host, port):
+        self.sent = []
+        self.disconnect_next = False
+        FakeSMTP.connections.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, msg, from_addr=None):
+        if self.disconnect_next:
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        self.sent.append(msg['To'])
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    FakeSMTP.connections = []
+    monkeypatch.setattr(check_expirations.smtplib, 'SMTP', FakeSMTP)
+    monkeypatch.setattr(check_expirations, 'NOTIFY_SEND_RATE', 0)
+    return FakeSMTP.connections
+
+
+def test_run_sends_every_notice_over_one_connection(smtp):
+    conn = get_db_connection()
+    cursor = dict_cursor(conn)
+    repository = member_repository(cursor)
+    for number in range(3):
+        repository.create({'call_sign': f'K9EX{number}', 'password_hash': 'x',
+                           'email': f'k9ex{number}@example.org', 'paid_thru': 2000})
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    with activate(tenants.default):
+        run_check(Namespace(resync=False))
+
+    assert len(smtp) == 1
+    assert {f'k9ex{number}@example.org' for number in range(3)} <= set(smtp[0].sent)
+
+
+def test_dropped_connection_is_reopened(smtp):
+    msg = {'To': 'k9ex@example.org'}
+    with NotificationMailer() as mailer:
+        mailer.send(msg)
+        smtp[0].disconnect_next = True
+        mailer.send(msg)
+    assert len(smtp) == 2 and smtp[1].sent == ['k9ex@example.org']
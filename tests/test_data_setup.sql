@@ -54,6 +54,12 @@ INSERT INTO members (call_sign, password_hash, email, name, paid_thru, member_ty
 VALUES ('TEST7HON', '$2b$12$YOUR_HASH_HERE', 'testhon@test.com',
         'Test Honorary Member', '9999', 'HONORARY', 0);
 
+-- Matching entries in the renewals ledger, which paid_thru is derived from
+INSERT INTO renewals (member_id, period_year, amount, method, reference, paid_on)
+SELECT id, paid_thru, 25.00, 'check', 'Test data', CURDATE()
+FROM members
+WHERE call_sign LIKE 'TEST%' AND paid_thru IS NOT NULL;
+
 -- Verify test accounts created
 SELECT call_sign, name, email, paid_thru, member_type, 
        CASE WHEN is_admin = 1 THEN 'Yes' ELSE 'No' END as admin
@@ -65,4 +71,4 @@ ORDER BY call_sign;
 -- python3 -c "import bcrypt; print(bcrypt.hashpw(b'TestPass123!', bcrypt.gensalt()).decode())"
 
 -- CLEANUP (run this to remove test data after testing):
--- DELETE FROM members WHERE call_sign LIKE 'TEST%';
+-- DELETE FROM members WHERE call_sign LIKE 'TEST%';   -- their renewals are deleted with them
@@ -0,0 +1,51 @@
+"""Cursor wrapping in db.py"""
+
+import re
+
+from db import TracedCursor
+from logs import log_context
+from repositories import TokenRepository
+
+# MySQLdb/cursors.py: executemany() sends one multi-row INSERT only for
+# statements this matches, and otherwise one statement per row
+RE_INSERT_VALUES = re.compile(
+    r"\s*((?:INSERT|REPLACE)\b.+\bVALUES?\s*)"
+    r"(\(\s*(?:%s|%\(.+\)s)\s*(?:,\s*(?:%s|%\(.+\)s)\s*)*\))"
+    r"(\s*(?:ON DUPLICATE.*)?);?\s*\Z",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+class DriverCursor:
+    """Records the statements MySQLdb's executemany() would send"""
+
+    def __init__(self):
+        self.sent = []
+
+    def execute(self, query, args=None):
+        self.sent.append(query)
+
+    def executemany(self, query, args):
+        match = RE_INSERT_VALUES.match(query)
+        if match is None:
+            for row in args:
+                self.execute(query, row)
+            return
+        prefix, values, suffix = match.groups()
+        self.sent.append(prefix + ','.join(values for _ in args) + suffix)
+
+
+def test_create_many_sends_one_multi_row_insert():
+    driver = DriverCursor()
+    with log_context('test-request'):
+        TokenRepository(TracedCursor(driver)).create_many([(1, 'a', None), (2, 'b', None)])
+    assert len(driver.sent) == 1
+    assert driver.sent[0].lstrip().startswith('INSERT INTO password_reset_tokens')
+    assert driver.sent[0].count('(%s, %s, %s)') == 2
+
+
+def test_execute_is_prefixed_with_request_id():
+    driver = DriverCursor()
+    with log_context('test-request'):
+        TracedCursor(driver).execute("SELECT 1")
+    assert driver.sent == ["/* request_id=test-request */ SELECT 1"]
@@ -0,0 +1,58 @@
+"""Expiration policy (expiration_policy.py)"""
+
+from collections import Counter
+from datetime import date, timedelta
+
+from expiration_policy import EXPIRATION_NOTICE_SPREAD, EXPIRATION_WINDOWS, evaluate_member
+
+
+def notice_dates(member, start, end):
+    """Days a daily checker run from start to end notifies the member on"""
+    dates = []
+    status, window = 'active', None
+    day = start
+    while day <= end:
+        evaluation = evaluate_member(member, day)
+        if (evaluation.status, evaluation.window) != (status, window):
+            dates.append((day, evaluation.status, evaluation.window))
+            status, window = evaluation.status, evaluation.window
+        day += timedelta(days=1)
+    return dates
+
+
+def test_reminders_are_spread_across_each_window():
+    members = [{'id': member_id, 'paid_thru': 2026, 'created_at': date(2020, 3, 15)}
+               for member_id in range(1, 1001)]
+    per_day = Counter()
+    for member in members:
+        for day, status, window in notice_dates(member, date(2026, 1, 1), date(2027, 1, 1)):
+            if status == 'expiring':
+                per_day[day] += 1
+
+    assert sum(per_day.values()) == len(members) * len(EXPIRATION_WINDOWS)
+    assert len(per_day) == len(EXPIRATION_WINDOWS) * EXPIRATION_NOTICE_SPREAD
+    assert max(per_day.values()) <= 2 * len(members) / EXPIRATION_NOTICE_SPREAD
+    assert min(per_day) == date(2026, 12, 31) - timedelta(days=max(EXPIRATION_WINDOWS) + EXPIRATION_NOTICE_SPREAD - 1)
+
+
+def test_spreading_keeps_the_dues_year():
+    for member_id in range(1, EXPIRATION_NOTICE_SPREAD + 1):
+        member = {'id': member_id, 'paid_thru': 2026, 'created_at': date(2020, 3, 15)}
+        assert evaluate_member(member, date(2026, 12, 31)).status == 'expiring'
+        assert evaluate_member(member, date(2026, 12, 31)).window == min(EXPIRATION_WINDOWS)
+        expired = evaluate_member(member, date(2027, 1, 1))
+        assert expired.status == 'expired' and expired.term_end == date(2026, 12, 31)
+
+
+def test_next_transition_is_the_next_change():
+    member = {'id': 12, 'paid_thru': 2026, 'created_at': None}
+    day = date(2026, 6, 1)
+    while True:
+        evaluation = evaluate_member(member, day)
+        if evaluation.next_transition is None:
+            break
+        before = evaluate_member(member, evaluation.next_transition - timedelta(days=1))
+        after = evaluate_member(member, evaluation.next_transition)
+        assert (before.status, before.window) == (evaluation.status, evaluation.window)
+        assert (after.status, after.window) != (evaluation.status, evaluation.window)
+        day = evaluation.next_transition
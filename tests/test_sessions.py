@@ -0,0 +1,73 @@
+"""Server-side sessions (sessions.py)"""
+
+import time
+
+import pytest
+from flask import Flask, session
+
+import sessions
+from db import mark_session_sticky
+from sessions import DatabaseSessionStore, SessionEntry
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    """Count the connections the session stores open"""
+    opened = []
+
+    def counting_connection(*args, **kwargs):
+        opened.append(1)
+        return get_db_connection(*args, **kwargs)
+
+    get_db_connection = sessions.get_db_connection
+    monkeypatch.setattr(sessions, 'get_db_connection', counting_connection)
+    return opened
+
+
+def entry(member_id, version, **data):
+    return SessionEntry(member_id, dict(data, _user_id=str(member_id)), time.time() + 3600, version)
+
+
+def test_cached_session_needs_no_query(queries):
+    worker = DatabaseSessionStore(revocation_check=60)
+    worker.save('sid-cached', entry(1, 1))
+    assert worker.get('sid-cached', 1).member_id == 1
+    del queries[:]
+    for _ in range(10):
+        assert worker.get('sid-cached', 1).version == 1
+    assert queries == []
+
+
+def test_newer_version_from_another_worker_is_read(queries):
+    first, second = DatabaseSessionStore(revocation_check=60), DatabaseSessionStore(revocation_check=60)
+    first.save('sid-flash', entry(2, 1))
+    assert second.get('sid-flash', 1).data.get('_flashes') is None
+    first.save('sid-flash', entry(2, 2, _flashes=[('message', 'Saved')]))
+    assert second.get('sid-flash', 2).data['_flashes'] == [('message', 'Saved')]
+
+
+def test_revocation_reaches_other_workers():
+    first, second = DatabaseSessionStore(revocation_check=0), DatabaseSessionStore(revocation_check=0)
+    first.save('sid-revoked', entry(3, 1))
+    assert second.get('sid-revoked', 1) is not None
+    first.revoke_member(3)
+    assert second.get('sid-revoked', 1) is None
+
+
+def test_logout_reaches_other_workers():
+    first, second = DatabaseSessionStore(revocation_check=0), DatabaseSessionStore(revocation_check=0)
+    first.save('sid-logout', entry(4, 1))
+    assert second.get('sid-logout', 1) is not None
+    first.delete('sid-logout')
+    assert second.get('sid-logout', 1) is None
+
+
+def test_only_logged_in_sessions_are_made_sticky():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    with app.test_request_context():
+        mark_session_sticky()
+        assert 'db_sticky_until' not in session
+        session['_user_id'] = '5'
+        mark_session_sticky()
+        assert session['db_sticky_until'] > time.time()